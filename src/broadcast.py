@@ -0,0 +1,154 @@
+import os
+import time
+import asyncio
+import logging
+from datetime import date, datetime, timedelta
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Tuple
+
+import pytz
+from telegram.error import Forbidden, RetryAfter
+
+from rate_limit import KeyedRateLimiter, TokenBucket
+
+logger = logging.getLogger(__name__)
+
+# Telegram limits: ~30 messages per second overall, 1 per second per chat
+TELEGRAM_GLOBAL_RATE = float(os.getenv("TELEGRAM_GLOBAL_RATE", "30"))
+TELEGRAM_CHAT_INTERVAL = 1.0  # seconds
+
+BROADCAST_CONCURRENCY = int(os.getenv("BROADCAST_CONCURRENCY", "8"))
+MAX_SEND_RETRIES = 3
+
+TIMEZONE = pytz.timezone("Europe/Warsaw")
+
+MessageFactory = Callable[[int, str], Awaitable[Optional[str]]]
+BatchFactory = Callable[[List[Tuple[int, str]]], Awaitable[Dict[int, str]]]
+
+
+class Broadcaster:
+    """Send a personalized message to many users with bounded concurrency.
+
+    Deliveries are recorded per run (e.g. "daily_tip:2025-01-25"), so running
+    the same broadcast again after a crash only sends to the users that were
+    not reached yet.
+    """
+
+    def __init__(self, storage, concurrency: int = BROADCAST_CONCURRENCY):
+        self.storage = storage
+        self.concurrency = concurrency
+        self.global_limiter = TokenBucket(TELEGRAM_GLOBAL_RATE, TELEGRAM_GLOBAL_RATE)
+        self.chat_limiter = KeyedRateLimiter(TELEGRAM_CHAT_INTERVAL)
+
+    async def _send(self, bot, user_id: int, text: str) -> None:
+        for attempt in range(MAX_SEND_RETRIES):
+            await self.global_limiter.acquire()
+            await self.chat_limiter.acquire(user_id)
+            try:
+                await bot.send_message(chat_id=user_id, text=text)
+                return
+            except RetryAfter as e:
+                if attempt == MAX_SEND_RETRIES - 1:
+                    raise
+                delay = e.retry_after
+                if isinstance(delay, timedelta):
+                    delay = delay.total_seconds()
+                logger.warning(f"Flood control for {user_id}, retrying in {delay}s")
+                await asyncio.sleep(delay)
+
+    async def run(
+        self,
+        name: str,
+        bot,
+        recipients: Iterable[Tuple[int, str]],
+        make_message: MessageFactory = None,
+        make_batch: BatchFactory = None,
+        batch_size: int = 20,
+        day: Optional[date] = None,
+    ) -> Dict[str, Any]:
+        """
+        Broadcast a message to all recipients.
+
+        Messages come either from make_message (one call per user) or from
+        make_batch (one call per batch_size users); in the batched mode a
+        batch is sent while the next one is being generated.
+
+        Args:
+            name (str): Broadcast name, combined with today's date into the run id
+            bot: Telegram bot used to send messages
+            recipients: (user_id, user_name) pairs
+            make_message: Coroutine returning the text for a user, or None to skip
+            make_batch: Coroutine returning {user_id: text} for a list of recipients
+            batch_size (int): Recipients per make_batch call
+            day (date): Day the run belongs to, defaults to today
+
+        Returns:
+            dict: Run report with delivered/skipped/failed counts and timing
+        """
+        day = day or datetime.now(TIMEZONE).date()
+        run_id = f"{name}:{day.isoformat()}"
+        start = time.monotonic()
+
+        delivered_before = await asyncio.to_thread(
+            self.storage.get_delivered_users, run_id
+        )
+        pending = [
+            (uid, uname) for uid, uname in recipients if uid not in delivered_before
+        ]
+        counts = {"delivered": 0, "skipped": 0, "failed": 0}
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def deliver(
+            user_id: int, user_name: str, text: Optional[str] = None
+        ) -> None:
+            async with semaphore:
+                try:
+                    if make_message:
+                        text = await make_message(user_id, user_name)
+                    if not text:
+                        counts["skipped"] += 1
+                        return
+                    await self._send(bot, user_id, text)
+                    await asyncio.to_thread(
+                        self.storage.mark_delivered, run_id, user_id
+                    )
+                    counts["delivered"] += 1
+                except Forbidden:
+                    # User blocked the bot
+                    counts["skipped"] += 1
+                except Exception as e:
+                    logger.error(f"Error sending {name} to user {user_id}: {e}")
+                    counts["failed"] += 1
+
+        if make_batch:
+            deliveries = []
+            for i in range(0, len(pending), batch_size):
+                batch = pending[i : i + batch_size]
+                try:
+                    texts = await make_batch(batch)
+                except Exception as e:
+                    logger.error(f"Error generating {name} batch: {e}")
+                    texts = {}
+                deliveries += [
+                    asyncio.create_task(deliver(uid, uname, texts.get(uid)))
+                    for uid, uname in batch
+                ]
+            await asyncio.gather(*deliveries)
+        else:
+            await asyncio.gather(*(deliver(uid, uname) for uid, uname in pending))
+
+        duration = time.monotonic() - start
+        report = {
+            "run_id": run_id,
+            "recipients": len(pending) + len(delivered_before),
+            "already_delivered": len(delivered_before),
+            **counts,
+            "duration": duration,
+            "delivered_per_second": counts["delivered"] / duration if duration else 0,
+        }
+        logger.info(
+            f"Broadcast {run_id}: delivered {counts['delivered']}, "
+            f"skipped {counts['skipped']}, failed {counts['failed']}, "
+            f"resumed past {len(delivered_before)} in {duration:.1f}s "
+            f"({report['delivered_per_second']:.2f} msg/s)"
+        )
+        return report
@@ -0,0 +1,94 @@
+import os
+import logging
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Users whose chat sessions are kept in memory
+CHAT_SESSIONS_MAX = int(os.getenv("CHAT_SESSIONS_MAX", "500"))
+
+# Contents a session may grow to before it is rebuilt from stored history
+MAX_SESSION_CONTENTS = 48
+
+Content = Dict[str, Any]
+
+
+class ChatSession:
+    """Native multi-turn contents of one user's chat with the model.
+
+    The first two contents carry the user's context (name, goal status,
+    conversation summary); each turn then only appends the new message and
+    the reply, so the request prefix stays identical from turn to turn.
+    """
+
+    __slots__ = ("user_id", "context", "contents")
+
+    def __init__(self, user_id: int, context: str, contents: List[Content]):
+        self.user_id = user_id
+        self.context = context
+        self.contents = contents
+
+    def add(self, role: str, text: str) -> None:
+        """Append a turn, merging it into the last one if the role repeats
+        (a superseded message never got a reply)."""
+        if self.contents and self.contents[-1]["role"] == role:
+            last = self.contents[-1]
+            self.contents[-1] = {"role": role, "parts": last["parts"] + [text]}
+        else:
+            self.contents.append({"role": role, "parts": [text]})
+
+
+class ChatSessions:
+    """LRU-bounded per-user chat sessions.
+
+    A session is only reused while its context is unchanged; a new goal or
+    a folded conversation summary starts a fresh session from history.
+    """
+
+    def __init__(
+        self,
+        max_sessions: int = CHAT_SESSIONS_MAX,
+        on_evict: Optional[Callable[[ChatSession], None]] = None,
+    ):
+        self.max_sessions = max_sessions
+        self.on_evict = on_evict
+        self._sessions: "OrderedDict[int, ChatSession]" = OrderedDict()
+
+    def get(self, user_id: int, context: str) -> Optional[ChatSession]:
+        """Get the user's session if it is still valid for the given context."""
+        session = self._sessions.get(user_id)
+        if session is None:
+            return None
+        if session.context != context or len(session.contents) >= MAX_SESSION_CONTENTS:
+            del self._sessions[user_id]
+            return None
+        self._sessions.move_to_end(user_id)
+        return session
+
+    def start(self, user_id: int, context: str, contents: List[Content]) -> ChatSession:
+        """Start (or replace) the user's session."""
+        session = ChatSession(user_id, context, contents)
+        self._sessions[user_id] = session
+        self._sessions.move_to_end(user_id)
+
+        while len(self._sessions) > self.max_sessions:
+            _, evicted = self._sessions.popitem(last=False)
+            if self.on_evict:
+                try:
+                    self.on_evict(evicted)
+                except Exception as e:
+                    logger.error(f"Error persisting evicted chat session: {e}")
+        return session
+
+    def append(self, user_id: int, role: str, text: str) -> None:
+        """Record a turn answered outside the LLM in the user's session."""
+        session = self._sessions.get(user_id)
+        if session is not None:
+            session.add(role, text)
+
+    def drop(self, user_id: int) -> None:
+        self._sessions.pop(user_id, None)
+
+    def __len__(self) -> int:
+        return len(self._sessions)
@@ -0,0 +1,235 @@
+import os
+import time
+import random
+import asyncio
+import logging
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+# Pool policy
+POOL_TARGET_PER_BUCKET = int(os.getenv("POOL_TARGET_PER_BUCKET", "10"))
+POOL_MAX_AGE_DAYS = int(os.getenv("POOL_MAX_AGE_DAYS", "14"))
+POOL_MAX_USES = int(os.getenv("POOL_MAX_USES", "20"))
+POOL_BATCH_SIZE = int(os.getenv("POOL_BATCH_SIZE", "5"))  # entries per LLM request
+
+TIP = "tip"
+MOTIVATION = "motivation"
+
+# Goal progress buckets for motivation templates
+MOTIVATION_BUCKETS = {
+    "no_goal": "The user has no active weekly gym goal yet.",
+    "goal_not_started": "The user has a weekly goal of {target} gym visits "
+    "but has not been to the gym yet this week.",
+    "goal_in_progress": "The user has completed {current} of {target} "
+    "gym visits this week.",
+    "goal_almost_done": "The user needs just one more gym visit to reach "
+    "their weekly goal ({current}/{target}).",
+    "goal_done": "The user already reached their weekly goal of {target} visits.",
+}
+
+
+def motivation_bucket(goal: Optional[Dict[str, Any]]) -> str:
+    """Get the goal-progress bucket for a user's active goal."""
+    if not goal:
+        return "no_goal"
+    current, target = goal["current_visits"], goal["target_visits"]
+    if current >= target:
+        return "goal_done"
+    if current == 0:
+        return "goal_not_started"
+    if target - current == 1:
+        return "goal_almost_done"
+    return "goal_in_progress"
+
+
+def render(template: str, **values) -> Optional[str]:
+    """Fill a template's placeholders, or None if the template is malformed."""
+    try:
+        return template.format(**values)
+    except (KeyError, IndexError, ValueError):
+        return None
+
+
+class PoolEntry:
+    """A pre-generated tip or motivation template."""
+
+    __slots__ = ("id", "kind", "bucket", "text", "created_at", "seen_by")
+
+    def __init__(self, id: int, kind: str, bucket: str, text: str, created_at: float):
+        self.id = id
+        self.kind = kind
+        self.bucket = bucket
+        self.text = text
+        self.created_at = created_at
+        self.seen_by: Set[int] = set()
+
+    def is_fresh(self, now: float) -> bool:
+        return (
+            now - self.created_at < POOL_MAX_AGE_DAYS * 86400
+            and len(self.seen_by) < POOL_MAX_USES
+        )
+
+
+class ContentPool:
+    """Stock of pre-generated tips and motivation templates.
+
+    Entries are generated in the background while the LLM is idle and handed
+    out from memory at broadcast time. An entry is used at most
+    POOL_MAX_USES times, never twice for the same user, and is dropped after
+    POOL_MAX_AGE_DAYS.
+    """
+
+    def __init__(self, storage, llm):
+        self.storage = storage
+        self.llm = llm
+        self._entries: Optional[Dict[int, PoolEntry]] = None
+        self._pending_deliveries: List[Dict[str, int]] = []
+
+    def _load(self) -> Dict[int, PoolEntry]:
+        if self._entries is None:
+            entries = {}
+            for row in self.storage.get_pool_entries():
+                created_at = datetime.fromisoformat(row["created_at"]).timestamp()
+                entries[row["id"]] = PoolEntry(
+                    row["id"], row["kind"], row["bucket"], row["text"], created_at
+                )
+            for row in self.storage.get_pool_deliveries():
+                entry = entries.get(row["entry_id"])
+                if entry:
+                    entry.seen_by.add(row["user_id"])
+            self._entries = entries
+            logger.info(f"Loaded {len(entries)} content pool entries")
+        return self._entries
+
+    def _buckets(self, kind: str) -> List[str]:
+        return list(self.llm.GYM_TOPICS) if kind == TIP else list(MOTIVATION_BUCKETS)
+
+    def stock(self, kind: str, bucket: str) -> int:
+        """Number of fresh entries in a bucket."""
+        now = time.time()
+        return sum(
+            1
+            for entry in self._load().values()
+            if entry.kind == kind and entry.bucket == bucket and entry.is_fresh(now)
+        )
+
+    def _take(self, kind: str, buckets: List[str], user_id: int) -> Optional[PoolEntry]:
+        now = time.time()
+        candidates = [
+            entry
+            for entry in self._load().values()
+            if entry.kind == kind
+            and entry.bucket in buckets
+            and entry.is_fresh(now)
+            and user_id not in entry.seen_by
+        ]
+        if not candidates:
+            return None
+
+        # Prefer the least used entries to spread reuse evenly
+        least_used = min(len(entry.seen_by) for entry in candidates)
+        entry = random.choice(
+            [entry for entry in candidates if len(entry.seen_by) == least_used]
+        )
+        entry.seen_by.add(user_id)
+        self._pending_deliveries.append({"entry_id": entry.id, "user_id": user_id})
+        return entry
+
+    def take_tip(self, user_id: int, user_name: str) -> Optional[str]:
+        """Get an unseen tip on any topic for the user, or None if the pool is dry."""
+        entry = self._take(TIP, self._buckets(TIP), user_id)
+        return render(entry.text, name=user_name) if entry else None
+
+    def take_motivation(
+        self, user_id: int, user_name: str, goal: Optional[Dict[str, Any]]
+    ) -> Optional[str]:
+        """Get an unseen motivation for the user's goal progress, or None."""
+        entry = self._take(MOTIVATION, [motivation_bucket(goal)], user_id)
+        if not entry:
+            return None
+        return render(
+            entry.text,
+            name=user_name,
+            current=goal["current_visits"] if goal else 0,
+            target=goal["target_visits"] if goal else 0,
+        )
+
+    async def flush(self) -> None:
+        """Persist which users received which entries."""
+        batch, self._pending_deliveries = self._pending_deliveries, []
+        if batch:
+            try:
+                await asyncio.to_thread(self.storage.insert_pool_deliveries, batch)
+            except Exception as e:
+                logger.error(f"Error saving content pool deliveries: {e}")
+
+    def prune(self) -> int:
+        """Delete stale or used-up entries, returning how many were removed."""
+        now = time.time()
+        entries = self._load()
+        stale = [
+            entry_id for entry_id, entry in entries.items() if not entry.is_fresh(now)
+        ]
+        if stale:
+            self.storage.delete_rows("content_pool", stale)
+            for entry_id in stale:
+                del entries[entry_id]
+        return len(stale)
+
+    def _emptiest_bucket(self):
+        """Find the (kind, bucket) with the smallest stock below target."""
+        levels = [
+            (self.stock(kind, bucket), kind, bucket)
+            for kind in (MOTIVATION, TIP)
+            for bucket in self._buckets(kind)
+        ]
+        stock, kind, bucket = min(levels)
+        if stock >= POOL_TARGET_PER_BUCKET:
+            return None
+        return kind, bucket
+
+    async def fill_once(self) -> int:
+        """
+        Generate one batch of entries for the emptiest bucket.
+
+        Returns:
+            int: Number of entries added (0 if the pool is full)
+        """
+        await asyncio.to_thread(self.prune)
+        target = self._emptiest_bucket()
+        if target is None:
+            return 0
+
+        kind, bucket = target
+        description = bucket if kind == TIP else MOTIVATION_BUCKETS[bucket]
+        texts = await self.llm.generate_pool_entries(kind, description, POOL_BATCH_SIZE)
+
+        # Keep only templates whose placeholders render (tips only get {name})
+        values = (
+            {"name": "bro"}
+            if kind == TIP
+            else {"name": "bro", "current": 1, "target": 3}
+        )
+        now = datetime.now(timezone.utc).isoformat()
+        rows = [
+            {"kind": kind, "bucket": bucket, "text": text, "created_at": now}
+            for text in texts
+            if render(text, **values)
+        ]
+        if not rows:
+            return 0
+
+        inserted = await asyncio.to_thread(self.storage.insert_pool_entries, rows)
+        entries = self._load()
+        for row in inserted:
+            entries[row["id"]] = PoolEntry(
+                row["id"],
+                row["kind"],
+                row["bucket"],
+                row["text"],
+                datetime.fromisoformat(row["created_at"]).timestamp(),
+            )
+        logger.info(f"Added {len(inserted)} {kind} entries to pool bucket '{bucket}'")
+        return len(inserted)
@@ -0,0 +1,311 @@
+import os
+import asyncio
+import logging
+import time
+from collections import OrderedDict, deque
+from datetime import datetime, timezone
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional, Tuple
+
+from tracing import traced
+
+logger = logging.getLogger(__name__)
+
+# Pruning rules (same limits as Database.get_message_history)
+MAX_MESSAGES = 20
+MAX_AGE_HOURS = 72
+MAX_CHARS = 8000
+
+# Number of users kept in memory before the least recently active is dropped
+MAX_USERS = 1000
+
+# Pending writes that trigger an immediate background flush
+FLUSH_BATCH_SIZE = 50
+# Pending writes kept while the database is unavailable; older ones are dropped
+MAX_PENDING = 5000
+
+# Turns sent verbatim with every prompt; older turns are folded into a
+# running summary once SUMMARY_BATCH of them have aged out of the window
+CONVERSATION_WINDOW = int(os.getenv("CONVERSATION_WINDOW", "6"))
+SUMMARY_BATCH = int(os.getenv("SUMMARY_BATCH", "4"))
+
+# Coroutine folding turns into a summary: (old summary, turns) -> new summary
+Summarizer = Callable[[Optional[str], List[Dict[str, Any]]], Awaitable[Optional[str]]]
+
+
+def _key(row: Dict[str, Any]) -> tuple:
+    """Identity of a stored or pending message."""
+    created_at = datetime.fromisoformat(row["created_at"]).timestamp()
+    return row["role"], row["content"], round(created_at, 3)
+
+
+class Turn:
+    """A single message kept in the in-memory conversation buffer."""
+
+    __slots__ = ("role", "content", "created_at")
+
+    def __init__(self, role: str, content: str, created_at: float):
+        self.role = role
+        self.content = content
+        self.created_at = created_at  # unix timestamp
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "role": self.role,
+            "content": self.content,
+            "created_at": datetime.fromtimestamp(
+                self.created_at, timezone.utc
+            ).isoformat(),
+        }
+
+
+class Summary:
+    """Running summary of a user's turns older than the verbatim window."""
+
+    __slots__ = ("text", "until")
+
+    def __init__(self, text: str, until: float):
+        self.text = text
+        self.until = until  # created_at of the newest folded turn
+
+
+class ConversationBuffer:
+    """Per-user ring buffer of recent turns with write-behind persistence.
+
+    Recent history is served from memory and only loaded from the database
+    the first time a user is seen; `load()` does that in a thread and is
+    awaited before the other methods. New messages are queued and written
+    to the `messages` table in batches by `flush()`.
+
+    With a summarizer, only the last `window` turns are kept verbatim: turns
+    that age out are folded into a per-user running summary in the
+    background and stored in `conversation_summaries`. Until that happens
+    they stay in the history, so no context is lost while the LLM is busy.
+    """
+
+    def __init__(
+        self,
+        db,
+        max_messages: int = MAX_MESSAGES,
+        max_age_hours: int = MAX_AGE_HOURS,
+        max_chars: int = MAX_CHARS,
+        max_users: int = MAX_USERS,
+        summarizer: Optional[Summarizer] = None,
+        window: int = CONVERSATION_WINDOW,
+    ):
+        self.db = db
+        self.max_messages = max_messages
+        self.max_age = max_age_hours * 3600
+        self.max_chars = max_chars
+        self.max_users = max_users
+        self.summarizer = summarizer
+        self.window = window
+
+        self._turns: "OrderedDict[int, Deque[Turn]]" = OrderedDict()
+        self._chars: Dict[int, int] = {}
+        self._summaries: Dict[int, Summary] = {}
+        self._summarizing: Dict[int, asyncio.Task] = {}
+        self._loading: Dict[int, asyncio.Future] = {}
+        self._pending: List[Dict[str, Any]] = []
+        self._writing: List[Dict[str, Any]] = []  # batch being flushed
+        self._flush_lock = asyncio.Lock()
+        self._flush_task = None
+
+    async def load(self, user_id: int) -> None:
+        """Hydrate the user's buffer from the database without blocking the
+        event loop. Concurrent calls for the same user share one read."""
+        if user_id in self._turns:
+            self._turns.move_to_end(user_id)
+            return
+        loading = self._loading.get(user_id)
+        if loading is None:
+            loading = asyncio.ensure_future(self._hydrate(user_id))
+            self._loading[user_id] = loading
+            loading.add_done_callback(lambda _: self._loading.pop(user_id, None))
+        # A cancelled handler doesn't cancel the read other handlers wait for
+        await asyncio.shield(loading)
+
+    async def _hydrate(self, user_id: int) -> None:
+        # Writes that may finish while the database is read
+        unsaved = self._unsaved(user_id)
+        summary, rows = await asyncio.to_thread(self._fetch, user_id)
+        if user_id not in self._turns:  # unless hydrated by _load meanwhile
+            self._build(user_id, summary, rows, unsaved + self._unsaved(user_id))
+
+    def _load(self, user_id: int) -> Deque[Turn]:
+        """Return the user's buffer, hydrating it from the database on a miss."""
+        turns = self._turns.get(user_id)
+        if turns is not None:
+            self._turns.move_to_end(user_id)
+            return turns
+        return self._build(user_id, *self._fetch(user_id), self._unsaved(user_id))
+
+    def _unsaved(self, user_id: int) -> List[Dict[str, Any]]:
+        """Writes that have not reached the database yet. The batch being
+        flushed may or may not have been committed when it is read."""
+        return [
+            row for row in self._writing + self._pending if row["user_id"] == user_id
+        ]
+
+    def _fetch(
+        self, user_id: int
+    ) -> Tuple[Optional[Dict[str, Any]], List[Dict[str, Any]]]:
+        """Read the user's summary and the stored turns not folded into it."""
+        row = self.db.get_conversation_summary(user_id) if self.summarizer else None
+        rows = self.db.get_message_history(
+            user_id,
+            max_messages=self.max_messages,
+            max_age_hours=self.max_age // 3600,
+            since=datetime.fromisoformat(row["summarized_until"]) if row else None,
+        )
+        return row, rows
+
+    def _build(
+        self,
+        user_id: int,
+        summary: Optional[Dict[str, Any]],
+        rows: List[Dict[str, Any]],
+        unsaved: List[Dict[str, Any]],
+    ) -> Deque[Turn]:
+        turns = deque()
+        self._turns[user_id] = turns
+        self._chars[user_id] = 0
+
+        since = None
+        if summary:
+            since = datetime.fromisoformat(summary["summarized_until"]).timestamp()
+            self._summaries[user_id] = Summary(summary["summary"], since)
+
+        # Stored rows first, then unsaved writes not among them
+        merged = {_key(row): row for row in rows}
+        for row in unsaved:
+            merged.setdefault(_key(row), row)
+        for row in merged.values():
+            created_at = datetime.fromisoformat(row["created_at"]).timestamp()
+            if since is None or created_at > since:
+                self._append(user_id, Turn(row["role"], row["content"], created_at))
+
+        if len(self._turns) > self.max_users:
+            evicted, _ = self._turns.popitem(last=False)
+            del self._chars[evicted]
+            self._summaries.pop(evicted, None)
+
+        return turns
+
+    def _append(self, user_id: int, turn: Turn) -> None:
+        self._turns[user_id].append(turn)
+        self._chars[user_id] += len(turn.content)
+        self._prune(user_id)
+
+    def _prune(self, user_id: int) -> None:
+        """Drop the oldest turns until count, age and character limits hold."""
+        turns = self._turns[user_id]
+        cutoff = time.time() - self.max_age
+        while turns and (
+            len(turns) > self.max_messages
+            or self._chars[user_id] > self.max_chars
+            or turns[0].created_at < cutoff
+        ):
+            self._chars[user_id] -= len(turns.popleft().content)
+
+    def add_message(self, user_id: int, content: str, role: str = "user") -> None:
+        """Add a message to the buffer and queue it for persistence."""
+        self._load(user_id)
+        turn = Turn(role, content, time.time())
+        self._append(user_id, turn)
+
+        self._pending.append({"user_id": user_id, **turn.as_dict()})
+        if len(self._pending) >= FLUSH_BATCH_SIZE and self._flush_task is None:
+            self._flush_task = asyncio.get_running_loop().create_task(self.flush())
+
+        if (
+            self.summarizer
+            and len(self._turns[user_id]) - self.window >= SUMMARY_BATCH
+            and user_id not in self._summarizing
+        ):
+            self._summarizing[user_id] = asyncio.get_running_loop().create_task(
+                self._summarize(user_id)
+            )
+
+    async def _summarize(self, user_id: int) -> None:
+        """Fold the turns older than the verbatim window into the summary."""
+        try:
+            turns = self._turns.get(user_id)
+            if not turns:
+                return
+            aged = list(turns)[: len(turns) - self.window]
+            if not aged:
+                return
+
+            previous = self._summaries.get(user_id)
+            text = await self.summarizer(
+                previous.text if previous else None,
+                [{"role": turn.role, "content": turn.content} for turn in aged],
+            )
+            if not text:
+                # Keep the turns verbatim and try again after the next message
+                return
+
+            summary = Summary(text, aged[-1].created_at)
+            await asyncio.to_thread(
+                self.db.save_conversation_summary,
+                user_id,
+                text,
+                datetime.fromtimestamp(summary.until, timezone.utc),
+            )
+
+            # The user may have been evicted or pruned in the meantime
+            turns = self._turns.get(user_id)
+            if turns is None:
+                return
+            self._summaries[user_id] = summary
+            folded = {id(turn) for turn in aged}
+            while turns and id(turns[0]) in folded:
+                self._chars[user_id] -= len(turns.popleft().content)
+        except Exception as e:
+            logger.error(f"Error summarizing conversation for user {user_id}: {e}")
+        finally:
+            self._summarizing.pop(user_id, None)
+
+    @traced()
+    def get_history(self, user_id: int) -> List[Dict[str, Any]]:
+        """Get the user's messages not covered by the summary, in chronological order."""
+        self._load(user_id)
+        self._prune(user_id)
+        return [
+            {"role": turn.role, "content": turn.content}
+            for turn in self._turns[user_id]
+        ]
+
+    def get_summary(self, user_id: int) -> Optional[str]:
+        """Get the running summary of the user's older turns, if any."""
+        self._load(user_id)
+        summary = self._summaries.get(user_id)
+        return summary.text if summary else None
+
+    async def flush(self) -> int:
+        """Write pending messages to the database, returning how many were saved."""
+        try:
+            async with self._flush_lock:
+                batch, self._pending = self._pending, []
+                if not batch:
+                    return 0
+                # Still visible to _load until it is known to be stored
+                self._writing = batch
+                try:
+                    saved = await asyncio.to_thread(self.db.add_messages, batch)
+                finally:
+                    self._writing = []
+                if not saved:
+                    # Keep the batch for the next flush, within MAX_PENDING
+                    self._pending = batch + self._pending
+                    dropped = len(self._pending) - MAX_PENDING
+                    if dropped > 0:
+                        del self._pending[:dropped]
+                        logger.error(
+                            f"Dropped {dropped} unsaved messages, "
+                            f"{MAX_PENDING} are kept for the next flush"
+                        )
+                    return 0
+                return len(batch)
+        finally:
+            self._flush_task = None
@@ -1,38 +1,32 @@
-from supabase import create_client
-import os
 from datetime import datetime, timedelta
 import pytz
 import logging
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional, Tuple
+from retention import purge_messages
+from storage import Storage, get_storage
+from tracing import traced
+from user_registry import UserRegistry
 
 logger = logging.getLogger(__name__)
 
 
 class Database:
-    def __init__(self):
-        """Initialize Supabase client."""
-        url = os.getenv("SUPABASE_URL")
-        key = os.getenv("SUPABASE_KEY")
-        if not url or not key:
-            raise ValueError("Missing Supabase credentials")
-        self.client = create_client(url, key)
+    def __init__(self, storage: Storage = None):
+        """Initialize the database with the configured storage backend."""
+        self.storage = storage or get_storage()
+        self.users = UserRegistry(self.storage)
         self.timezone = pytz.timezone("Europe/Warsaw")
 
+    @traced()
     def is_user_banned(self, user_id: int) -> bool:
         """Check if a user is currently banned."""
         try:
-            response = (
-                self.client.table("bans")
-                .select("*")
-                .eq("user_id", user_id)
-                .lt("unban_date", datetime.now(self.timezone).isoformat())
-                .execute()
-            )
-            return len(response.data) > 0
+            return self.users.is_banned(user_id)
         except Exception as e:
             logger.error(f"Error checking ban status: {e}")
             return False
 
+    @traced()
     def create_goal(self, user_id: int, user_name: str, target_visits: int) -> bool:
         """Create a new goal for the user."""
         try:
@@ -59,27 +53,34 @@ class Database:
                 "status": "active",
             }
 
-            self.client.table("goals").insert(data).execute()
+            self.storage.insert_goal(data)
             return True
         except Exception as e:
             logger.error(f"Error creating goal: {e}")
             return False
 
+    @traced()
     def get_active_goal(self, user_id: int):
         """Get user's active goal if exists."""
         try:
-            response = (
-                self.client.table("goals")
-                .select("*")
-                .eq("user_id", user_id)
-                .eq("status", "active")
-                .execute()
-            )
-            return response.data[0] if response.data else None
+            return self.storage.get_active_goal(user_id)
         except Exception as e:
             logger.error(f"Error getting active goal: {e}")
             return None
 
+    @traced()
+    def get_active_goals(self, user_ids: List[int]) -> Dict[int, Dict[str, Any]]:
+        """Get active goals of many users in one query, keyed by user_id."""
+        try:
+            return {
+                goal["user_id"]: goal
+                for goal in self.storage.get_active_goals(user_ids)
+            }
+        except Exception as e:
+            logger.error(f"Error getting active goals: {e}")
+            return {}
+
+    @traced()
     def increment_visits(self, user_id: int) -> bool:
         """Increment visit count for user's active goal."""
         try:
@@ -87,14 +88,15 @@ class Database:
             if not goal:
                 return False
 
-            self.client.table("goals").update(
-                {"current_visits": goal["current_visits"] + 1}
-            ).eq("id", goal["id"]).execute()
+            self.storage.update_goal(
+                goal["id"], {"current_visits": goal["current_visits"] + 1}
+            )
             return True
         except Exception as e:
             logger.error(f"Error incrementing visits: {e}")
             return False
 
+    @traced()
     def ban_user(self, user_id: int, user_name: str, goal_id: int) -> bool:
         """Ban a user for failing their goal."""
         try:
@@ -102,9 +104,7 @@ class Database:
             unban_date = now + timedelta(days=30)
 
             # Update goal status
-            self.client.table("goals").update({"status": "failed"}).eq(
-                "id", goal_id
-            ).execute()
+            self.storage.update_goal(goal_id, {"status": "failed"})
 
             # Create ban record
             ban_data = {
@@ -114,62 +114,88 @@ class Database:
                 "ban_date": now.isoformat(),
                 "unban_date": unban_date.isoformat(),
             }
-            self.client.table("bans").insert(ban_data).execute()
+            self.storage.insert_ban(ban_data)
+            self.users.set_ban(user_id, user_name, unban_date)
             return True
         except Exception as e:
             logger.error(f"Error banning user: {e}")
             return False
 
+    @traced()
     def check_goals(self) -> list:
         """Check all active goals that have ended and return failed ones."""
         try:
             now = datetime.now(self.timezone)
-            response = (
-                self.client.table("goals")
-                .select("*")
-                .eq("status", "active")
-                .lt("end_date", now.isoformat())
-                .execute()
-            )
-
             failed_goals = []
-            for goal in response.data:
+            for goal in self.storage.get_expired_goals(now):
                 if goal["current_visits"] < goal["target_visits"]:
                     failed_goals.append(goal)
                     # Update goal status
-                    self.client.table("goals").update({"status": "failed"}).eq(
-                        "id", goal["id"]
-                    ).execute()
+                    self.storage.update_goal(goal["id"], {"status": "failed"})
                 else:
                     # Mark as completed
-                    self.client.table("goals").update({"status": "completed"}).eq(
-                        "id", goal["id"]
-                    ).execute()
+                    self.storage.update_goal(goal["id"], {"status": "completed"})
 
             return failed_goals
         except Exception as e:
             logger.error(f"Error checking goals: {e}")
             return []
 
+    def register_user(self, user_id: int, user_name: str) -> None:
+        """Register a user on first contact and update their last activity."""
+        try:
+            self.users.touch(user_id, user_name)
+        except Exception as e:
+            logger.error(f"Error registering user: {e}")
+
+    def set_notifications(self, user_id: int, user_name: str, enabled: bool) -> bool:
+        """Opt a user in to or out of daily broadcasts."""
+        try:
+            self.users.set_opt_in(
+                user_id, user_name, daily_motivation=enabled, daily_tips=enabled
+            )
+            return True
+        except Exception as e:
+            logger.error(f"Error updating notifications: {e}")
+            return False
+
+    def refresh_users(self) -> None:
+        """Pick up users, bans and opt-outs changed on other replicas."""
+        try:
+            self.users.refresh()
+        except Exception as e:
+            logger.error(f"Error refreshing users: {e}")
+
+    def get_recipients(self, flag: str) -> List[Tuple[int, str]]:
+        """Get (user_id, user_name) of unbanned users opted in to a broadcast."""
+        try:
+            return self.users.recipients(flag)
+        except Exception as e:
+            logger.error(f"Error getting recipients: {e}")
+            return []
+
+    @traced()
     def get_message_history(
-        self, user_id: int, max_messages: int = 20, max_age_hours: int = 72
+        self,
+        user_id: int,
+        max_messages: int = 20,
+        max_age_hours: int = 72,
+        since: datetime = None,
     ) -> List[Dict[str, Any]]:
-        """Get message history for a user with pruning rules applied."""
+        """Get message history for a user with pruning rules applied.
+
+        When since is given, only messages after it are returned (e.g. the
+        ones not yet folded into the conversation summary).
+        """
         try:
             cutoff_time = datetime.now(self.timezone) - timedelta(hours=max_age_hours)
+            if since is not None and since > cutoff_time:
+                cutoff_time = since + timedelta(microseconds=1)
 
-            response = (
-                self.client.table("messages")
-                .select("role", "content", "created_at")
-                .eq("user_id", user_id)
-                .gte("created_at", cutoff_time.isoformat())
-                .order("created_at", desc=True)
-                .limit(max_messages)
-                .execute()
-            )
+            rows = self.storage.get_messages(user_id, cutoff_time, max_messages)
 
             # Convert to list and reverse to get chronological order
-            messages = list(reversed(response.data))
+            messages = list(reversed(rows))
 
             # Apply character limit (8000)
             total_chars = 0
@@ -197,22 +223,58 @@ class Database:
                 "role": role,
             }
 
-            self.client.table("messages").insert(data).execute()
+            self.storage.insert_messages([data])
             return True
 
         except Exception as e:
             logger.error(f"Error adding message: {e}")
             return False
 
-    def clear_old_messages(self, hours: int = 72) -> bool:
-        """Clear messages older than specified hours."""
+    def add_messages(self, messages: List[Dict[str, Any]]) -> bool:
+        """Add a batch of messages to the history in a single insert."""
+        try:
+            if messages:
+                self.storage.insert_messages(messages)
+            return True
+
+        except Exception as e:
+            logger.error(f"Error adding messages: {e}")
+            return False
+
+    @traced()
+    def get_conversation_summary(self, user_id: int) -> Optional[Dict[str, Any]]:
+        """Get the user's running conversation summary."""
         try:
-            cutoff_time = datetime.now(self.timezone) - timedelta(hours=hours)
+            return self.storage.get_summary(user_id)
 
-            self.client.table("messages").delete().lt(
-                "created_at", cutoff_time.isoformat()
-            ).execute()
+        except Exception as e:
+            logger.error(f"Error getting conversation summary: {e}")
+            return None
+
+    def save_conversation_summary(
+        self, user_id: int, summary: str, summarized_until: datetime
+    ) -> bool:
+        """Store the user's running conversation summary."""
+        try:
+            self.storage.upsert_summary(
+                {
+                    "user_id": user_id,
+                    "summary": summary,
+                    "summarized_until": summarized_until.isoformat(),
+                    "updated_at": datetime.now(pytz.UTC).isoformat(),
+                }
+            )
+            return True
 
+        except Exception as e:
+            logger.error(f"Error saving conversation summary: {e}")
+            return False
+
+    def clear_old_messages(self, hours: int = 72) -> bool:
+        """Clear messages older than specified hours, in bounded batches."""
+        try:
+            deleted = purge_messages(self.storage, hours=hours)
+            logger.info(f"Cleared {deleted} old messages")
             return True
 
         except Exception as e:
@@ -1,52 +1,39 @@
 import pandas as pd
-import matplotlib.pyplot as plt
 from datetime import datetime, timedelta
 import io
-from matplotlib.dates import HourLocator, DateFormatter
 import os
-from supabase import create_client, Client
-from dotenv import load_dotenv
+from storage import Storage, get_storage
+from tracing import traced
 
 
 class GymStats:
-    def __init__(self, processed_dir="processed"):
-        """Initialize GymStats with Supabase connection and settings."""
+    def __init__(self, processed_dir="processed", storage: Storage = None):
+        """Initialize GymStats with the storage backend and settings."""
         self.processed_dir = processed_dir
         self.club_name = "Wrocław_Ferio_Gaj"
 
         # Ensure directories exist
         os.makedirs(processed_dir, exist_ok=True)
 
-        # Initialize Supabase client
-        load_dotenv()
-        url = os.getenv("SUPABASE_URL")
-        key = os.getenv("SUPABASE_KEY")
-        if not url or not key:
-            raise ValueError("Missing Supabase credentials")
-        self.supabase: Client = create_client(url, key)
+        self.storage = storage or get_storage()
 
+    @traced()
     def _load_data(self, hours=24):
-        """Load data from Supabase for the specified time range."""
+        """Load data from storage for the specified time range."""
         print(f"Loading data for last {hours} hours...")
         cutoff_time = datetime.now() - timedelta(hours=hours)
         print(f"Cutoff time: {cutoff_time.isoformat()}")
 
-        # Query Supabase for recent data
-        response = (
-            self.supabase.table("gym_stats")
-            .select("*")
-            .gte("timestamp", cutoff_time.isoformat())
-            .order("timestamp")
-            .execute()
-        )
+        # Query storage for recent data
+        rows = self.storage.get_stats_between(cutoff_time)
 
-        print(f"Got {len(response.data)} records from Supabase")
-        if not response.data:
+        print(f"Got {len(rows)} records from storage")
+        if not rows:
             print("No data found!")
             return pd.DataFrame()
 
         # Convert to DataFrame and set timestamp as index
-        df = pd.DataFrame(response.data)
+        df = pd.DataFrame(rows)
         print(f"DataFrame columns: {df.columns.tolist()}")
         df["timestamp"] = pd.to_datetime(df["timestamp"])
         df.set_index("timestamp", inplace=True)
@@ -66,38 +53,59 @@ class GymStats:
         """
         return df[self.club_name].resample(interval).mean()
 
+    @traced()
+    def get_latest_record(self):
+        """Get the most recent gym_stats record."""
+        return self.storage.get_latest_stats()
+
     def get_current_members(self):
         """Get the current number of members in the club."""
         print("\nGetting current members...")
-        response = (
-            self.supabase.table("gym_stats")
-            .select("*")
-            .order("timestamp", desc=True)
-            .limit(1)
-            .execute()
-        )
-        print(f"Got response: {response.data}")
-        if response.data:
-            return response.data[0][self.club_name]
+        record = self.get_latest_record()
+        print(f"Got response: {record}")
+        if record:
+            return record[self.club_name]
         return None
 
+    @traced()
     def get_max_members(self, days=1):
         """Get maximum number of members in the last N days."""
         print(f"\nGetting max members for last {days} days...")
         cutoff_time = datetime.now() - timedelta(days=days)
-        response = (
-            self.supabase.table("gym_stats")
-            .select("*")
-            .gte("timestamp", cutoff_time.isoformat())
-            .execute()
-        )
+        rows = self.storage.get_stats_between(cutoff_time)
 
-        print(f"Got {len(response.data)} records")
-        if response.data:
-            df = pd.DataFrame(response.data)
+        print(f"Got {len(rows)} records")
+        if rows:
+            df = pd.DataFrame(rows)
             return df[self.club_name].max()
         return None
 
+    @traced()
+    def get_hourly_averages(self, days=14, weekday=None):
+        """
+        Get the average number of members per hour of day.
+
+        Args:
+            days (int): Number of days of history to average over
+            weekday (int): Only use this day of week (0 = Monday), or None for all
+
+        Returns:
+            dict: {hour: average members} for hours the gym had anyone in
+        """
+        df = self._load_data(hours=days * 24)
+        if df.empty:
+            return {}
+
+        # Timestamps hold local wall-clock time (see create_time_series_plot)
+        df.index = pd.to_datetime(df.index, utc=True).tz_localize(None)
+        members = df[self.club_name].resample("h").mean().dropna()
+        if weekday is not None:
+            members = members[members.index.dayofweek == weekday]
+
+        hourly = members.groupby(members.index.hour).mean()
+        return {int(hour): float(avg) for hour, avg in hourly.items() if avg > 0}
+
+    @traced()
     def create_time_series_plot(self, hours=24, interval="20min"):
         """
         Create a time series plot of members in the club.
@@ -109,6 +117,10 @@ class GymStats:
         Returns:
             io.BytesIO: Buffer containing the plot image
         """
+        # matplotlib is only needed for plots, keep it off the import path
+        import matplotlib.pyplot as plt
+        from matplotlib.dates import HourLocator, DateFormatter
+
         df = self._load_data(hours=hours)
         if df.empty:
             raise ValueError("No data available for the specified time range")
@@ -238,6 +250,7 @@ class GymStats:
         filename = f"members_over_time_{interval}.png"
         return self._save_plot(plot_buffer, filename)
 
+    @traced()
     def get_stats_summary(self):
         """Get a summary of all stats."""
         current = self.get_current_members()
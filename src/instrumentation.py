@@ -0,0 +1,241 @@
+import os
+import json
+import time
+import logging
+import functools
+import contextvars
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional
+
+from dotenv import load_dotenv
+
+from metrics import histogram, SIZE_BUCKETS
+from tracing import CLIENT, span, trace
+
+logger = logging.getLogger(__name__)
+
+load_dotenv()
+
+DEBUG_MODE = os.getenv("DEBUG_MODE", "false").lower() == "true"
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "200"))
+# Rows serialized to estimate the payload size of larger results
+SIZE_SAMPLE_ROWS = 8
+
+# Table and operation for each storage method; methods taking the table as
+# their first argument (retention helpers) have table None.
+STORAGE_CALLS = {
+    "insert_goal": ("goals", "insert"),
+    "get_active_goal": ("goals", "select"),
+    "get_active_goals": ("goals", "select"),
+    "update_goal": ("goals", "update"),
+    "get_expired_goals": ("goals", "select"),
+    "get_goal_users": ("goals", "select"),
+    "insert_ban": ("bans", "insert"),
+    "get_active_bans": ("bans", "select"),
+    "get_users": ("users", "select"),
+    "get_user": ("users", "select"),
+    "upsert_users": ("users", "upsert"),
+    "update_user": ("users", "update"),
+    "insert_messages": ("messages", "insert"),
+    "get_messages": ("messages", "select"),
+    "get_summary": ("conversation_summaries", "select"),
+    "upsert_summary": ("conversation_summaries", "upsert"),
+    "insert_stats": ("gym_stats", "insert"),
+    "get_latest_stats": ("gym_stats", "select"),
+    "get_stats_between": ("gym_stats", "select"),
+    "insert_raw_response": ("raw_responses", "insert"),
+    "get_delivered_users": ("broadcast_deliveries", "select"),
+    "mark_delivered": ("broadcast_deliveries", "upsert"),
+    "get_pool_entries": ("content_pool", "select"),
+    "insert_pool_entries": ("content_pool", "insert"),
+    "get_pool_deliveries": ("content_pool_deliveries", "select"),
+    "insert_pool_deliveries": ("content_pool_deliveries", "upsert"),
+    "get_job_runs": ("job_runs", "select"),
+    "claim_job_run": ("job_runs", "upsert"),
+    "renew_job_lease": ("job_runs", "update"),
+    "finish_job_run": ("job_runs", "update"),
+    "get_rows_before": (None, "select"),
+    "delete_rows": (None, "delete"),
+}
+
+storage_latency = histogram(
+    "storage_call_seconds", "Latency of storage calls in seconds"
+)
+storage_rows = histogram(
+    "storage_call_rows", "Rows returned or written per storage call", SIZE_BUCKETS
+)
+storage_bytes = histogram(
+    "storage_call_bytes", "Payload bytes per storage call", SIZE_BUCKETS
+)
+
+# Name of the handler or job currently running and the storage calls it made
+current_handler = contextvars.ContextVar("current_handler", default=None)
+_calls = contextvars.ContextVar("storage_calls", default=None)
+
+
+@contextmanager
+def track(name: str):
+    """Attribute storage calls made inside the block to the given handler name."""
+    handler_token = current_handler.set(name)
+    calls: List[Dict[str, Any]] = []
+    calls_token = _calls.set(calls)
+    try:
+        yield calls
+    finally:
+        current_handler.reset(handler_token)
+        _calls.reset(calls_token)
+        if DEBUG_MODE and calls:
+            log_breakdown(name, calls)
+
+
+def _update_attributes(update: Any) -> Dict[str, Any]:
+    """Trace attributes of the Telegram update a handler was called with."""
+    user = getattr(update, "effective_user", None)
+    message = getattr(update, "message", None)
+    text = getattr(message, "text", None) or ""
+    return {
+        "telegram.update_id": getattr(update, "update_id", None),
+        "telegram.user_id": user.id if user else None,
+        "telegram.command": text.split()[0] if text.startswith("/") else None,
+        "telegram.text_length": len(text) if text else None,
+    }
+
+
+def tracked(func):
+    """Decorator tracking storage calls of an async handler or job, and
+    tracing it as the root of a trace."""
+
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        attributes = _update_attributes(args[0]) if args else {}
+        with track(func.__name__), trace(func.__name__, **attributes):
+            return await func(*args, **kwargs)
+
+    return wrapper
+
+
+def log_breakdown(name: str, calls: List[Dict[str, Any]]) -> None:
+    """Log the storage calls made while handling a single update or job."""
+    total_ms = sum(call["ms"] for call in calls)
+    lines = [f"{name}: {len(calls)} storage calls, {total_ms:.1f} ms total"]
+    for call in calls:
+        lines.append(
+            f"  {call['table']}.{call['operation']} ({call['method']}) "
+            f"{call['ms']:.1f} ms, {call['rows']} rows, {call['bytes']} bytes"
+        )
+    logger.info("\n".join(lines))
+
+
+def _payload_size(payload: Any) -> int:
+    """JSON size of a payload; for lists, estimated from a few sampled rows."""
+    if payload is None:
+        return 0
+    if isinstance(payload, list) and len(payload) > SIZE_SAMPLE_ROWS:
+        sample = payload[:: len(payload) // SIZE_SAMPLE_ROWS][:SIZE_SAMPLE_ROWS]
+        return round(len(json.dumps(sample, default=str)) * len(payload) / len(sample))
+    return len(json.dumps(payload, default=str))
+
+
+def _row_count(payload: Any) -> int:
+    if payload is None:
+        return 0
+    if isinstance(payload, list):
+        return len(payload)
+    return 1
+
+
+class InstrumentedStorage:
+    """Storage wrapper recording latency, rows and payload size of every call."""
+
+    def __init__(self, storage):
+        self.storage = storage
+
+    def __getattr__(self, name: str):
+        attr = getattr(self.storage, name)
+        if name.startswith("_") or not callable(attr):
+            return attr
+
+        table, operation = STORAGE_CALLS.get(name, (None, name))
+
+        @functools.wraps(attr)
+        def call(*args, **kwargs):
+            call_table = table or (args[0] if args else kwargs.get("table", "?"))
+            with span(
+                f"storage {call_table}.{operation}",
+                CLIENT,
+                **{
+                    "db.operation": operation,
+                    "db.table": call_table,
+                    "db.method": name,
+                },
+            ) as call_span:
+                start = time.perf_counter()
+                result = attr(*args, **kwargs)
+                elapsed = time.perf_counter() - start
+
+                if operation == "select":
+                    payload = result
+                else:
+                    payload = next(
+                        (arg for arg in args if isinstance(arg, (dict, list))), None
+                    )
+                call_span.set_attribute("db.rows", _row_count(payload))
+            self._record(name, call_table, operation, elapsed, payload)
+            return result
+
+        # Cache the wrapper so later lookups skip __getattr__
+        setattr(self, name, call)
+        return call
+
+    def _record(
+        self,
+        method: str,
+        table: str,
+        operation: str,
+        elapsed: float,
+        payload: Optional[Any],
+    ) -> None:
+        rows = _row_count(payload)
+        size = _payload_size(payload)
+
+        storage_latency.observe(elapsed, table=table, operation=operation)
+        storage_rows.observe(rows, table=table, operation=operation)
+        storage_bytes.observe(size, table=table, operation=operation)
+
+        ms = elapsed * 1000
+        handler = current_handler.get()
+        if ms >= SLOW_QUERY_MS:
+            logger.warning(
+                f"Slow storage call: {table}.{operation} ({method}) took {ms:.0f} ms, "
+                f"{rows} rows, {size} bytes [handler: {handler or 'unknown'}]"
+            )
+
+        calls = _calls.get()
+        if calls is not None:
+            calls.append(
+                {
+                    "method": method,
+                    "table": table,
+                    "operation": operation,
+                    "ms": ms,
+                    "rows": rows,
+                    "bytes": size,
+                }
+            )
+
+
+def log_storage_summary() -> None:
+    """Log call count and latency percentiles per table and operation."""
+    summary = storage_latency.summary()
+    if not summary:
+        return
+    lines = ["Storage call summary:"]
+    for labels, count, total, p50, p95 in sorted(
+        summary, key=lambda item: item[2], reverse=True
+    ):
+        lines.append(
+            f"  {labels['table']}.{labels['operation']}: {count} calls, "
+            f"p50 {p50 * 1000:.1f} ms, p95 {p95 * 1000:.1f} ms, "
+            f"total {total:.2f} s"
+        )
+    logger.info("\n".join(lines))
@@ -0,0 +1,429 @@
+import os
+import re
+import math
+import random
+import asyncio
+import logging
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from dotenv import load_dotenv
+
+from metrics import counter
+
+logger = logging.getLogger(__name__)
+
+load_dotenv()
+
+ROUTER_ENABLED = os.getenv("ROUTER_ENABLED", "true").lower() == "true"
+ROUTER_STYLE = os.getenv("ROUTER_STYLE", "bro")  # "bro" or "plain"
+ROUTER_MIN_CONFIDENCE = float(os.getenv("ROUTER_MIN_CONFIDENCE", "0.9"))
+
+OCCUPANCY = "occupancy"
+BEST_TIME = "best_time"
+GOAL_PROGRESS = "goal_progress"
+CHAT = "chat"
+
+routed_messages = counter("router_messages_total", "Chat messages by routed intent")
+
+# Words that may follow a question without changing it ("is it busy rn bro?")
+_TAIL = (
+    r"(?:\s+(?:right\s+)?now|\s+rn|\s+atm|\s+at the moment|\s+today|"
+    r"\s+tomorrow|\s+tonight|\s+this week|\s+bro|\s+pls|\s+please)*"
+    r"\s*[?!.]*\s*$"
+)
+_GYM = r"(?:the\s+)?gym"
+
+# The local answers only know the current count, the coming hours and the
+# active goal, so questions about the past or another time go to the LLM
+_OTHER_TIME = re.compile(
+    r"\b(?:yesterday|ago|earlier|was|were|last\s+\w+|next\s+\w+|weekends?|"
+    r"(?:mon|tues|wednes|thurs|fri|satur|sun)days?|"
+    r"(?:at|around|by|after|before|from)\s+\d{1,2}(?::\d{2})?\s*(?:am|pm|h)?)\b",
+    re.IGNORECASE,
+)
+# Occupancy is only known for the current moment
+_NOT_NOW = re.compile(r"\b(?:tomorrow|tonight|later|this\s+week)\b", re.IGNORECASE)
+
+# High precision rules, checked before the classifier. Each one matches a
+# whole message asking about the gym's state, so a chat message that merely
+# mentions the gym, or something being full or busy, is left to the LLM.
+RULES = [
+    (
+        BEST_TIME,
+        re.compile(
+            rf"^(?:when|what time)\s+(?:is|are)\s+(?:{_GYM}|it)\s+"
+            rf"(?:least busy|less busy|not busy|quiet|quietest|empty|emptiest)"
+            rf"{_TAIL}|"
+            rf"^(?:what(?:'s| is)\s+)?(?:the\s+)?(?:best|quietest|good)\s+"
+            rf"(?:time|hour)\s+(?:to\s+(?:go\s+to|hit)\s+{_GYM}|for\s+{_GYM})"
+            rf"{_TAIL}|"
+            rf"^when\s+should\s+i\s+go\s+to\s+{_GYM}"
+            rf"(?:\s+to\s+avoid\s+(?:the\s+)?crowds?)?{_TAIL}",
+            re.IGNORECASE,
+        ),
+    ),
+    (
+        OCCUPANCY,
+        re.compile(
+            rf"^(?:is|are)\s+(?:{_GYM}|it)\s+"
+            rf"(?:busy|crowded|packed|full|empty|quiet){_TAIL}|"
+            rf"^how\s+(?:busy|crowded|packed|full|empty)\s+is\s+(?:{_GYM}|it)"
+            rf"{_TAIL}|"
+            rf"^how many (?:people|ppl|peeps|members|guys)\s+(?:are\s+)?"
+            rf"(?:(?:at|in)\s+{_GYM}|there){_TAIL}|"
+            rf"^(?:anyone|anybody)\s+(?:at|in)\s+{_GYM}{_TAIL}|"
+            rf"^(?:current\s+)?(?:occupancy|crowd){_TAIL}",
+            re.IGNORECASE,
+        ),
+    ),
+    (
+        GOAL_PROGRESS,
+        re.compile(
+            rf"^(?:how(?:'s| is)|what(?:'s| is)|check|show(?:\s+me)?)\s+my\s+"
+            rf"(?:weekly\s+)?(?:goal|progress)(?:\s+going)?{_TAIL}|"
+            rf"^my\s+(?:weekly\s+)?(?:goal|progress){_TAIL}|"
+            rf"^how many (?:visits|times)\s+(?:do i have\s+)?(?:left|to go|more)"
+            rf"{_TAIL}|"
+            rf"^how many times did i go(?:\s+to\s+{_GYM})?{_TAIL}|"
+            rf"^did i (?:hit|reach|make) my (?:weekly\s+)?goal(?:\s+yet)?{_TAIL}",
+            re.IGNORECASE,
+        ),
+    ),
+]
+
+# Labelled examples the classifier is trained on at startup
+TRAINING_EXAMPLES = {
+    OCCUPANCY: [
+        "is the gym busy",
+        "is it busy right now",
+        "how many people are at the gym",
+        "how many people now",
+        "how crowded is it",
+        "is it packed today",
+        "is the gym empty",
+        "anyone at the gym",
+        "how full is the gym",
+        "crowd right now",
+        "is it crowded",
+        "current occupancy",
+        "how many ppl there",
+        "gym busy rn",
+        "lots of people there now",
+        "ile osób jest na siłowni",
+        "czy jest tłok",
+    ],
+    BEST_TIME: [
+        "when is the best time to go",
+        "best time to train",
+        "when is it least busy",
+        "what time is the gym quiet",
+        "when should i go to avoid crowds",
+        "quietest hour today",
+        "when is it empty",
+        "good time to hit the gym",
+        "when are fewer people there",
+        "what hour is best for the gym",
+        "when to go to the gym",
+        "kiedy jest najmniej ludzi",
+    ],
+    GOAL_PROGRESS: [
+        "how is my goal going",
+        "what is my progress",
+        "how many visits do i have",
+        "how many visits left",
+        "did i hit my goal",
+        "am i on track this week",
+        "check my goal",
+        "how many times did i go this week",
+        "my weekly progress",
+        "how close am i to my goal",
+        "visits this week",
+    ],
+    CHAT: [
+        "hey bro",
+        "what's up",
+        "i hate leg day",
+        "give me a workout plan",
+        "how much protein should i eat",
+        "i'm so tired today",
+        "tell me a joke",
+        "what should i eat after training",
+        "i did bench press today",
+        "thanks bro",
+        "how do i get bigger arms",
+        "should i do cardio",
+        "i skipped the gym yesterday",
+        "motivate me",
+        "what's the best exercise for chest",
+        "how many sets should i do",
+        "is creatine safe",
+        "lol",
+        "good morning",
+        "i feel lazy",
+        "my goal is to bench 100kg",
+        "my goal is to lose weight",
+        "my progress on bench is slow",
+        "best time to eat protein",
+        "when should i take creatine",
+        "is it good to train when tired",
+        "how many people skip warm up",
+        "the gym was so busy yesterday lol",
+        # Chat that shares words with the stats questions
+        "is it normal to feel full after a protein shake",
+        "my stomach feels full",
+        "it feels so empty without leg day",
+        "my gym bag is full of sweaty clothes",
+        "is it gross to reuse a gym towel",
+        "the gym is full of bros lol",
+        "how full should my plate be",
+        "is it empty calories",
+        "are empty carbs bad",
+        "i'm busy with work this week",
+        "i was too busy to go to the gym",
+        "is it worth going to the gym when sick",
+        "is it ok to train every day",
+        "is it bad to lift on an empty stomach",
+        "when is it ok to skip the gym",
+        "what is the best time of day to take creatine",
+        "best time to eat before the gym",
+        "best time to take pre workout",
+        "what time should i sleep after training",
+        "when should i deload",
+        "how is my form on squats",
+        "how is my diet looking",
+        "what is my ideal weight",
+        "how many people can bench 100kg",
+        "how many reps should i do",
+        "how many days a week should i train",
+        "my gym crush was there today",
+        "the gym music is so loud",
+        "new gym who dis",
+        "gym tips for beginners",
+        "what time do you go to the gym",
+        "when do you usually train",
+        "how busy are you",
+        "are you busy",
+        "when is the gym open",
+    ],
+}
+
+TEMPLATES = {
+    "bro": {
+        "occupancy": [
+            "Yo {name}! Right now there are {current} people grinding at the gym 👥 "
+            "That's {level} ({percent}% of the 14-day peak of {peak}) 💪",
+            "{current} lifters in the building right now, bro! "
+            "Looks {level} — {percent}% of the recent peak ({peak}) 🏋️",
+        ],
+        "best_time": [
+            "Bro, based on the last two weeks the quietest times {when} are "
+            "{hours} 🧘 Go claim that squat rack! 💪",
+            "Want the gym to yourself, {name}? Aim for {hours} {when} — "
+            "that's when it's emptiest 🔥",
+        ],
+        "goal": [
+            "{name}, you're at {current}/{target} visits this week! "
+            "{remaining} to go before {deadline} 💪🔥",
+            "Progress check: {current}/{target} gym visits, bro! "
+            "{remaining} more before {deadline}. Let's gooo 🚀",
+        ],
+        "goal_done": [
+            "BEAST MODE {name}! {current}/{target} visits — goal smashed this week 🏆🔥",
+        ],
+        "no_goal": [
+            "No active goal yet, {name}! 🤔 Set one with /goal and let's get those gains 💪",
+        ],
+        "no_data": [
+            "Bro, my gym sensors are napping 😴 No fresh data right now, try /status later!",
+        ],
+    },
+    "plain": {
+        "occupancy": [
+            "There are {current} people at the gym right now ({level}, "
+            "{percent}% of the 14-day peak of {peak})."
+        ],
+        "best_time": ["The quietest times {when} are usually {hours}."],
+        "goal": [
+            "Goal progress: {current}/{target} visits, {remaining} to go before "
+            "{deadline}."
+        ],
+        "goal_done": ["Goal reached: {current}/{target} visits this week."],
+        "no_goal": ["You don't have an active goal. Use /goal to set one."],
+        "no_data": ["No gym data is available right now."],
+    },
+}
+
+
+def _tokens(text: str) -> List[str]:
+    words = re.findall(r"[\w']+", text.lower())
+    return words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+
+
+class NaiveBayes:
+    """Multinomial naive Bayes over word unigrams and bigrams."""
+
+    def __init__(self, examples: Dict[str, List[str]]):
+        self.word_counts: Dict[str, Counter] = defaultdict(Counter)
+        self.totals: Dict[str, int] = {}
+        self.priors: Dict[str, float] = {}
+        vocabulary = set()
+
+        total_examples = sum(len(texts) for texts in examples.values())
+        for label, texts in examples.items():
+            for text in texts:
+                tokens = _tokens(text)
+                self.word_counts[label].update(tokens)
+                vocabulary.update(tokens)
+            self.totals[label] = sum(self.word_counts[label].values())
+            self.priors[label] = math.log(len(texts) / total_examples)
+        self.vocabulary_size = len(vocabulary)
+
+    def predict(self, text: str) -> Tuple[str, float]:
+        """Get the most likely label and its posterior probability."""
+        tokens = _tokens(text)
+        scores = {}
+        for label, prior in self.priors.items():
+            counts, total = self.word_counts[label], self.totals[label]
+            scores[label] = prior + sum(
+                math.log((counts[token] + 1) / (total + self.vocabulary_size))
+                for token in tokens
+            )
+
+        best = max(scores, key=scores.get)
+        norm = sum(math.exp(score - scores[best]) for score in scores.values())
+        return best, 1 / norm
+
+
+class IntentRouter:
+    """Answer stats questions from local data instead of the LLM.
+
+    Messages are matched against regex rules first and a naive Bayes
+    classifier second; anything not confidently about occupancy, best times
+    or goal progress is left to the LLM.
+    """
+
+    def __init__(self, stats, db, style: str = ROUTER_STYLE):
+        self.stats = stats
+        self.db = db
+        self.templates = TEMPLATES.get(style, TEMPLATES["bro"])
+        self.model = NaiveBayes(TRAINING_EXAMPLES)
+
+    def classify(self, text: str) -> Tuple[str, float, str]:
+        """
+        Classify a message.
+
+        Returns:
+            tuple: (intent, confidence, source) where source is "rule" or "model"
+        """
+        text = text.strip()
+        for intent, pattern in RULES:
+            if pattern.search(text):
+                confidence, source = 1.0, "rule"
+                break
+        else:
+            intent, confidence = self.model.predict(text)
+            source = "model"
+            if confidence < ROUTER_MIN_CONFIDENCE:
+                return CHAT, confidence, source
+
+        if _OTHER_TIME.search(text) or (intent == OCCUPANCY and _NOT_NOW.search(text)):
+            return CHAT, confidence, source
+        return intent, confidence, source
+
+    def _render(self, key: str, **values) -> str:
+        return random.choice(self.templates[key]).format(**values)
+
+    def _occupancy(self, name: str) -> str:
+        summary = self.stats.get_stats_summary()
+        current, peak = summary["current_members"], summary["max_14d"]
+        if current is None:
+            return self._render("no_data")
+
+        ratio = current / peak if peak else 0
+        if ratio < 0.3:
+            level = "pretty empty"
+        elif ratio < 0.6:
+            level = "moderately busy"
+        else:
+            level = "packed"
+        return self._render(
+            "occupancy",
+            name=name,
+            current=current,
+            peak=peak,
+            percent=round(ratio * 100),
+            level=level,
+        )
+
+    def _best_time(self, name: str, tomorrow: bool = False) -> str:
+        now = datetime.now()
+        upcoming = {}
+        if not tomorrow:
+            hourly = self.stats.get_hourly_averages(days=14, weekday=now.weekday())
+            upcoming = {hour: avg for hour, avg in hourly.items() if hour > now.hour}
+        when = "later today"
+        if not upcoming:
+            # Nothing left today, look at tomorrow
+            weekday = (now + timedelta(days=1)).weekday()
+            upcoming = self.stats.get_hourly_averages(days=14, weekday=weekday)
+            when = "tomorrow"
+        if not upcoming:
+            return self._render("no_data")
+
+        quietest = sorted(upcoming, key=upcoming.get)[:3]
+        hours = ", ".join(f"{hour:02d}:00" for hour in sorted(quietest))
+        return self._render("best_time", name=name, hours=hours, when=when)
+
+    def _goal(self, user_id: int, name: str) -> str:
+        goal = self.db.get_active_goal(user_id)
+        if not goal:
+            return self._render("no_goal", name=name)
+
+        current, target = goal["current_visits"], goal["target_visits"]
+        if current >= target:
+            return self._render("goal_done", name=name, current=current, target=target)
+        deadline = datetime.fromisoformat(goal["end_date"])
+        deadline = deadline.astimezone(self.db.timezone).strftime("%A %H:%M")
+        return self._render(
+            "goal",
+            name=name,
+            current=current,
+            target=target,
+            remaining=target - current,
+            deadline=deadline,
+        )
+
+    def answer(self, intent: str, text: str, user_id: int, name: str) -> str:
+        if intent == OCCUPANCY:
+            return self._occupancy(name)
+        if intent == BEST_TIME:
+            tomorrow = re.search(r"\btomorrow\b", text, re.IGNORECASE) is not None
+            return self._best_time(name, tomorrow)
+        return self._goal(user_id, name)
+
+    async def route(self, text: str, user_id: int, name: str) -> Optional[str]:
+        """
+        Answer a message locally if it is a stats question.
+
+        Returns:
+            str: Reply text, or None if the message should go to the LLM
+        """
+        if not ROUTER_ENABLED:
+            return None
+
+        intent, confidence, source = self.classify(text)
+        routed_messages.inc(intent=intent, source=source)
+        if intent == CHAT:
+            return None
+
+        logger.info(
+            f"Routed message from {user_id} to {intent} "
+            f"({source}, confidence {confidence:.2f})"
+        )
+        try:
+            return await asyncio.to_thread(self.answer, intent, text, user_id, name)
+        except Exception as e:
+            logger.error(f"Error answering {intent} locally: {e}")
+            return None
@@ -0,0 +1,282 @@
+import os
+import socket
+import asyncio
+import hashlib
+import logging
+from datetime import date, datetime, time, timedelta
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Tuple
+
+import pytz
+
+from metrics import counter
+
+logger = logging.getLogger(__name__)
+
+TIMEZONE = pytz.timezone("Europe/Warsaw")
+
+SCHEDULER_INTERVAL = int(os.getenv("SCHEDULER_INTERVAL", "30"))  # seconds
+JOB_LEASE = int(os.getenv("JOB_LEASE", "300"))  # seconds, renewed while running
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+JOB_RETRY_DELAY = int(os.getenv("JOB_RETRY_DELAY", "300"))  # seconds, per attempt
+
+job_runs = counter("scheduled_job_runs_total", "Scheduled job runs by outcome")
+
+JobCallback = Callable[[Any, datetime], Awaitable[None]]
+RunKey = Tuple[str, str]
+
+
+def _parse(value) -> datetime:
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    if value.tzinfo is None:
+        value = pytz.UTC.localize(value)
+    return value
+
+
+def _days(start: datetime, end: datetime) -> Iterable[date]:
+    day = start.date() - timedelta(days=1)
+    while day <= end.date():
+        yield day
+        day += timedelta(days=1)
+
+
+class Daily:
+    """Every day (or the given weekdays, 0 = Monday) at a fixed local time."""
+
+    def __init__(self, at: time, days: Optional[Tuple[int, ...]] = None):
+        self.at = at
+        self.days = days
+
+    def time_on(self, day: date) -> time:
+        return self.at
+
+    def occurrences(self, start: datetime, end: datetime) -> List[datetime]:
+        result = []
+        for day in _days(start, end):
+            if self.days is not None and day.weekday() not in self.days:
+                continue
+            at = TIMEZONE.localize(datetime.combine(day, self.time_on(day)))
+            if start <= at <= end:
+                result.append(at)
+        return result
+
+
+class DailyBetween(Daily):
+    """Once a day at a random-looking time between start and end.
+
+    The time is derived from the seed and the date, so every replica and
+    every restart agrees on it.
+    """
+
+    def __init__(self, start: time, end: time, seed: str):
+        super().__init__(start)
+        self.end = end
+        self.seed = seed
+
+    def time_on(self, day: date) -> time:
+        start = self.at.hour * 3600 + self.at.minute * 60 + self.at.second
+        span = self.end.hour * 3600 + self.end.minute * 60 + self.end.second - start
+        digest = hashlib.sha256(f"{self.seed}:{day.isoformat()}".encode()).digest()
+        seconds = start + int.from_bytes(digest[:8], "big") % span
+        return time(seconds // 3600, seconds // 60 % 60, seconds % 60)
+
+
+class Every:
+    """Every interval seconds, aligned to the epoch so replicas agree;
+    optionally only between two local times."""
+
+    def __init__(self, seconds: int, between: Optional[Tuple[time, time]] = None):
+        self.seconds = seconds
+        self.between = between
+
+    def occurrences(self, start: datetime, end: datetime) -> List[datetime]:
+        first = -(-int(start.timestamp()) // self.seconds) * self.seconds
+        result = []
+        for ts in range(first, int(end.timestamp()) + 1, self.seconds):
+            at = datetime.fromtimestamp(ts, TIMEZONE)
+            if self.between is None or self.between[0] <= at.time() < self.between[1]:
+                result.append(at)
+        return result
+
+
+class Job:
+    def __init__(self, name: str, callback: JobCallback, schedule, catch_up: timedelta):
+        self.name = name
+        self.callback = callback
+        self.schedule = schedule
+        self.catch_up = catch_up
+
+
+class JobScheduler:
+    """Run scheduled jobs exactly once across restarts and replicas.
+
+    Every occurrence of a job gets a run record in the job_runs table, keyed
+    by job name and scheduled time. A replica claims a run with a lease it
+    renews while the job runs; when it dies, the lease expires and another
+    replica (or the restarted one) takes over. Occurrences missed while no
+    replica was running are caught up as long as they are less than the
+    job's catch_up old, and failed runs are retried up to JOB_MAX_ATTEMPTS.
+    """
+
+    def __init__(self, storage, owner: str = None):
+        self.storage = storage
+        self.owner = owner or f"{socket.gethostname()}:{os.getpid()}"
+        self.jobs: List[Job] = []
+        self._done: Dict[RunKey, datetime] = {}  # finished here or elsewhere
+        self._running: Dict[RunKey, asyncio.Task] = {}
+
+    def add(
+        self, name: str, callback: JobCallback, schedule, catch_up: timedelta
+    ) -> None:
+        """Register a job called as callback(context, scheduled_for)."""
+        self.jobs.append(Job(name, callback, schedule, catch_up))
+
+    def next_runs(self, days: int = 2) -> Dict[str, datetime]:
+        """First upcoming occurrence of every job, for logging."""
+        now = datetime.now(TIMEZONE)
+        upcoming = {}
+        for job in self.jobs:
+            occurrences = job.schedule.occurrences(now, now + timedelta(days=days))
+            if occurrences:
+                upcoming[job.name] = occurrences[0]
+        return upcoming
+
+    def _due(self, now: datetime) -> List[Tuple[Job, datetime]]:
+        due = []
+        for job in self.jobs:
+            if any(name == job.name for name, _ in self._running):
+                continue
+            for scheduled_for in job.schedule.occurrences(now - job.catch_up, now):
+                if (job.name, scheduled_for.isoformat()) not in self._done:
+                    due.append((job, scheduled_for))
+                    break  # oldest missed occurrence first, one at a time
+        return due
+
+    async def tick(self, context) -> None:
+        """Claim and start every due run; called every SCHEDULER_INTERVAL."""
+        now = datetime.now(TIMEZONE)
+        due = self._due(now)
+        if not due:
+            return
+
+        since = min(scheduled_for for _, scheduled_for in due)
+        try:
+            rows = await asyncio.to_thread(self.storage.get_job_runs, since)
+        except Exception as e:
+            logger.error(f"Error loading scheduled job runs: {e}")
+            return
+        runs = {(row["job"], _parse(row["scheduled_for"])): row for row in rows}
+
+        for job, scheduled_for in due:
+            key = (job.name, scheduled_for.isoformat())
+            run = runs.get((job.name, scheduled_for))
+            attempts = run["attempts"] if run else 0
+            if run and (run["status"] == "done" or attempts >= JOB_MAX_ATTEMPTS):
+                self._done[key] = scheduled_for
+                continue
+            if run and _parse(run["lease_until"]) > now:
+                continue  # running elsewhere, or waiting to be retried
+
+            try:
+                claimed = await asyncio.to_thread(
+                    self.storage.claim_job_run,
+                    job.name,
+                    scheduled_for,
+                    self.owner,
+                    attempts,
+                    now + timedelta(seconds=JOB_LEASE),
+                    now,
+                )
+            except Exception as e:
+                logger.error(f"Error claiming {job.name} run {scheduled_for}: {e}")
+                continue
+            if claimed:
+                late = (now - scheduled_for).total_seconds()
+                logger.info(
+                    f"Running {job.name} scheduled for {scheduled_for} "
+                    f"(attempt {attempts + 1}"
+                    + (f", {late / 60:.0f} min late" if late >= 60 else "")
+                    + ")"
+                )
+                self._running[key] = asyncio.create_task(
+                    self._run(job, scheduled_for, attempts + 1, context)
+                )
+
+        # Keep only what can still be due
+        horizon = now - max(job.catch_up for job in self.jobs)
+        self._done = {k: at for k, at in self._done.items() if at >= horizon}
+
+    async def _renew(self, job: Job, scheduled_for: datetime, task) -> None:
+        while True:
+            await asyncio.sleep(JOB_LEASE / 3)
+            lease_until = datetime.now(TIMEZONE) + timedelta(seconds=JOB_LEASE)
+            try:
+                renewed = await asyncio.to_thread(
+                    self.storage.renew_job_lease,
+                    job.name,
+                    scheduled_for,
+                    self.owner,
+                    lease_until,
+                )
+            except Exception as e:
+                logger.error(f"Error renewing lease of {job.name}: {e}")
+                continue
+            if not renewed:
+                logger.warning(
+                    f"Lost the lease of {job.name} run {scheduled_for}, stopping it"
+                )
+                job_runs.inc(job=job.name, outcome="lost")
+                task.cancel()
+                return
+
+    async def _run(
+        self, job: Job, scheduled_for: datetime, attempt: int, context
+    ) -> None:
+        key = (job.name, scheduled_for.isoformat())
+        renewer = asyncio.create_task(
+            self._renew(job, scheduled_for, asyncio.current_task())
+        )
+        try:
+            await job.callback(context, scheduled_for)
+            fields = {
+                "status": "done",
+                "error": None,
+                "finished_at": datetime.now(TIMEZONE),
+            }
+            self._done[key] = scheduled_for
+            job_runs.inc(job=job.name, outcome="done")
+        except asyncio.CancelledError:
+            # Shutdown (or a lost lease, then the owner no longer matches):
+            # release the run for the next replica without using up an attempt
+            fields = {"lease_until": datetime.now(TIMEZONE), "attempts": attempt - 1}
+        except Exception as e:
+            logger.error(f"Scheduled job {job.name} failed (attempt {attempt}): {e}")
+            finished = datetime.now(TIMEZONE)
+            fields = {
+                "status": "failed",
+                "error": str(e)[:500],
+                "finished_at": finished,
+                "lease_until": finished + timedelta(seconds=JOB_RETRY_DELAY * attempt),
+            }
+            job_runs.inc(job=job.name, outcome="failed")
+        finally:
+            renewer.cancel()
+            del self._running[key]
+
+        try:
+            await asyncio.to_thread(
+                self.storage.finish_job_run,
+                job.name,
+                scheduled_for,
+                self.owner,
+                fields,
+            )
+        except Exception as e:
+            logger.error(f"Error recording {job.name} run {scheduled_for}: {e}")
+
+    async def shutdown(self) -> None:
+        """Stop running jobs; their leases expire and they are resumed later."""
+        tasks = list(self._running.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
@@ -0,0 +1,144 @@
+import os
+import time
+import heapq
+import asyncio
+import logging
+import itertools
+from typing import List, Optional, Tuple
+
+from dotenv import load_dotenv
+
+from metrics import counter, histogram
+from rate_limit import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+load_dotenv()
+
+# Request priorities (lower runs first)
+INTERACTIVE = 0
+BROADCAST = 1
+BACKGROUND = 2
+PRIORITY_NAMES = {
+    INTERACTIVE: "interactive",
+    BROADCAST: "broadcast",
+    BACKGROUND: "background",
+}
+
+LLM_RPM = float(os.getenv("LLM_RPM", "14"))  # Gemini requests per minute
+LLM_BURST = float(os.getenv("LLM_BURST", "1"))
+LLM_MAX_QUEUE = int(os.getenv("LLM_MAX_QUEUE", "50"))
+
+queue_wait = histogram("llm_queue_wait_seconds", "Time LLM requests wait for a slot")
+shed_requests = counter("llm_shed_total", "LLM requests rejected by load shedding")
+
+
+class SchedulerOverloaded(Exception):
+    """Raised when the LLM queue is full and the request was shed."""
+
+
+class LLMScheduler:
+    """Process-wide token bucket for LLM requests with a bounded priority queue.
+
+    Requests wait in priority order, so an interactive chat queued behind
+    broadcast work gets the next free slot. When the queue is full, the
+    lowest-priority waiter is shed (or the new request, if nothing queued
+    is less important).
+    """
+
+    def __init__(
+        self,
+        rpm: float = LLM_RPM,
+        burst: float = LLM_BURST,
+        max_queue: int = LLM_MAX_QUEUE,
+    ):
+        self.bucket = TokenBucket(rpm / 60, burst)
+        self.max_queue = max_queue
+        self._queue: List[Tuple[int, int, asyncio.Future]] = []
+        self._counter = itertools.count()
+        self._dispatcher: Optional[asyncio.Task] = None
+
+    def _shed_one(self, priority: int) -> None:
+        """Make room for a request by dropping the least important waiter."""
+        worst = max(self._queue)
+        if worst[0] <= priority:
+            shed_requests.inc(priority=PRIORITY_NAMES[priority])
+            raise SchedulerOverloaded("LLM queue is full")
+
+        self._queue.remove(worst)
+        heapq.heapify(self._queue)
+        if not worst[2].done():
+            worst[2].set_exception(SchedulerOverloaded("Preempted by higher priority"))
+        shed_requests.inc(priority=PRIORITY_NAMES[worst[0]])
+
+    async def _dispatch(self) -> None:
+        """Hand out tokens to queued requests in priority order."""
+        while self._queue:
+            await self.bucket.acquire()
+            # Skip requests that were cancelled while waiting
+            while self._queue and self._queue[0][2].done():
+                heapq.heappop(self._queue)
+            if not self._queue:
+                # Nobody left to take the token, give it back
+                self.bucket.tokens = min(self.bucket.capacity, self.bucket.tokens + 1)
+                break
+            heapq.heappop(self._queue)[2].set_result(None)
+        self._dispatcher = None
+
+    async def acquire(self, priority: int = INTERACTIVE) -> float:
+        """
+        Wait for a request slot.
+
+        Returns:
+            float: Seconds spent waiting
+
+        Raises:
+            SchedulerOverloaded: If the request was shed
+        """
+        start = time.monotonic()
+        if not self._queue and self.bucket.try_acquire():
+            queue_wait.observe(0, priority=PRIORITY_NAMES[priority])
+            return 0.0
+
+        if len(self._queue) >= self.max_queue:
+            self._shed_one(priority)
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._queue, (priority, next(self._counter), future))
+        if self._dispatcher is None or self._dispatcher.done():
+            self._dispatcher = asyncio.ensure_future(self._dispatch())
+
+        await future
+        waited = time.monotonic() - start
+        queue_wait.observe(waited, priority=PRIORITY_NAMES[priority])
+        return waited
+
+    def try_acquire(self, priority: int = INTERACTIVE) -> bool:
+        """Take a slot only if one is free right now and nobody is waiting."""
+        if self._queue or not self.bucket.try_acquire():
+            return False
+        queue_wait.observe(0, priority=PRIORITY_NAMES[priority])
+        return True
+
+    @property
+    def queue_length(self) -> int:
+        return len(self._queue)
+
+    @property
+    def idle(self) -> bool:
+        """True when nothing is queued and a request could start right away."""
+        return not self._queue and self.bucket.delay() == 0
+
+
+def log_queue_summary() -> None:
+    """Log LLM queue wait percentiles and shed requests per priority."""
+    for labels, count, total, p50, p95 in queue_wait.summary():
+        priority = labels["priority"]
+        logger.info(
+            f"LLM queue ({priority}): {count} requests, wait p50 {p50:.2f}s, "
+            f"p95 {p95:.2f}s, shed {shed_requests.value(priority=priority):.0f}"
+        )
+
+
+# Shared by every LLMService in the process
+scheduler = LLMScheduler()
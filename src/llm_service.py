@@ -1,27 +1,81 @@
-import google.generativeai as genai
-from google.generativeai.types import HarmCategory, HarmBlockThreshold
 import os
 from dotenv import load_dotenv
 import logging
-from typing import List, Dict, Any, Tuple
+from typing import (
+    List,
+    Dict,
+    Any,
+    Tuple,
+    Optional,
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    TypeVar,
+    Union,
+)
 import asyncio
-from google.api_core import retry
+import time
 import random
+import json
+from llm_telemetry import (
+    LLMCall,
+    hedge_delay,
+    measured,
+    observe_attempt,
+    outcome_of,
+    record_fallback,
+)
+from model_cascade import LLM_MODELS, ModelCascade
+from chat_sessions import ChatSession, ChatSessions
+from llm_scheduler import (
+    scheduler,
+    INTERACTIVE,
+    BROADCAST,
+    BACKGROUND,
+)
+from tracing import CLIENT, start_span
 
 logger = logging.getLogger(__name__)
 
+T = TypeVar("T")
+
+# A plain prompt or native multi-turn contents
+Prompt = Union[str, List[Dict[str, Any]]]
+
 # Load environment variables
 load_dotenv()
 
-# Configure Gemini API
-genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
 DEBUG_MODE = os.getenv("DEBUG_MODE", "false").lower() == "true"
 MAX_RETRIES = 3
 RETRY_DELAY = 1  # seconds
+BATCH_SIZE = int(os.getenv("LLM_BATCH_SIZE", "20"))  # users per batched request
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "30"))  # seconds per attempt
+
+# Fixed persona sent as the system instruction of every chat request
+CHAT_PERSONA = """You are a gym bro chatbot.
+Be motivational but also funny and use gym bro slang.
+Respond in a motivational gym bro style, keep it short and fun. Use emojis."""
+
+SUMMARY_MAX_CHARS = 1000  # cap for the running conversation summary
+
+CHAT_FALLBACK = (
+    "Sorry bro, my protein shake must've gone to my head! 🥤 Try again later! 💪"
+)
+
+
+class ResponseSuperseded(Exception):
+    """Raised by a response stream when a newer message from the same user
+    cancelled it."""
 
 
 class LLMService:
     def __init__(self):
+        # The Gemini SDK is slow to import, only load it when the service is used
+        import google.generativeai as genai
+        from google.generativeai.types import HarmCategory, HarmBlockThreshold
+
+        genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
+
         # Set safety settings to allow all content
         safety_settings = {
             HarmCategory.HARM_CATEGORY_HARASSMENT: HarmBlockThreshold.BLOCK_NONE,
@@ -30,70 +84,570 @@ class LLMService:
             HarmCategory.HARM_CATEGORY_DANGEROUS_CONTENT: HarmBlockThreshold.BLOCK_NONE,
         }
 
-        model_name = "gemini-2.0-flash-exp"
-        # model_name = "gemini-1.5-flash"
+        # Models tried in order, each behind its own circuit breaker
+        self.cascade = ModelCascade(
+            LLM_MODELS,
+            lambda name, system_instruction: genai.GenerativeModel(
+                name,
+                safety_settings=safety_settings,
+                system_instruction=system_instruction,
+            ),
+        )
 
-        self.model = genai.GenerativeModel(model_name, safety_settings=safety_settings)
-        self.chat = self.model.start_chat(history=[])
+        # Per-user chat sessions, so each turn only appends the new message
+        self.sessions = ChatSessions()
 
-    def _format_history(self, history: List[Dict[str, Any]]) -> str:
-        """Format message history into a string."""
-        if not history:
-            return ""
+        # In-flight chat generations per user, cancelled by newer messages
+        self._inflight: Dict[int, asyncio.Task] = {}
+        self._superseded = set()
 
-        formatted = "\nPrevious conversation:\n"
-        for msg in history:
-            role = "USER" if msg["role"] == "user" else "ASSISTANT"
-            formatted += f"{role}: {msg['content']}\n"
+    def _format_history(
+        self, history: List[Dict[str, Any]], summary: Optional[str] = None
+    ) -> str:
+        """Format the conversation summary and recent messages into a string."""
+        formatted = ""
+        if summary:
+            formatted += f"\nSummary of the earlier conversation:\n{summary}\n"
+        if history:
+            formatted += "\nPrevious conversation:\n"
+            for msg in history:
+                role = "USER" if msg["role"] == "user" else "ASSISTANT"
+                formatted += f"{role}: {msg['content']}\n"
         return formatted
 
-    async def _generate_with_retry(self, prompt: str, temperature: float = 1.5) -> str:
-        """Generate content with retry mechanism."""
-        for attempt in range(MAX_RETRIES):
+    async def _hedged(
+        self,
+        attempt: Callable[[str], Awaitable[T]],
+        model: str,
+        hedge_model: Optional[str],
+        call: LLMCall,
+        stream: bool = False,
+    ) -> T:
+        """
+        Run an attempt against a model, hedging with a second request.
+
+        If the first request is still running after the model's observed p95
+        and the scheduler has a free slot, the same attempt is started against
+        hedge_model. The first successful result wins and the other request
+        is cancelled.
+        """
+        tasks = {asyncio.ensure_future(attempt(model)): model}
+        try:
+            if hedge_model:
+                done, _ = await asyncio.wait(
+                    set(tasks), timeout=hedge_delay(model, stream)
+                )
+                if not done and scheduler.try_acquire(INTERACTIVE):
+                    logger.info(f"Hedging slow {model} request with {hedge_model}")
+                    call.hedge()
+                    tasks[asyncio.ensure_future(attempt(hedge_model))] = hedge_model
+
+            pending, error = set(tasks), None
+            while pending:
+                done, pending = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in done:
+                    if task.exception() is None:
+                        call.model = tasks[task]
+                        return task.result()
+                    error = error or task.exception()
+            raise error
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def _attempt(
+        self,
+        model_name: str,
+        prompt: Prompt,
+        generation_config: Dict[str, Any],
+        call: LLMCall,
+        system_instruction: Optional[str] = None,
+    ) -> str:
+        """Send one request to one model, feeding its circuit breaker."""
+        started = time.monotonic()
+        self.cascade.begin(model_name)
+        attempt_span = start_span(
+            "llm.attempt", call.span, CLIENT, **{"llm.model": model_name}
+        )
+        try:
             try:
-                response = self.model.generate_content(
-                    prompt,
-                    generation_config={"temperature": temperature},
+                response = await asyncio.wait_for(
+                    self.cascade.model(
+                        model_name, system_instruction
+                    ).generate_content_async(
+                        prompt,
+                        generation_config=generation_config,
+                    ),
+                    timeout=LLM_TIMEOUT,
+                )
+            except asyncio.TimeoutError:
+                raise TimeoutError(
+                    f"LLM request to {model_name} timed out after {LLM_TIMEOUT}s"
                 )
-                return response.text
-            except Exception as e:
-                if attempt == MAX_RETRIES - 1:  # Last attempt
-                    logger.error(f"Final retry attempt failed: {e}")
-                    raise  # Re-raise the last exception
-                logger.warning(f"Attempt {attempt + 1} failed: {e}. Retrying...")
-                await asyncio.sleep(RETRY_DELAY * (attempt + 1))  # Exponential backoff
+            text = response.text
+        except asyncio.CancelledError:
+            self.cascade.abandon(model_name)
+            attempt_span.set_attribute("llm.abandoned", True)
+            raise
+        except Exception as e:
+            self.cascade.record(model_name, ok=False)
+            attempt_span.record_error(e)
+            raise
+        finally:
+            attempt_span.end()
+
+        self.cascade.record(model_name, ok=True)
+        observe_attempt(model_name, time.monotonic() - started, stream=False)
+        call.add_usage(response)
+        return text
+
+    async def _generate_with_retry(
+        self,
+        prompt: Prompt,
+        temperature: float = 1.5,
+        json_output: bool = False,
+        priority: int = INTERACTIVE,
+        system_instruction: Optional[str] = None,
+    ) -> str:
+        """
+        Generate content, rate limited by the scheduler.
+
+        Attempts walk down the model cascade, skipping models whose circuit
+        is open; interactive requests are hedged when the model is slow.
+        """
+        generation_config = {"temperature": temperature}
+        if json_output:
+            generation_config["response_mime_type"] = "application/json"
+
+        call = LLMCall(self.cascade.primary)
+        failed = set()
+        try:
+            for attempt in range(MAX_RETRIES):
+                models = self.cascade.available(exclude=failed)
+                model = call.model = models[0]
+                hedge_model = None
+                if priority == INTERACTIVE:
+                    hedge_model = models[1] if len(models) > 1 else model
+                if model in failed:
+                    # No other model left, back off before trying it again
+                    await asyncio.sleep(RETRY_DELAY * attempt)
+
+                # Shed requests raise SchedulerOverloaded straight to the caller
+                call.queue_wait += await scheduler.acquire(priority)
+                try:
+                    text = await self._hedged(
+                        lambda name: self._attempt(
+                            name, prompt, generation_config, call, system_instruction
+                        ),
+                        model,
+                        hedge_model,
+                        call,
+                    )
+                    call.mark_first_token()
+                    call.finish("ok")
+                    return text
+                except Exception as e:
+                    if attempt == MAX_RETRIES - 1:  # Last attempt
+                        logger.error(f"Final retry attempt failed: {e}")
+                        raise  # Re-raise the last exception
+                    logger.warning(f"Attempt {attempt + 1} failed: {e}. Retrying...")
+                    failed.add(model)
+                    call.retry()
+        except BaseException as e:
+            call.finish(outcome_of(e))
+            raise
+
+    async def _next_text(self, chunks, call: LLMCall) -> Optional[str]:
+        """Next non-empty chunk text of a stream, or None at its end."""
+        while True:
+            try:
+                chunk = await asyncio.wait_for(chunks.__anext__(), timeout=LLM_TIMEOUT)
+            except StopAsyncIteration:
+                return None
+            except asyncio.TimeoutError:
+                raise TimeoutError(f"LLM stream stalled for {LLM_TIMEOUT}s")
+            call.add_usage(chunk)
+            if chunk.parts:
+                return chunk.text
+
+    async def _open_stream(
+        self,
+        model_name: str,
+        prompt: Prompt,
+        generation_config: Dict[str, Any],
+        call: LLMCall,
+        system_instruction: Optional[str] = None,
+    ) -> Tuple[str, Any]:
+        """Start a stream on one model and wait for its first text chunk.
+
+        A stream without any text counts as a failed attempt, like an empty
+        response to a single request.
+        """
+        started = time.monotonic()
+        self.cascade.begin(model_name)
+        attempt_span = start_span(
+            "llm.attempt",
+            call.span,
+            CLIENT,
+            **{"llm.model": model_name, "llm.stream": True},
+        )
+        try:
+            try:
+                response = await asyncio.wait_for(
+                    self.cascade.model(
+                        model_name, system_instruction
+                    ).generate_content_async(
+                        prompt, generation_config=generation_config, stream=True
+                    ),
+                    timeout=LLM_TIMEOUT,
+                )
+            except asyncio.TimeoutError:
+                raise TimeoutError(
+                    f"LLM stream from {model_name} timed out after {LLM_TIMEOUT}s"
+                )
+            chunks = response.__aiter__()
+            first = await self._next_text(chunks, call)
+            if first is None:
+                raise ValueError(f"LLM stream from {model_name} was empty")
+        except asyncio.CancelledError:
+            self.cascade.abandon(model_name)
+            attempt_span.set_attribute("llm.abandoned", True)
+            raise
+        except Exception as e:
+            self.cascade.record(model_name, ok=False)
+            attempt_span.record_error(e)
+            raise
+        finally:
+            attempt_span.end()
+
+        self.cascade.record(model_name, ok=True)
+        observe_attempt(model_name, time.monotonic() - started, stream=True)
+        return first, chunks
+
+    async def _stream_with_retry(
+        self,
+        prompt: Prompt,
+        temperature: float = 1.5,
+        priority: int = INTERACTIVE,
+        system_instruction: Optional[str] = None,
+    ) -> AsyncIterator[str]:
+        """
+        Stream generated text chunk by chunk, rate limited by the scheduler.
+
+        Opening the stream (up to the first chunk) walks down the model
+        cascade and is hedged like _generate_with_retry; once text has been
+        yielded, failures end the stream. LLM_TIMEOUT applies to the wait for
+        each chunk.
+        """
+        generation_config = {"temperature": temperature}
+
+        call = LLMCall(self.cascade.primary)
+        failed = set()
+        try:
+            for attempt in range(MAX_RETRIES):
+                models = self.cascade.available(exclude=failed)
+                model = call.model = models[0]
+                hedge_model = None
+                if priority == INTERACTIVE:
+                    hedge_model = models[1] if len(models) > 1 else model
+                if model in failed:
+                    await asyncio.sleep(RETRY_DELAY * attempt)
+
+                call.queue_wait += await scheduler.acquire(priority)
+                try:
+                    first, chunks = await self._hedged(
+                        lambda name: self._open_stream(
+                            name, prompt, generation_config, call, system_instruction
+                        ),
+                        model,
+                        hedge_model,
+                        call,
+                        stream=True,
+                    )
+                    break
+                except Exception as e:
+                    if attempt == MAX_RETRIES - 1:
+                        logger.error(f"Final stream attempt failed: {e}")
+                        raise
+                    logger.warning(f"Attempt {attempt + 1} failed: {e}. Retrying...")
+                    failed.add(model)
+                    call.retry()
+
+            text = first
+            while text is not None:
+                call.mark_first_token()
+                yield text
+                try:
+                    text = await self._next_text(chunks, call)
+                except Exception:
+                    self.cascade.record(call.model, ok=False)
+                    raise
+            call.finish("ok")
+        except BaseException as e:
+            call.finish(outcome_of(e))
+            raise
+
+    async def _stream_latest(
+        self, user_id: int, prompt: Prompt, system_instruction: Optional[str] = None
+    ) -> AsyncIterator[str]:
+        """
+        Stream content for a user, cancelling their previous in-flight request.
+
+        Generation runs in its own task feeding a queue, so a newer message
+        can cancel it the same way as _generate_latest.
+
+        Raises:
+            ResponseSuperseded: If a newer request for the same user took over
+        """
+        previous = self._inflight.get(user_id)
+        if previous and not previous.done():
+            self._superseded.add(previous)
+            previous.cancel()
+
+        queue: asyncio.Queue = asyncio.Queue()
+
+        async def produce() -> None:
+            async for chunk in self._stream_with_retry(
+                prompt, system_instruction=system_instruction
+            ):
+                queue.put_nowait(chunk)
+
+        task = asyncio.ensure_future(produce())
+        task.add_done_callback(lambda _: queue.put_nowait(None))
+        self._inflight[user_id] = task
+        try:
+            while True:
+                chunk = await queue.get()
+                if chunk is None:
+                    break
+                yield chunk
+            if task in self._superseded:
+                logger.info(f"Stream for user {user_id} superseded by newer message")
+                raise ResponseSuperseded()
+            task.result()  # Re-raise generation errors
+        finally:
+            task.cancel()
+            self._superseded.discard(task)
+            if self._inflight.get(user_id) is task:
+                del self._inflight[user_id]
+
+    async def _generate_latest(
+        self, user_id: int, prompt: Prompt, system_instruction: Optional[str] = None
+    ) -> Optional[str]:
+        """
+        Generate content for a user, cancelling their previous in-flight request.
+
+        Returns:
+            str: Generated text, or None if a newer request for the same user
+                superseded this one
+        """
+        previous = self._inflight.get(user_id)
+        if previous and not previous.done():
+            self._superseded.add(previous)
+            previous.cancel()
+
+        task = asyncio.ensure_future(
+            self._generate_with_retry(prompt, system_instruction=system_instruction)
+        )
+        self._inflight[user_id] = task
+        try:
+            return await task
+        except asyncio.CancelledError:
+            if task in self._superseded:
+                logger.info(
+                    f"Generation for user {user_id} superseded by newer message"
+                )
+                return None
+            raise
+        finally:
+            self._superseded.discard(task)
+            if self._inflight.get(user_id) is task:
+                del self._inflight[user_id]
+
+    def _chat_context(
+        self, user_name: str, has_active_goal: bool, summary: Optional[str]
+    ) -> str:
+        context = f"You are talking to a user named {user_name}. "
+        context += (
+            "The user has an active gym goal."
+            if has_active_goal
+            else "The user does not have an active gym goal yet."
+        )
+        if summary:
+            context += f"\n\nSummary of the earlier conversation:\n{summary}"
+        return context
+
+    def _chat_contents(
+        self,
+        message: str,
+        user_name: str,
+        has_active_goal: bool,
+        history: Optional[List[Dict[str, Any]]],
+        summary: Optional[str],
+        user_id: Optional[int],
+    ) -> Tuple[List[Dict[str, Any]], Optional[ChatSession]]:
+        """
+        Build the contents for a chat turn.
+
+        An existing session for the user only gets the new message appended;
+        otherwise a session is started from the context and stored history.
+
+        Returns:
+            tuple: (contents to send, the user's session or None)
+        """
+        context = self._chat_context(user_name, has_active_goal, summary)
+        session = self.sessions.get(user_id, context) if user_id is not None else None
+
+        if session is not None:
+            session.add("user", message)
+            contents = session.contents
+        else:
+            turns = list(history or [])
+            # The bot stores the message before asking for a reply
+            if not turns or turns[-1] != {"role": "user", "content": message}:
+                turns.append({"role": "user", "content": message})
+            contents = [
+                {"role": "user", "parts": [context]},
+                {"role": "model", "parts": ["Got it bro! 💪"]},
+            ] + [
+                {
+                    "role": "user" if turn["role"] == "user" else "model",
+                    "parts": [turn["content"]],
+                }
+                for turn in turns
+            ]
+            if user_id is not None:
+                session = self.sessions.start(user_id, context, contents)
 
+        if DEBUG_MODE:
+            logger.info(f"LLM Chat Contents:\n{contents}")
+        return list(contents), session
+
+    @measured
     async def get_response(
         self,
         message: str,
         user_name: str,
         has_active_goal: bool = False,
         history: List[Dict[str, Any]] = None,
-    ) -> str:
-        """Get a response for a normal message."""
+        user_id: int = None,
+        summary: str = None,
+    ) -> Optional[str]:
+        """
+        Get a response for a normal message.
+
+        When user_id is given, the user's chat session is continued and a
+        newer message from the same user cancels this generation (None is
+        returned).
+        """
+        session = None
         try:
-            history_context = self._format_history(history) if history else ""
+            contents, session = self._chat_contents(
+                message, user_name, has_active_goal, history, summary, user_id
+            )
 
-            prompt = f"""You are a gym bro chatbot talking to a user named{user_name}. 
-            Be motivational but also funny and use gym bro slang.
-            Respond in a motivational gym bro style, keep it short and fun. Use emojis.
-            {'The user has an active gym goal.' if has_active_goal else 'The user does not have an active gym goal yet.'}
-            {history_context}
-            
-            User message: {message}
-            Your response:
-            """
+            if user_id is not None:
+                response_text = await self._generate_latest(
+                    user_id, contents, system_instruction=CHAT_PERSONA
+                )
+            else:
+                response_text = await self._generate_with_retry(
+                    contents, system_instruction=CHAT_PERSONA
+                )
+            if session and response_text is not None:
+                session.add("model", response_text)
+            return response_text
+
+        except Exception as e:
+            logger.error(f"Error getting LLM response after all retries: {e}")
+            if session:
+                self.sessions.drop(user_id)
+            record_fallback()
+            return CHAT_FALLBACK
+
+    @measured
+    async def stream_response(
+        self,
+        message: str,
+        user_name: str,
+        user_id: int,
+        has_active_goal: bool = False,
+        history: List[Dict[str, Any]] = None,
+        summary: str = None,
+    ) -> AsyncIterator[str]:
+        """
+        Stream a response for a normal message as text chunks, continuing
+        the user's chat session.
+
+        If generation fails or comes back empty, the fallback message is
+        yielded instead; a failure mid-stream just ends the stream.
 
+        Raises:
+            ResponseSuperseded: If a newer message from the same user took over
+        """
+        contents, session = self._chat_contents(
+            message, user_name, has_active_goal, history, summary, user_id
+        )
+        text = ""
+        try:
+            async for chunk in self._stream_latest(
+                user_id, contents, system_instruction=CHAT_PERSONA
+            ):
+                text += chunk
+                yield chunk
+            session.add("model", text)
+            return
+        except ResponseSuperseded:
+            raise
+        except Exception as e:
+            logger.error(f"Error streaming LLM response: {e}")
+
+        # Rebuild the session from stored history next time
+        self.sessions.drop(user_id)
+        if not text:
+            record_fallback()
+            yield CHAT_FALLBACK
+
+    @measured
+    async def summarize_conversation(
+        self, summary: Optional[str], turns: List[Dict[str, Any]]
+    ) -> Optional[str]:
+        """
+        Fold conversation turns into a running summary at background priority.
+
+        Args:
+            summary (str): Current summary, or None for the first fold
+            turns: Messages to fold in, oldest first
+
+        Returns:
+            str: Updated summary, or None if it could not be generated
+        """
+        prompt = f"""You maintain a running summary of a chat between a gym bro chatbot (ASSISTANT) and a USER.
+            Update the summary with the new messages below.
+            Keep facts that matter for future replies: the user's goals, progress, preferences, injuries, plans and anything they asked to remember.
+            Drop small talk. Write plain sentences, at most {SUMMARY_MAX_CHARS} characters.
+
+            Current summary:
+            {summary or "(none yet)"}
+            {self._format_history(turns)}
+            Updated summary:"""
+
+        try:
             if DEBUG_MODE:
-                logger.info(f"LLM Prompt:\n{prompt}")
+                logger.info(f"LLM Summary Prompt:\n{prompt}")
 
-            response_text = await self._generate_with_retry(prompt)
-            return response_text
+            response_text = await self._generate_with_retry(
+                prompt, temperature=0.2, priority=BACKGROUND
+            )
+            return response_text.strip()[:SUMMARY_MAX_CHARS] or None
 
         except Exception as e:
-            logger.error(f"Error getting LLM response after all retries: {e}")
-            return "Sorry bro, my protein shake must've gone to my head! 🥤 Try again later! 💪"
+            logger.error(f"Error summarizing conversation: {e}")
+            return None
 
+    @measured
     async def get_daily_motivation(
         self,
         user_name: str,
@@ -117,11 +671,12 @@ class LLMService:
             if DEBUG_MODE:
                 logger.info(f"LLM Prompt:\n{prompt}")
 
-            response_text = await self._generate_with_retry(prompt)
+            response_text = await self._generate_with_retry(prompt, priority=BROADCAST)
             return response_text
 
         except Exception as e:
             logger.error(f"Error getting daily motivation after all retries: {e}")
+            record_fallback()
             return "Rise and grind! Time to show those weights who's boss! 💪😤"
 
     # List of gym topics for daily tips
@@ -154,6 +709,7 @@ class LLMService:
         "gym etiquette tips",
     ]
 
+    @measured
     async def get_daily_tip(
         self,
         user_name: str,
@@ -176,9 +732,194 @@ class LLMService:
             if DEBUG_MODE:
                 logger.info(f"LLM Prompt:\n{prompt}")
 
-            response_text = await self._generate_with_retry(prompt, temperature=1.5)
+            response_text = await self._generate_with_retry(
+                prompt, temperature=1.5, priority=BROADCAST
+            )
             return response_text
 
         except Exception as e:
             logger.error(f"Error getting daily tip after all retries: {e}")
+            record_fallback()
             return "Yo bro! Did you know that staying hydrated is key for gains? 💧💪 Keep that water bottle close! 🔥"
+
+    def _parse_batch(self, text: str, count: int) -> Dict[int, str]:
+        """Parse a batched JSON response into {index: message}."""
+        data = json.loads(text)
+        if isinstance(data, dict):
+            data = data.get("messages", [])
+
+        messages = {}
+        for item in data:
+            index = int(item["id"])
+            message = str(item["message"]).strip()
+            if 0 <= index < count and message:
+                messages[index] = message
+        return messages
+
+    async def _generate_batch(self, prompt: str, count: int) -> Dict[int, str]:
+        """Run a batched prompt, returning whatever messages could be parsed."""
+        try:
+            if DEBUG_MODE:
+                logger.info(f"LLM Batch Prompt:\n{prompt}")
+
+            response_text = await self._generate_with_retry(
+                prompt, json_output=True, priority=BROADCAST
+            )
+            return self._parse_batch(response_text, count)
+
+        except Exception as e:
+            logger.error(f"Error getting batched LLM response: {e}")
+            return {}
+
+    @measured
+    async def get_daily_motivations(
+        self, users: List[Dict[str, Any]]
+    ) -> Dict[int, str]:
+        """
+        Get daily motivational messages for many users with one request per batch.
+
+        Args:
+            users: Dicts with user_id, user_name, has_active_goal,
+                current_visits and target_visits
+
+        Returns:
+            dict: Message per user_id
+        """
+        messages = {}
+        for start in range(0, len(users), BATCH_SIZE):
+            batch = users[start : start + BATCH_SIZE]
+            contexts = []
+            for i, user in enumerate(batch):
+                context = {"id": i, "name": user["user_name"]}
+                if user.get("has_active_goal"):
+                    context["goal_progress"] = (
+                        f"{user['current_visits']}/{user['target_visits']} "
+                        f"gym visits this week"
+                    )
+                contexts.append(context)
+
+            prompt = f"""You are a gym bro chatbot generating daily motivational messages for several users.
+            For each user below, generate a short, motivational gym bro style message that will make them want to hit the gym today.
+            Be creative, funny, and use gym bro slang and emojis.
+            Address the user by name and mention their goal progress if they have one.
+            Keep each message under 100 characters if possible and make every message different.
+
+            Users (JSON):
+            {json.dumps(contexts, ensure_ascii=False)}
+
+            Respond with a JSON array containing one object per user with keys "id" and "message"."""
+
+            generated = await self._generate_batch(prompt, len(batch))
+            for i, user in enumerate(batch):
+                if i in generated:
+                    messages[user["user_id"]] = generated[i]
+                else:
+                    # Fall back to a single request for this user
+                    record_fallback("single")
+                    messages[user["user_id"]] = await self.get_daily_motivation(
+                        user_name=user["user_name"],
+                        has_active_goal=user.get("has_active_goal", False),
+                        current_visits=user.get("current_visits", 0),
+                        target_visits=user.get("target_visits", 0),
+                    )
+        return messages
+
+    @measured
+    async def get_daily_tips(self, users: List[Dict[str, Any]]) -> Dict[int, str]:
+        """
+        Get daily gym tips for many users with one request per batch.
+
+        Args:
+            users: Dicts with user_id, user_name and optionally topic
+
+        Returns:
+            dict: Tip per user_id
+        """
+        messages = {}
+        for start in range(0, len(users), BATCH_SIZE):
+            batch = users[start : start + BATCH_SIZE]
+            topics = [
+                user.get("topic") or random.choice(self.GYM_TOPICS) for user in batch
+            ]
+            contexts = [
+                {"id": i, "name": user["user_name"], "topic": topic}
+                for i, (user, topic) in enumerate(zip(batch, topics))
+            ]
+
+            prompt = f"""You're a gym bro with more experience than your friends listed below.
+            For each friend you just learned a cool tip about their topic and you will write them a message about it.
+            Share knowledge in an excited, casual way - like you just discovered this and can't wait to tell them!
+            Use gym bro slang.
+            Make each message feel like a genuine message from a friend, not a professional coach.
+            Each advice MUST be about that friend's topic. DON'T give general fitness advice.
+            Keep each message concise (2-3 sentences max) and use emojis.
+
+            Friends (JSON):
+            {json.dumps(contexts, ensure_ascii=False)}
+
+            Respond with a JSON array containing one object per friend with keys "id" and "message"."""
+
+            generated = await self._generate_batch(prompt, len(batch))
+            for i, (user, topic) in enumerate(zip(batch, topics)):
+                if i in generated:
+                    messages[user["user_id"]] = generated[i]
+                else:
+                    # Fall back to a single request for this user
+                    record_fallback("single")
+                    messages[user["user_id"]] = await self.get_daily_tip(
+                        user_name=user["user_name"], topic=topic
+                    )
+        return messages
+
+    @measured
+    async def generate_pool_entries(
+        self, kind: str, description: str, count: int
+    ) -> List[str]:
+        """
+        Pre-generate reusable tip or motivation templates at background priority.
+
+        Templates use {name} for the user's name; motivation templates may
+        also use {current} and {target} for goal progress.
+
+        Args:
+            kind (str): "tip" or "motivation"
+            description (str): Tip topic, or the goal situation for motivations
+            count (int): Number of templates to generate
+
+        Returns:
+            list: Generated templates (empty on failure)
+        """
+        if kind == "tip":
+            prompt = f"""You're a gym bro with more experience than your friend.
+            Write {count} different messages where you just learned a cool tip about {description} and tell your friend about it.
+            Share knowledge in an excited, casual way - like you just discovered this and can't wait to tell them!
+            Use gym bro slang.
+            Make it feel like a genuine message from a friend, not a professional coach.
+            Every advice MUST be about {description}. DON'T give general fitness advice.
+            Keep each message concise (2-3 sentences max) and use emojis.
+            Write {{name}} wherever the friend's name goes. Make every message teach a different tip.
+
+            Respond with a JSON array of {count} strings."""
+        else:
+            prompt = f"""You are a gym bro chatbot writing daily motivational messages.
+            Situation: {description}
+            Write {count} different short, motivational gym bro style messages that will make the user want to hit the gym today.
+            Be creative, funny, and use gym bro slang and emojis.
+            Keep each under 100 characters if possible.
+            Write {{name}} wherever the user's name goes, and {{current}} and {{target}} for their visits so far and their weekly target.
+
+            Respond with a JSON array of {count} strings."""
+
+        try:
+            if DEBUG_MODE:
+                logger.info(f"LLM Pool Prompt:\n{prompt}")
+
+            response_text = await self._generate_with_retry(
+                prompt, json_output=True, priority=BACKGROUND
+            )
+            data = json.loads(response_text)
+            return [str(text).strip() for text in data if str(text).strip()]
+
+        except Exception as e:
+            logger.error(f"Error generating {kind} pool entries: {e}")
+            return []
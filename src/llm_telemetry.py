@@ -0,0 +1,259 @@
+import os
+import time
+import asyncio
+import inspect
+import logging
+import functools
+import contextvars
+from typing import Optional
+
+from dotenv import load_dotenv
+
+from llm_scheduler import SchedulerOverloaded
+from model_cascade import CircuitOpen
+from metrics import LATENCY_BUCKETS, SIZE_BUCKETS, counter, histogram
+from tracing import CLIENT, start_span
+
+logger = logging.getLogger(__name__)
+
+load_dotenv()
+
+# USD per million tokens, used to estimate spend
+LLM_PRICE_INPUT = float(os.getenv("LLM_PRICE_INPUT", "0.10"))
+LLM_PRICE_OUTPUT = float(os.getenv("LLM_PRICE_OUTPUT", "0.40"))
+
+# Hedge delay used until a model has HEDGE_MIN_SAMPLES observed attempts
+LLM_HEDGE_DELAY = float(os.getenv("LLM_HEDGE_DELAY", "4"))
+HEDGE_MIN_SAMPLES = 20
+HEDGE_MIN_DELAY = 0.5  # seconds
+
+# LLM calls take seconds, not milliseconds
+LLM_LATENCY_BUCKETS = LATENCY_BUCKETS + (20, 30, 60)
+
+call_latency = histogram(
+    "llm_call_seconds",
+    "Total LLM call latency incl. queue and retries",
+    LLM_LATENCY_BUCKETS,
+)
+first_token_latency = histogram(
+    "llm_first_token_seconds",
+    "Latency until the first response text",
+    LLM_LATENCY_BUCKETS,
+)
+call_queue_wait = histogram(
+    "llm_call_queue_wait_seconds", "Scheduler wait per LLM call", LLM_LATENCY_BUCKETS
+)
+attempt_latency = histogram(
+    "llm_attempt_seconds",
+    "Latency of successful single requests (first chunk when streaming)",
+    LLM_LATENCY_BUCKETS,
+)
+prompt_tokens = histogram("llm_prompt_tokens", "Prompt tokens per call", SIZE_BUCKETS)
+response_tokens = histogram(
+    "llm_response_tokens", "Response tokens per call", SIZE_BUCKETS
+)
+calls_total = counter("llm_calls_total", "LLM calls by outcome")
+retries_total = counter("llm_retries_total", "LLM attempts that were retried")
+fallbacks_total = counter("llm_fallbacks_total", "Canned or degraded LLM responses")
+cost_total = counter("llm_cost_usd_total", "Estimated LLM spend in USD")
+hedges_total = counter("llm_hedges_total", "Hedged second requests fired")
+
+# Public LLMService method the current call is made for
+current_method = contextvars.ContextVar("llm_method", default="unknown")
+
+
+def measured(func):
+    """Decorator attributing LLM calls made inside an LLMService method to it.
+
+    Works for coroutines and async generators (streaming methods).
+    """
+    if inspect.isasyncgenfunction(func):
+
+        @functools.wraps(func)
+        async def gen_wrapper(*args, **kwargs):
+            token = current_method.set(func.__name__)
+            try:
+                async for item in func(*args, **kwargs):
+                    yield item
+            finally:
+                try:
+                    current_method.reset(token)
+                except ValueError:
+                    # Closed by the event loop's finalizer in another context
+                    pass
+
+        return gen_wrapper
+
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        token = current_method.set(func.__name__)
+        try:
+            return await func(*args, **kwargs)
+        finally:
+            current_method.reset(token)
+
+    return wrapper
+
+
+def observe_attempt(model: str, seconds: float, stream: bool) -> None:
+    attempt_latency.observe(seconds, model=model, stream=str(stream).lower())
+
+
+def hedge_delay(model: str, stream: bool) -> float:
+    """Seconds to wait for a model before hedging: its observed p95."""
+    labels = {"model": model, "stream": str(stream).lower()}
+    if attempt_latency.count(**labels) < HEDGE_MIN_SAMPLES:
+        return LLM_HEDGE_DELAY
+    return max(HEDGE_MIN_DELAY, attempt_latency.percentile(95, **labels))
+
+
+def outcome_of(error: BaseException) -> str:
+    """Outcome label for a call that ended with the given exception."""
+    if isinstance(error, SchedulerOverloaded):
+        return "shed"
+    if isinstance(error, CircuitOpen):
+        return "circuit_open"
+    if isinstance(error, TimeoutError):
+        return "timeout"
+    if isinstance(error, (asyncio.CancelledError, GeneratorExit)):
+        return "cancelled"
+    return "error"
+
+
+def record_fallback(kind: str = "canned") -> None:
+    """Count a response that did not come from a successful LLM call."""
+    fallbacks_total.inc(method=current_method.get(), kind=kind)
+
+
+class LLMCall:
+    """Measurements of one logical LLM call, across all of its attempts."""
+
+    __slots__ = (
+        "method",
+        "model",
+        "started",
+        "queue_wait",
+        "first_token",
+        "retries",
+        "hedges",
+        "prompt_tokens",
+        "response_tokens",
+        "span",
+    )
+
+    def __init__(self, model: str):
+        self.method = current_method.get()
+        self.model = model
+        self.started = time.monotonic()
+        self.queue_wait = 0.0
+        self.first_token: Optional[float] = None
+        self.retries = 0
+        self.hedges = 0
+        self.prompt_tokens = 0
+        self.response_tokens = 0
+        # Parent of the attempts' spans, which run in their own tasks
+        self.span = start_span("llm.call", kind=CLIENT, **{"llm.method": self.method})
+
+    def mark_first_token(self) -> None:
+        if self.first_token is None:
+            self.first_token = time.monotonic() - self.started
+
+    def hedge(self) -> None:
+        self.hedges += 1
+
+    def retry(self) -> None:
+        self.retries += 1
+
+    def add_usage(self, response) -> None:
+        """Take token counts from a response or the last chunk of a stream."""
+        usage = getattr(response, "usage_metadata", None)
+        if usage:
+            self.prompt_tokens = max(self.prompt_tokens, usage.prompt_token_count or 0)
+            self.response_tokens = max(
+                self.response_tokens, usage.candidates_token_count or 0
+            )
+
+    def finish(self, outcome: str) -> None:
+        """Record the call; outcome is "ok" or one of outcome_of()'s labels."""
+        total = time.monotonic() - self.started
+        labels = {"method": self.method, "model": self.model}
+        calls_total.inc(outcome=outcome, **labels)
+        call_latency.observe(total, **labels)
+        call_queue_wait.observe(self.queue_wait, **labels)
+        if self.retries:
+            retries_total.inc(self.retries, **labels)
+        if self.hedges:
+            hedges_total.inc(self.hedges, **labels)
+        self._end_span(outcome)
+        if outcome != "ok":
+            return
+
+        if self.first_token is not None:
+            first_token_latency.observe(self.first_token, **labels)
+        prompt_tokens.observe(self.prompt_tokens, **labels)
+        response_tokens.observe(self.response_tokens, **labels)
+        cost_total.inc(
+            (
+                self.prompt_tokens * LLM_PRICE_INPUT
+                + self.response_tokens * LLM_PRICE_OUTPUT
+            )
+            / 1_000_000,
+            model=self.model,
+        )
+
+    def _end_span(self, outcome: str) -> None:
+        for key, value in (
+            ("llm.model", self.model),
+            ("llm.outcome", outcome),
+            ("llm.prompt_tokens", self.prompt_tokens),
+            ("llm.response_tokens", self.response_tokens),
+            ("llm.retries", self.retries),
+            ("llm.hedges", self.hedges),
+            ("llm.queue_wait_ms", round(self.queue_wait * 1000, 1)),
+            (
+                "llm.first_token_ms",
+                round(self.first_token * 1000, 1) if self.first_token else None,
+            ),
+        ):
+            self.span.set_attribute(key, value)
+        if outcome not in ("ok", "cancelled"):
+            self.span.record_error(RuntimeError(f"LLM call ended with {outcome}"))
+        self.span.end()
+
+
+def log_llm_summary() -> None:
+    """Log latency, token, retry and fallback figures per method and model."""
+    first_tokens = {
+        (labels["method"], labels["model"]): p50
+        for labels, _, _, p50, _ in first_token_latency.summary()
+    }
+    tokens_in = {
+        (labels["method"], labels["model"]): (count, total)
+        for labels, count, total, _, _ in prompt_tokens.summary()
+    }
+    tokens_out = {
+        (labels["method"], labels["model"]): total
+        for labels, _, total, _, _ in response_tokens.summary()
+    }
+
+    models = set()
+    for labels, count, _, p50, p95 in call_latency.summary():
+        method, model = key = labels["method"], labels["model"]
+        models.add(model)
+        ok_calls, prompt_sum = tokens_in.get(key, (0, 0))
+        per_call = max(ok_calls, 1)
+        ttft = first_tokens.get(key)
+        logger.info(
+            f"LLM {method} ({model}): {count} calls, {ok_calls} ok, "
+            f"latency p50 {p50:.2f}s, p95 {p95:.2f}s, first token p50 "
+            f"{f'{ttft:.2f}s' if ttft is not None else 'n/a'}, "
+            f"avg tokens {prompt_sum / per_call:.0f} in / "
+            f"{tokens_out.get(key, 0) / per_call:.0f} out, "
+            f"retries {retries_total.value(**labels):.0f}, "
+            f"hedges {hedges_total.value(**labels):.0f}, "
+            f"fallbacks {fallbacks_total.value(method=method, kind='canned'):.0f}"
+        )
+
+    spend = sum(cost_total.value(model=model) for model in models)
+    if spend:
+        logger.info(f"LLM estimated spend so far: ${spend:.4f}")
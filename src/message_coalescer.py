@@ -0,0 +1,92 @@
+import os
+import time
+import asyncio
+import logging
+from typing import Dict, List, Optional
+
+from dotenv import load_dotenv
+
+from metrics import counter
+
+logger = logging.getLogger(__name__)
+
+load_dotenv()
+
+# Messages closer together than this are answered as one turn
+COALESCE_WINDOW = float(os.getenv("COALESCE_WINDOW", "1.0"))  # seconds, 0 = off
+# Longest a message waits for more messages from the same user
+COALESCE_MAX_WAIT = float(os.getenv("COALESCE_MAX_WAIT", "4.0"))  # seconds
+
+coalesced_messages = counter(
+    "chat_coalesced_messages_total", "Chat messages merged into a later turn"
+)
+
+
+class _Batch:
+    def __init__(self):
+        self.texts: List[str] = []
+        self.started = time.monotonic()
+
+
+class MessageCoalescer:
+    """Merge messages a user sends in quick succession into one chat turn.
+
+    A message after a quiet period is answered right away. One following
+    within window seconds waits until the user has been quiet for window
+    seconds (at most max_wait); the reply still in flight for the earlier
+    message is then superseded, and the session merges the consecutive user
+    turns. Only the newest message's handler gets the batch; the handlers of
+    the messages folded into it get None and stop.
+    """
+
+    def __init__(
+        self, window: float = COALESCE_WINDOW, max_wait: float = COALESCE_MAX_WAIT
+    ):
+        self.window = window
+        self.max_wait = max_wait
+        self._batches: Dict[int, _Batch] = {}
+        self._last_seen: Dict[int, float] = {}
+
+    async def submit(self, user_id: int, text: str) -> Optional[List[str]]:
+        """
+        Add a message to the user's pending batch and wait for the batch.
+
+        Returns:
+            list: The batch's texts in arrival order, or None if a newer
+                message from the user took the batch over
+        """
+        if self.window <= 0:
+            return [text]
+
+        now = time.monotonic()
+        last_seen = self._last_seen.get(user_id)
+        self._last_seen[user_id] = now
+        batch = self._batches.get(user_id)
+        if batch is None and (last_seen is None or now - last_seen > self.window):
+            self._forget(now)
+            return [text]
+
+        if batch is None:
+            batch = self._batches[user_id] = _Batch()
+        batch.texts.append(text)
+        position = len(batch.texts)
+
+        deadline = batch.started + self.max_wait
+        await asyncio.sleep(max(0.0, min(self.window, deadline - time.monotonic())))
+
+        if self._batches.get(user_id) is not batch or len(batch.texts) != position:
+            return None  # folded into a newer message (or its batch was taken)
+        del self._batches[user_id]
+        if position > 1:
+            coalesced_messages.inc(position - 1)
+            logger.info(f"Merged {position} messages from user {user_id}")
+        return batch.texts
+
+    def _forget(self, now: float) -> None:
+        """Drop users who have been quiet for longer than the window."""
+        if len(self._last_seen) > 1000:
+            self._last_seen = {
+                user_id: seen
+                for user_id, seen in self._last_seen.items()
+                if now - seen <= self.window
+            }
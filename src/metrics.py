@@ -0,0 +1,192 @@
+import logging
+import threading
+from collections import deque
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Default histogram buckets for latencies in seconds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+# Default histogram buckets for sizes (rows, bytes, tokens)
+SIZE_BUCKETS = (1, 10, 100, 1_000, 10_000, 100_000, 1_000_000)
+
+# Recent samples kept per series for percentile estimates
+RESERVOIR_SIZE = 1024
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+def _labels(labels: Dict[str, str]) -> Labels:
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+def _format_labels(labels: Labels, extra: Dict[str, str] = None) -> str:
+    pairs = list(labels) + list((extra or {}).items())
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{key}="{value}"' for key, value in pairs) + "}"
+
+
+class _Series:
+    __slots__ = ("counts", "count", "sum", "recent")
+
+    def __init__(self, buckets: int):
+        self.counts = [0] * buckets
+        self.count = 0
+        self.sum = 0.0
+        self.recent = deque(maxlen=RESERVOIR_SIZE)
+
+
+class Histogram:
+    """Prometheus-style histogram with a reservoir of recent samples per label set."""
+
+    def __init__(self, name: str, description: str, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.description = description
+        self.buckets = tuple(buckets)
+        self._series: Dict[Labels, _Series] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels) -> None:
+        key = _labels(labels)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = _Series(len(self.buckets))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series.counts[i] += 1
+            series.count += 1
+            series.sum += value
+            series.recent.append(value)
+
+    def count(self, **labels) -> int:
+        """Number of observations of one series."""
+        with self._lock:
+            series = self._series.get(_labels(labels))
+            return series.count if series else 0
+
+    def percentile(self, q: float, **labels) -> Optional[float]:
+        """Estimate the q-th percentile (0-100) from recent samples."""
+        with self._lock:
+            series = self._series.get(_labels(labels))
+            samples = sorted(series.recent) if series else []
+        if not samples:
+            return None
+        index = min(len(samples) - 1, int(round(q / 100 * (len(samples) - 1))))
+        return samples[index]
+
+    def summary(self) -> List[Tuple[Dict[str, str], int, float, float, float]]:
+        """Get (labels, count, sum, p50, p95) for every series."""
+        with self._lock:
+            items = [
+                (key, series.count, series.sum, sorted(series.recent))
+                for key, series in self._series.items()
+            ]
+        result = []
+        for key, count, total, samples in items:
+            p50 = samples[int(0.50 * (len(samples) - 1))]
+            p95 = samples[int(0.95 * (len(samples) - 1))]
+            result.append((dict(key), count, total, p50, p95))
+        return result
+
+    def render(self) -> List[str]:
+        lines = [
+            f"# HELP {self.name} {self.description}",
+            f"# TYPE {self.name} histogram",
+        ]
+        with self._lock:
+            for key, series in self._series.items():
+                for bound, count in zip(self.buckets, series.counts):
+                    lines.append(
+                        f"{self.name}_bucket{_format_labels(key, {'le': str(bound)})} {count}"
+                    )
+                lines.append(
+                    f"{self.name}_bucket{_format_labels(key, {'le': '+Inf'})} {series.count}"
+                )
+                lines.append(f"{self.name}_sum{_format_labels(key)} {series.sum}")
+                lines.append(f"{self.name}_count{_format_labels(key)} {series.count}")
+        return lines
+
+
+class Counter:
+    """Prometheus-style monotonically increasing counter."""
+
+    def __init__(self, name: str, description: str):
+        self.name = name
+        self.description = description
+        self._values: Dict[Labels, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = _labels(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        with self._lock:
+            return self._values.get(_labels(labels), 0)
+
+    def render(self) -> List[str]:
+        lines = [
+            f"# HELP {self.name} {self.description}",
+            f"# TYPE {self.name} counter",
+        ]
+        with self._lock:
+            for key, value in self._values.items():
+                lines.append(f"{self.name}{_format_labels(key)} {value}")
+        return lines
+
+
+_registry: Dict[str, object] = {}
+_registry_lock = threading.Lock()
+
+
+def histogram(name: str, description: str, buckets=LATENCY_BUCKETS) -> Histogram:
+    """Get or create a histogram in the process-wide registry."""
+    with _registry_lock:
+        if name not in _registry:
+            _registry[name] = Histogram(name, description, buckets)
+        return _registry[name]
+
+
+def counter(name: str, description: str) -> Counter:
+    """Get or create a counter in the process-wide registry."""
+    with _registry_lock:
+        if name not in _registry:
+            _registry[name] = Counter(name, description)
+        return _registry[name]
+
+
+def render_prometheus() -> str:
+    """Render all registered metrics in the Prometheus text format."""
+    with _registry_lock:
+        metrics = list(_registry.values())
+    lines = []
+    for metric in metrics:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path == "/metrics":
+            self.send_response(200)
+            self.send_header("Content-type", "text/plain; version=0.0.4")
+            self.end_headers()
+            self.wfile.write(render_prometheus().encode())
+        else:
+            self.send_response(404)
+            self.end_headers()
+
+    def log_message(self, format, *args):
+        pass  # Scrapes would flood the log
+
+
+def start_metrics_server(port: int) -> None:
+    """Serve /metrics on the given port from a daemon thread."""
+    server = HTTPServer(("", port), _MetricsHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    logger.info(f"Serving metrics on port {port}")
@@ -0,0 +1,144 @@
+import os
+import time
+import logging
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from dotenv import load_dotenv
+
+from metrics import counter
+
+logger = logging.getLogger(__name__)
+
+load_dotenv()
+
+# Models tried in order; later ones take over while earlier ones are failing
+LLM_MODELS = [
+    name.strip()
+    for name in os.getenv("LLM_MODELS", "gemini-2.0-flash-exp,gemini-1.5-flash").split(
+        ","
+    )
+    if name.strip()
+]
+LLM_BREAKER_FAILURES = int(os.getenv("LLM_BREAKER_FAILURES", "3"))  # to open
+LLM_BREAKER_RESET = float(os.getenv("LLM_BREAKER_RESET", "60"))  # seconds open
+
+breaker_opened = counter("llm_breaker_open_total", "Times a model's circuit opened")
+
+
+class CircuitOpen(Exception):
+    """Raised when every configured model's circuit breaker is open."""
+
+
+class CircuitBreaker:
+    """Consecutive-failure circuit breaker for one model.
+
+    After `failure_threshold` failures in a row the circuit opens and the
+    model is skipped. Once `reset_timeout` has passed, a single probe request
+    is let through (half-open); its result closes or re-opens the circuit.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        failure_threshold: int = LLM_BREAKER_FAILURES,
+        reset_timeout: float = LLM_BREAKER_RESET,
+    ):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self.probing = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half_open"
+        return "open"
+
+    def available(self) -> bool:
+        state = self.state
+        return state == "closed" or (state == "half_open" and not self.probing)
+
+    def begin(self) -> None:
+        """Mark a request as started; in half-open state it is the probe."""
+        if self.state == "half_open":
+            self.probing = True
+
+    def abandon(self) -> None:
+        """A request was cancelled without a result."""
+        self.probing = False
+
+    def record_success(self) -> None:
+        if self.opened_at is not None:
+            logger.info(f"Circuit for {self.name} closed")
+        self.failures = 0
+        self.opened_at = None
+        self.probing = False
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        was_probe, self.probing = self.probing, False
+        if was_probe or (
+            self.opened_at is None and self.failures >= self.failure_threshold
+        ):
+            self.opened_at = time.monotonic()
+            breaker_opened.inc(model=self.name)
+            logger.warning(
+                f"Circuit for {self.name} opened after {self.failures} failures"
+            )
+
+
+class ModelCascade:
+    """Ordered list of models, each behind its own circuit breaker.
+
+    Model clients are created lazily per (name, system instruction), so chat
+    and broadcast prompts share breakers but not clients.
+    """
+
+    def __init__(
+        self,
+        names: Iterable[str],
+        make_model: Callable[[str, Optional[str]], object],
+    ):
+        self.names = list(names)
+        self.make_model = make_model
+        self.breakers = {name: CircuitBreaker(name) for name in self.names}
+        self._models: Dict[Tuple[str, Optional[str]], object] = {}
+
+    @property
+    def primary(self) -> str:
+        return self.names[0]
+
+    def model(self, name: str, system_instruction: Optional[str] = None):
+        """Get the client for a model with the given system instruction."""
+        key = (name, system_instruction)
+        if key not in self._models:
+            self._models[key] = self.make_model(name, system_instruction)
+        return self._models[key]
+
+    def available(self, exclude: Iterable[str] = ()) -> List[str]:
+        """
+        Models that can take a request, in cascade order.
+
+        Raises:
+            CircuitOpen: If every model's circuit is open
+        """
+        healthy = [name for name in self.names if self.breakers[name].available()]
+        if not healthy:
+            raise CircuitOpen("All LLM models are unavailable")
+        return [name for name in healthy if name not in exclude] or healthy
+
+    def begin(self, name: str) -> None:
+        self.breakers[name].begin()
+
+    def abandon(self, name: str) -> None:
+        self.breakers[name].abandon()
+
+    def record(self, name: str, ok: bool) -> None:
+        if ok:
+            self.breakers[name].record_success()
+        else:
+            self.breakers[name].record_failure()
@@ -0,0 +1,54 @@
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, Hashable, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class PhotoCache:
+    """Telegram file_ids of photos already uploaded for the current data.
+
+    Entries are keyed by the data version (e.g. the latest gym_stats
+    timestamp) and the photo's parameters; when the version changes, all
+    entries of the previous version are dropped, since those plots are stale.
+    """
+
+    def __init__(self):
+        self.version: Optional[Hashable] = None
+        self._file_ids: Dict[Hashable, str] = {}
+        self._locks: Dict[Hashable, asyncio.Lock] = {}
+        self._waiters: Dict[Hashable, int] = {}  # tasks holding or awaiting a lock
+
+    @asynccontextmanager
+    async def lock(self, key: Hashable) -> AsyncIterator[None]:
+        """Lock held while a photo is rendered and uploaded, so concurrent
+        requests for it wait and reuse its file_id instead of uploading too.
+
+        A key's lock is dropped once nobody holds or awaits it.
+        """
+        lock = self._locks.setdefault(key, asyncio.Lock())
+        self._waiters[key] = self._waiters.get(key, 0) + 1
+        try:
+            async with lock:
+                yield
+        finally:
+            self._waiters[key] -= 1
+            if not self._waiters[key]:
+                del self._waiters[key]
+                del self._locks[key]
+
+    def get(self, version: Hashable, key: Hashable) -> Optional[str]:
+        if version != self.version:
+            return None
+        return self._file_ids.get(key)
+
+    def put(self, version: Hashable, key: Hashable, file_id: str) -> None:
+        if version != self.version:
+            self.version = version
+            self._file_ids = {}
+        self._file_ids[key] = file_id
+
+    def discard(self, version: Hashable, key: Hashable) -> None:
+        if version == self.version:
+            self._file_ids.pop(key, None)
@@ -0,0 +1,103 @@
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Dict, Hashable
+
+
+class TokenBucket:
+    """Token bucket refilled at a constant rate, usable from asyncio code."""
+
+    def __init__(self, rate: float, capacity: float = 1):
+        """
+        Args:
+            rate (float): Tokens added per second
+            capacity (float): Maximum number of tokens (burst size)
+        """
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def try_acquire(self, tokens: float = 1) -> bool:
+        """Take tokens if available without waiting."""
+        self._refill()
+        if self.tokens >= tokens:
+            self.tokens -= tokens
+            return True
+        return False
+
+    def delay(self, tokens: float = 1) -> float:
+        """Seconds until the given number of tokens will be available."""
+        self._refill()
+        return max(0.0, (tokens - self.tokens) / self.rate)
+
+    async def acquire(self, tokens: float = 1) -> float:
+        """Wait until tokens are available and take them, returning seconds waited."""
+        start = time.monotonic()
+        while not self.try_acquire(tokens):
+            await asyncio.sleep(self.delay(tokens))
+        return time.monotonic() - start
+
+
+class KeyedRateLimiter:
+    """Minimum interval between events for the same key (e.g. per chat).
+
+    Keys are kept in order of last use and dropped from the oldest once
+    their next allowed time has passed, as they no longer delay anything.
+    """
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self._next: "OrderedDict[Hashable, float]" = OrderedDict()
+
+    async def acquire(self, key: Hashable) -> None:
+        now = time.monotonic()
+        while self._next:
+            oldest, ready = next(iter(self._next.items()))
+            if ready > now:
+                break
+            del self._next[oldest]
+
+        ready = max(now, self._next.get(key, 0))
+        self._next[key] = ready + self.interval
+        self._next.move_to_end(key)
+        if ready > now:
+            await asyncio.sleep(ready - now)
+
+
+class KeyedTokenBuckets:
+    """A token bucket per key (e.g. per user), created on first use.
+
+    Buckets that refilled completely are equivalent to new ones, so they are
+    dropped once more than max_keys are tracked.
+    """
+
+    def __init__(self, rate: float, capacity: float, max_keys: int = 10000):
+        self.rate = rate
+        self.capacity = capacity
+        self.max_keys = max_keys
+        self._buckets: Dict[Hashable, TokenBucket] = {}
+
+    def try_acquire(self, key: Hashable, tokens: float = 1) -> bool:
+        """Take tokens from the key's bucket if available without waiting."""
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            if len(self._buckets) >= self.max_keys:
+                self._prune()
+            bucket = self._buckets[key] = TokenBucket(self.rate, self.capacity)
+        return bucket.try_acquire(tokens)
+
+    def delay(self, key: Hashable, tokens: float = 1) -> float:
+        """Seconds until the key's bucket will have the given number of tokens."""
+        bucket = self._buckets.get(key)
+        return bucket.delay(tokens) if bucket else 0.0
+
+    def _prune(self) -> None:
+        for key, bucket in list(self._buckets.items()):
+            if bucket.delay(bucket.capacity) == 0:
+                del self._buckets[key]
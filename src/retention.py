@@ -0,0 +1,161 @@
+import os
+import logging
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+import pytz
+
+logger = logging.getLogger(__name__)
+
+TIMEZONE = pytz.timezone("Europe/Warsaw")
+CLUB_NAME = "Wrocław_Ferio_Gaj"
+
+# Retention settings
+MESSAGE_RETENTION_HOURS = int(os.getenv("MESSAGE_RETENTION_HOURS", "72"))
+BACKUP_RETENTION_DAYS = int(os.getenv("BACKUP_RETENTION_DAYS", "7"))
+RETENTION_BATCH_SIZE = int(os.getenv("RETENTION_BATCH_SIZE", "500"))
+JOB_RUN_RETENTION_DAYS = int(os.getenv("JOB_RUN_RETENTION_DAYS", "30"))
+BROADCAST_RETENTION_DAYS = int(os.getenv("BROADCAST_RETENTION_DAYS", "14"))
+ROLLUP_RAW_RESPONSES = os.getenv("ROLLUP_RAW_RESPONSES", "true").lower() == "true"
+
+
+def purge_expired(
+    storage,
+    table: str,
+    column: str,
+    cutoff: datetime,
+    batch_size: int = RETENTION_BATCH_SIZE,
+    columns: str = "id",
+    before_delete: Optional[Callable[[List[Dict[str, Any]]], None]] = None,
+) -> int:
+    """
+    Delete rows older than cutoff in batches of at most batch_size rows.
+
+    Each batch is selected by id and deleted with a separate statement, so
+    no single delete touches more than batch_size rows.
+
+    Returns:
+        int: Number of rows deleted
+    """
+    deleted = 0
+    while True:
+        rows = storage.get_rows_before(table, column, cutoff, batch_size, columns)
+        if not rows:
+            break
+
+        if before_delete:
+            before_delete(rows)
+
+        storage.delete_rows(table, [row["id"] for row in rows])
+        deleted += len(rows)
+
+        if len(rows) < batch_size:
+            break
+
+    return deleted
+
+
+def _member_count(response: Dict[str, Any]) -> Optional[int]:
+    """Extract the Ferio Gaj member count from a raw API response."""
+    for club in response.get("UsersInClubList", []):
+        if "ferio gaj" in str(club.get("ClubName", "")).lower():
+            try:
+                return int(club["UsersCountCurrentlyInClub"])
+            except (KeyError, TypeError, ValueError):
+                return None
+    return None
+
+
+def rollup_raw_responses(storage, rows: List[Dict[str, Any]]) -> int:
+    """
+    Make sure every raw response has a matching gym_stats row.
+
+    Raw responses whose sample never made it into gym_stats (e.g. because the
+    stats insert failed) are converted and inserted before the raw data is lost.
+
+    Returns:
+        int: Number of gym_stats rows inserted
+    """
+    # Rows come ordered by timestamp
+    existing = {
+        datetime.fromisoformat(row["timestamp"]).timestamp()
+        for row in storage.get_stats_between(rows[0]["timestamp"], rows[-1]["timestamp"])
+    }
+
+    missing = []
+    for row in rows:
+        if datetime.fromisoformat(row["timestamp"]).timestamp() in existing:
+            continue
+        count = _member_count(row["response"])
+        if count is not None:
+            missing.append({"timestamp": row["timestamp"], CLUB_NAME: count})
+
+    if missing:
+        storage.insert_stats(missing)
+        logger.info(f"Rolled up {len(missing)} raw responses into gym_stats")
+    return len(missing)
+
+
+def purge_messages(storage, hours: int = MESSAGE_RETENTION_HOURS) -> int:
+    """Delete chat messages older than the given number of hours."""
+    cutoff = datetime.now(TIMEZONE) - timedelta(hours=hours)
+    return purge_expired(storage, "messages", "created_at", cutoff)
+
+
+def purge_raw_responses(
+    storage, days: int = BACKUP_RETENTION_DAYS, rollup: bool = ROLLUP_RAW_RESPONSES
+) -> int:
+    """Delete raw API responses older than the given number of days."""
+    cutoff = datetime.now(TIMEZONE) - timedelta(days=days)
+    return purge_expired(
+        storage,
+        "raw_responses",
+        "timestamp",
+        cutoff,
+        columns="id, timestamp, response" if rollup else "id",
+        before_delete=(lambda rows: rollup_raw_responses(storage, rows))
+        if rollup
+        else None,
+    )
+
+
+def purge_job_runs(storage, days: int = JOB_RUN_RETENTION_DAYS) -> int:
+    """Delete scheduled job run records older than the given number of days."""
+    cutoff = datetime.now(TIMEZONE) - timedelta(days=days)
+    return purge_expired(storage, "job_runs", "scheduled_for", cutoff)
+
+
+def purge_broadcast_deliveries(storage, days: int = BROADCAST_RETENTION_DAYS) -> int:
+    """Delete broadcast delivery records older than the given number of days."""
+    cutoff = datetime.now(TIMEZONE) - timedelta(days=days)
+    return purge_expired(storage, "broadcast_deliveries", "delivered_at", cutoff)
+
+
+RETENTION_TASKS = {
+    "messages": purge_messages,
+    "raw_responses": purge_raw_responses,
+    "job_runs": purge_job_runs,
+    "broadcast_deliveries": purge_broadcast_deliveries,
+}
+
+
+def run_retention(storage, tables: Iterable[str] = RETENTION_TASKS) -> Dict[str, int]:
+    """
+    Run retention for the given tables.
+
+    Returns:
+        dict: Rows reclaimed per table (-1 if the table failed)
+    """
+    report = {}
+    for table in tables:
+        try:
+            report[table] = RETENTION_TASKS[table](storage)
+        except Exception as e:
+            logger.error(f"Error running retention for {table}: {e}")
+            report[table] = -1
+
+    logger.info(
+        "Retention run reclaimed: "
+        + ", ".join(f"{table}={rows}" for table, rows in report.items())
+    )
+    return report
@@ -10,7 +10,13 @@ from api_request import login, get_members_in_clubs
 import threading
 from http.server import HTTPServer, BaseHTTPRequestHandler
 import socket
-from supabase import create_client, Client
+from retention import run_retention
+from storage import get_storage
+from instrumentation import track
+from tracing import init_tracing, trace, traced
+from metrics import render_prometheus
+from gym_stats import GymStats
+from status_snapshot import STATUS_SOCKET, SnapshotPublisher, build_snapshot
 
 
 # Health Check Server
@@ -26,6 +32,11 @@ class HealthCheckHandler(BaseHTTPRequestHandler):
                 "hostname": socket.gethostname(),
             }
             self.wfile.write(json.dumps(health_status).encode())
+        elif self.path == "/metrics":
+            self.send_response(200)
+            self.send_header("Content-type", "text/plain; version=0.0.4")
+            self.end_headers()
+            self.wfile.write(render_prometheus().encode())
         else:
             self.send_response(404)
             self.end_headers()
@@ -65,6 +76,7 @@ def validate_member_count(count):
         return False
 
 
+@traced()
 def gather_data(max_retries=3, initial_delay=60):
     """Gather data using session-based authentication with retry mechanism"""
     try:
@@ -114,6 +126,7 @@ def gather_data(max_retries=3, initial_delay=60):
         return None
 
 
+@traced()
 def process_data(data):
     """Process the gathered data into format for gym_stats table"""
     try:
@@ -156,8 +169,9 @@ def process_data(data):
         raise
 
 
-def save_to_supabase(stats_data, raw_data):
-    """Save both processed stats and raw data to Supabase"""
+@traced()
+def save_to_storage(stats_data, raw_data):
+    """Save both processed stats and raw data to storage"""
     try:
         # Validate data before saving
         if not isinstance(stats_data, dict):
@@ -170,33 +184,40 @@ def save_to_supabase(stats_data, raw_data):
             raise ValueError("raw_data must be a dictionary")
 
         # Save processed stats
-        supabase.table("gym_stats").insert(stats_data).execute()
-        logger.info("Saved processed stats to Supabase")
+        storage.insert_stats(stats_data)
+        logger.info("Saved processed stats to storage")
 
         # Save raw response
         raw_entry = {"timestamp": stats_data["timestamp"], "response": raw_data}
-        supabase.table("raw_responses").insert(raw_entry).execute()
-        logger.info("Saved raw response to Supabase")
+        storage.insert_raw_response(raw_entry)
+        logger.info("Saved raw response to storage")
     except Exception as e:
-        logger.error(f"Error saving to Supabase: {str(e)}")
+        logger.error(f"Error saving to storage: {str(e)}")
         raise
 
 
 # Load environment variables
 load_dotenv()
-SUPABASE_URL = os.getenv("SUPABASE_URL")
-SUPABASE_KEY = os.getenv("SUPABASE_KEY")
 
-if not SUPABASE_URL or not SUPABASE_KEY:
-    raise ValueError("Missing Supabase credentials in environment variables")
+# Initialize storage backend (Supabase or SQLite, see STORAGE_BACKEND)
+storage = get_storage()
 
-# Initialize Supabase client
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
+
+@traced()
+def publish_snapshot(publisher: SnapshotPublisher, stats: GymStats) -> None:
+    """Precompute the bot's status answers for the newest sample and push them"""
+    try:
+        snapshot = build_snapshot(stats)
+        if snapshot:
+            publisher.publish(snapshot)
+    except Exception as e:
+        logger.error(f"Error publishing status snapshot: {str(e)}")
 
 
 # Main function to run the scraper
 if __name__ == "__main__":
     logger.info("Starting WellFitness Scraper")
+    init_tracing("gym-scraper")
 
     # Start health check server in a separate thread
     health_thread = threading.Thread(target=run_health_check_server, daemon=True)
@@ -204,18 +225,35 @@ if __name__ == "__main__":
 
     # Get environment variables with defaults
     SCRAPE_INTERVAL = int(os.getenv("SCRAPE_INTERVAL", "600"))  # 10 minutes default
+    RETENTION_INTERVAL = int(os.getenv("RETENTION_INTERVAL", "86400"))  # daily
 
     # Log startup configuration
     logger.info(f"Starting scraper with interval: {SCRAPE_INTERVAL} seconds")
 
+    # Push a status snapshot to the bot after every new sample
+    publisher = None
+    if STATUS_SOCKET:
+        publisher = SnapshotPublisher(STATUS_SOCKET)
+        publisher.start()
+        stats = GymStats(processed_dir="processed", storage=storage)
+
+    last_retention = 0
     while True:
         try:
-            data = gather_data()
-            if data:
-                stats_data = process_data(data)
-                save_to_supabase(stats_data, data)
-            else:
-                logger.warning("No data collected in this cycle")
+            with track("scrape_cycle"), trace("scrape_cycle"):
+                # Drop expired raw responses (rolled up into gym_stats first)
+                if time.time() - last_retention >= RETENTION_INTERVAL:
+                    run_retention(storage, ["raw_responses"])
+                    last_retention = time.time()
+
+                data = gather_data()
+                if data:
+                    stats_data = process_data(data)
+                    save_to_storage(stats_data, data)
+                    if publisher:
+                        publish_snapshot(publisher, stats)
+                else:
+                    logger.warning("No data collected in this cycle")
 
             time.sleep(SCRAPE_INTERVAL)
 
@@ -0,0 +1,76 @@
+import time
+import logging
+import importlib
+import threading
+from types import ModuleType
+from typing import Any, Callable, Dict
+
+logger = logging.getLogger(__name__)
+
+# Seconds spent per startup phase, and per deferred import or service
+startup_times: Dict[str, float] = {}
+lazy_times: Dict[str, float] = {}
+_last_mark = time.perf_counter()
+
+
+def mark_startup(phase: str) -> None:
+    """Record the time since the previous mark (or this module's import)."""
+    global _last_mark
+    now = time.perf_counter()
+    startup_times[phase] = now - _last_mark
+    _last_mark = now
+
+
+def timed_import(module: str) -> ModuleType:
+    """Import a module, recording the time if it wasn't imported before."""
+    started = time.perf_counter()
+    imported = importlib.import_module(module)
+    elapsed = time.perf_counter() - started
+    if elapsed >= 0.001:
+        lazy_times[f"import {module}"] = elapsed
+    return imported
+
+
+def log_startup_times() -> None:
+    """Log the startup phases in order, then the deferred work done so far."""
+    lines = [f"Startup took {sum(startup_times.values()):.2f}s:"]
+    for name, seconds in startup_times.items():
+        lines.append(f"  {name}: {seconds * 1000:.0f} ms")
+    if lazy_times:
+        lines.append("Initialized on first use (included in the phase that used it):")
+        for name, seconds in lazy_times.items():
+            lines.append(f"  {name}: {seconds * 1000:.0f} ms")
+    logger.info("\n".join(lines))
+
+
+class LazyService:
+    """Proxy creating a shared service on first attribute access.
+
+    Heavy imports belong in the factory (see timed_import), so they are paid
+    by the first request that needs the service instead of by every restart.
+    """
+
+    def __init__(self, name: str, factory: Callable[[], Any]):
+        self._name = name
+        self._factory = factory
+        self._instance = None
+        self._lock = threading.Lock()
+
+    @property
+    def initialized(self) -> bool:
+        return self._instance is not None
+
+    def get(self) -> Any:
+        if self._instance is None:
+            # Services are also used from worker threads (asyncio.to_thread)
+            with self._lock:
+                if self._instance is None:
+                    started = time.perf_counter()
+                    self._instance = self._factory()
+                    elapsed = time.perf_counter() - started
+                    lazy_times[f"service {self._name}"] = elapsed
+                    logger.info(f"Initialized {self._name} in {elapsed:.2f}s")
+        return self._instance
+
+    def __getattr__(self, attr: str) -> Any:
+        return getattr(self.get(), attr)
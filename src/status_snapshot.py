@@ -0,0 +1,249 @@
+import os
+import json
+import time
+import base64
+import socket
+import struct
+import asyncio
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional
+
+from dotenv import load_dotenv
+
+logger = logging.getLogger(__name__)
+
+load_dotenv()
+
+# Unix socket the scraper publishes snapshots on (empty disables publishing)
+STATUS_SOCKET = os.getenv("STATUS_SOCKET", "/tmp/gym-status.sock")
+# Snapshots older than this are ignored and /status is computed on demand
+SNAPSHOT_MAX_AGE = int(os.getenv("SNAPSHOT_MAX_AGE", "1800"))  # seconds
+
+# Resampling interval of the plots pre-rendered for /status <days>
+PLOT_INTERVALS = {
+    1: "20min",
+    2: "30min",
+    3: "40min",
+    4: "60min",
+}
+
+MAX_WINDOW_DAYS = 14
+TREND_WINDOW = timedelta(hours=1)
+SEND_TIMEOUT = 5  # seconds before a stuck subscriber is dropped
+RECONNECT_DELAY = 5  # seconds, doubled up to MAX_RECONNECT_DELAY
+MAX_RECONNECT_DELAY = 60
+
+_HEADER = struct.Struct(">I")
+
+
+def _parse_timestamp(value) -> datetime:
+    """Naive UTC datetime from a stored timestamp."""
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def build_snapshot(stats) -> Optional[Dict[str, Any]]:
+    """
+    Precompute everything /status and /latestdata show.
+
+    Args:
+        stats (GymStats): Stats service of the ingest process
+
+    Returns:
+        dict: Snapshot, or None if there is no data yet
+    """
+    cutoff = datetime.now() - timedelta(days=MAX_WINDOW_DAYS)
+    rows = [
+        row
+        for row in stats.storage.get_stats_between(cutoff)
+        if row.get(stats.club_name) is not None
+    ]
+    if not rows:
+        return None
+
+    points = sorted(
+        ((_parse_timestamp(row["timestamp"]), row) for row in rows),
+        key=lambda point: point[0],
+    )
+    latest_at, latest = points[-1]
+    current = latest[stats.club_name]
+
+    def window_max(days: int) -> int:
+        since = latest_at - timedelta(days=days)
+        return max(row[stats.club_name] for at, row in points if at >= since)
+
+    # Change against the last sample at least an hour old (if not much older)
+    trend = None
+    earlier = [
+        row
+        for at, row in points
+        if latest_at - 2 * TREND_WINDOW <= at <= latest_at - TREND_WINDOW
+    ]
+    if earlier:
+        trend = current - earlier[-1][stats.club_name]
+
+    plots = {}
+    for days, interval in PLOT_INTERVALS.items():
+        try:
+            plot = stats.create_time_series_plot(hours=24 * days, interval=interval)
+            plots[days] = plot.getvalue()
+        except Exception as e:
+            logger.error(f"Error rendering {days} day plot for snapshot: {e}")
+
+    return {
+        "timestamp": str(latest["timestamp"]),
+        "published_at": time.time(),
+        "current": int(current),
+        "max_1d": int(window_max(1)),
+        "max_7d": int(window_max(7)),
+        "max_14d": int(window_max(MAX_WINDOW_DAYS)),
+        "trend": trend,
+        "plots": plots,
+    }
+
+
+def encode_snapshot(snapshot: Dict[str, Any]) -> bytes:
+    """Length-prefixed JSON frame, plots base64 encoded."""
+    payload = dict(snapshot)
+    payload["plots"] = {
+        str(days): base64.b64encode(png).decode("ascii")
+        for days, png in snapshot["plots"].items()
+    }
+    data = json.dumps(payload).encode("utf-8")
+    return _HEADER.pack(len(data)) + data
+
+
+def decode_snapshot(data: bytes) -> Dict[str, Any]:
+    snapshot = json.loads(data)
+    snapshot["plots"] = {
+        int(days): base64.b64decode(png) for days, png in snapshot["plots"].items()
+    }
+    return snapshot
+
+
+class SnapshotPublisher:
+    """Push snapshots to every connected subscriber over a Unix socket.
+
+    Runs in the (synchronous) scraper process: an accept thread registers
+    subscribers and sends them the latest snapshot right away, publish()
+    sends each new one to all of them in parallel. Sends happen outside the
+    lock, so a stuck subscriber only delays publish() by SEND_TIMEOUT and
+    is then dropped.
+    """
+
+    def __init__(self, path: str = STATUS_SOCKET):
+        self.path = path
+        self._clients: List[socket.socket] = []
+        self._frame: Optional[bytes] = None
+        self._lock = threading.Lock()
+
+    def start(self) -> None:
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        server.bind(self.path)
+        server.listen()
+        threading.Thread(target=self._accept, args=(server,), daemon=True).start()
+        logger.info(f"Publishing status snapshots on {self.path}")
+
+    def _accept(self, server: socket.socket) -> None:
+        while True:
+            conn, _ = server.accept()
+            conn.settimeout(SEND_TIMEOUT)
+            if self._subscribe(conn):
+                logger.info("Status snapshot subscriber connected")
+
+    def _subscribe(self, conn: socket.socket) -> bool:
+        """Send the latest frame (again if a newer one was published
+        meanwhile), then register the subscriber."""
+        sent = None
+        while True:
+            with self._lock:
+                if self._frame is sent:
+                    self._clients.append(conn)
+                    return True
+                sent = self._frame
+            if not self._send(conn, sent):
+                return False
+
+    def _send(self, conn: socket.socket, frame: bytes) -> bool:
+        try:
+            conn.sendall(frame)
+            return True
+        except OSError as e:
+            logger.warning(f"Dropping status snapshot subscriber: {e}")
+            conn.close()
+            return False
+
+    def publish(self, snapshot: Dict[str, Any]) -> None:
+        frame = encode_snapshot(snapshot)
+        with self._lock:
+            self._frame = frame
+            clients = list(self._clients)
+
+        sent = []
+        if clients:
+            with ThreadPoolExecutor(max_workers=len(clients)) as pool:
+                sent = list(pool.map(lambda conn: self._send(conn, frame), clients))
+        failed = {conn for conn, ok in zip(clients, sent) if not ok}
+        with self._lock:
+            self._clients = [c for c in self._clients if c not in failed]
+        logger.info(
+            f"Published status snapshot {snapshot['timestamp']} "
+            f"({len(frame) // 1024} KiB) to {len(clients) - len(failed)} subscribers"
+        )
+
+
+class SnapshotSubscriber:
+    """Keep the latest snapshot published by the scraper in memory.
+
+    run() reconnects with backoff whenever the publisher goes away; until a
+    fresh snapshot arrives, latest() returns None and callers compute the
+    status on demand.
+    """
+
+    def __init__(self, path: str = STATUS_SOCKET, max_age: float = SNAPSHOT_MAX_AGE):
+        self.path = path
+        self.max_age = max_age
+        self.snapshot: Optional[Dict[str, Any]] = None
+
+    def latest(self) -> Optional[Dict[str, Any]]:
+        """The latest snapshot, or None if there is none or it is stale."""
+        snapshot = self.snapshot
+        if snapshot and time.time() - snapshot["published_at"] <= self.max_age:
+            return snapshot
+        return None
+
+    async def run(self) -> None:
+        delay = RECONNECT_DELAY
+        while True:
+            try:
+                reader, writer = await asyncio.open_unix_connection(self.path)
+            except OSError as e:
+                logger.debug(f"Status snapshot publisher not available: {e}")
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, MAX_RECONNECT_DELAY)
+                continue
+
+            logger.info(f"Subscribed to status snapshots on {self.path}")
+            delay = RECONNECT_DELAY
+            try:
+                while True:
+                    header = await reader.readexactly(_HEADER.size)
+                    (length,) = _HEADER.unpack(header)
+                    self.snapshot = decode_snapshot(await reader.readexactly(length))
+                    logger.info(
+                        f"Received status snapshot {self.snapshot['timestamp']}"
+                    )
+            except (asyncio.IncompleteReadError, OSError, ValueError) as e:
+                logger.warning(f"Status snapshot stream ended: {e}")
+            finally:
+                writer.close()
+            await asyncio.sleep(delay)
@@ -0,0 +1,914 @@
+import os
+import json
+import logging
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Set, Union
+
+from dotenv import load_dotenv
+
+from instrumentation import InstrumentedStorage
+
+logger = logging.getLogger(__name__)
+
+load_dotenv()
+
+Row = Dict[str, Any]
+Timestamp = Union[str, datetime]
+
+
+class Storage(ABC):
+    """Persistence interface for goals, bans, messages, stats and raw responses."""
+
+    # Goals
+    @abstractmethod
+    def insert_goal(self, data: Row) -> None:
+        """Insert a new goal."""
+
+    @abstractmethod
+    def get_active_goal(self, user_id: int) -> Optional[Row]:
+        """Get the user's active goal if exists."""
+
+    @abstractmethod
+    def get_active_goals(self, user_ids: List[int]) -> List[Row]:
+        """Get the active goals of the given users."""
+
+    @abstractmethod
+    def update_goal(self, goal_id: int, fields: Row) -> None:
+        """Update fields of a goal."""
+
+    @abstractmethod
+    def get_expired_goals(self, before: Timestamp) -> List[Row]:
+        """Get active goals whose end date is before the given time."""
+
+    @abstractmethod
+    def get_goal_users(self) -> List[Row]:
+        """Get user_id and user_name of every goal ever created."""
+
+    # Bans
+    @abstractmethod
+    def insert_ban(self, data: Row) -> None:
+        """Insert a new ban record."""
+
+    @abstractmethod
+    def get_active_bans(self, now: Timestamp) -> List[Row]:
+        """Get bans whose unban date is after the given time."""
+
+    # Users
+    @abstractmethod
+    def get_users(self, updated_since: Optional[Timestamp] = None) -> List[Row]:
+        """Get all registered users, or those updated after updated_since."""
+
+    @abstractmethod
+    def get_user(self, user_id: int) -> Optional[Row]:
+        """Get a registered user, if any."""
+
+    @abstractmethod
+    def upsert_users(self, rows: List[Row]) -> None:
+        """Insert or update users by user_id, stamping updated_at."""
+
+    @abstractmethod
+    def update_user(self, user_id: int, fields: Row) -> None:
+        """Update only the given columns of a user, stamping updated_at."""
+
+    # Messages
+    @abstractmethod
+    def insert_messages(self, rows: List[Row]) -> None:
+        """Insert a batch of messages."""
+
+    @abstractmethod
+    def get_messages(self, user_id: int, since: Timestamp, limit: int) -> List[Row]:
+        """Get the user's newest messages since the given time, newest first."""
+
+    # Conversation summaries
+    @abstractmethod
+    def get_summary(self, user_id: int) -> Optional[Row]:
+        """Get the user's running conversation summary, if any."""
+
+    @abstractmethod
+    def upsert_summary(self, row: Row) -> None:
+        """Insert or update a conversation summary by user_id."""
+
+    # Stats
+    @abstractmethod
+    def insert_stats(self, rows: Union[Row, List[Row]]) -> None:
+        """Insert one or more gym_stats rows."""
+
+    @abstractmethod
+    def get_latest_stats(self) -> Optional[Row]:
+        """Get the most recent gym_stats row."""
+
+    @abstractmethod
+    def get_stats_between(
+        self, start: Timestamp, end: Optional[Timestamp] = None
+    ) -> List[Row]:
+        """Get gym_stats rows in the given time range, oldest first."""
+
+    # Raw responses
+    @abstractmethod
+    def insert_raw_response(self, data: Row) -> None:
+        """Insert a raw API response."""
+
+    # Broadcasts
+    @abstractmethod
+    def get_delivered_users(self, run_id: str) -> Set[int]:
+        """Get ids of users a broadcast run was already delivered to."""
+
+    @abstractmethod
+    def mark_delivered(self, run_id: str, user_id: int) -> None:
+        """Record that a broadcast run was delivered to a user."""
+
+    # Content pool
+    @abstractmethod
+    def get_pool_entries(self) -> List[Row]:
+        """Get all pre-generated content pool entries."""
+
+    @abstractmethod
+    def insert_pool_entries(self, rows: List[Row]) -> List[Row]:
+        """Insert content pool entries, returning them with their ids."""
+
+    @abstractmethod
+    def get_pool_deliveries(self) -> List[Row]:
+        """Get (entry_id, user_id) of every pool entry sent to a user."""
+
+    @abstractmethod
+    def insert_pool_deliveries(self, rows: List[Row]) -> None:
+        """Record pool entries sent to users."""
+
+    # Scheduled job runs
+    @abstractmethod
+    def get_job_runs(self, since: Timestamp) -> List[Row]:
+        """Get runs of jobs scheduled at or after the given time."""
+
+    @abstractmethod
+    def claim_job_run(
+        self,
+        job: str,
+        scheduled_for: Timestamp,
+        owner: str,
+        attempts: int,
+        lease_until: Timestamp,
+        now: Timestamp,
+    ) -> bool:
+        """Start a job run whose previous attempt count is attempts (0 if it never
+        ran, or was only released). False if it is done, leased or was claimed by
+        another owner."""
+
+    @abstractmethod
+    def renew_job_lease(
+        self, job: str, scheduled_for: Timestamp, owner: str, lease_until: Timestamp
+    ) -> bool:
+        """Extend the lease of a running job run. False if the owner lost it."""
+
+    @abstractmethod
+    def finish_job_run(
+        self, job: str, scheduled_for: Timestamp, owner: str, fields: Row
+    ) -> None:
+        """Record the outcome of a job run held by the owner."""
+
+    # Retention
+    @abstractmethod
+    def get_rows_before(
+        self, table: str, column: str, before: Timestamp, limit: int, columns: str = "*"
+    ) -> List[Row]:
+        """Get up to limit rows of a table older than the given time, oldest first."""
+
+    @abstractmethod
+    def delete_rows(self, table: str, ids: List[int]) -> None:
+        """Delete rows of a table by id."""
+
+
+def _iso(value: Timestamp) -> str:
+    return value.isoformat() if isinstance(value, datetime) else value
+
+
+class SupabaseStorage(Storage):
+    """Storage backed by a Supabase (Postgres) project."""
+
+    def __init__(self, url: str = None, key: str = None):
+        url = url or os.getenv("SUPABASE_URL")
+        key = key or os.getenv("SUPABASE_KEY")
+        if not url or not key:
+            raise ValueError("Missing Supabase credentials")
+        # Imported here so the SQLite backend doesn't pay for the client library
+        from supabase import create_client
+
+        self.client = create_client(url, key)
+
+    def insert_goal(self, data: Row) -> None:
+        self.client.table("goals").insert(data).execute()
+
+    def get_active_goal(self, user_id: int) -> Optional[Row]:
+        response = (
+            self.client.table("goals")
+            .select("*")
+            .eq("user_id", user_id)
+            .eq("status", "active")
+            .execute()
+        )
+        return response.data[0] if response.data else None
+
+    def get_active_goals(self, user_ids: List[int]) -> List[Row]:
+        response = (
+            self.client.table("goals")
+            .select("*")
+            .in_("user_id", user_ids)
+            .eq("status", "active")
+            .execute()
+        )
+        return response.data
+
+    def update_goal(self, goal_id: int, fields: Row) -> None:
+        self.client.table("goals").update(fields).eq("id", goal_id).execute()
+
+    def get_expired_goals(self, before: Timestamp) -> List[Row]:
+        response = (
+            self.client.table("goals")
+            .select("*")
+            .eq("status", "active")
+            .lt("end_date", _iso(before))
+            .execute()
+        )
+        return response.data
+
+    def get_goal_users(self) -> List[Row]:
+        return self.client.table("goals").select("user_id, user_name").execute().data
+
+    def insert_ban(self, data: Row) -> None:
+        self.client.table("bans").insert(data).execute()
+
+    def get_active_bans(self, now: Timestamp) -> List[Row]:
+        response = (
+            self.client.table("bans").select("*").gt("unban_date", _iso(now)).execute()
+        )
+        return response.data
+
+    def get_users(self, updated_since: Optional[Timestamp] = None) -> List[Row]:
+        query = self.client.table("users").select("*")
+        if updated_since is not None:
+            query = query.gt("updated_at", _iso(updated_since))
+        return query.execute().data
+
+    def get_user(self, user_id: int) -> Optional[Row]:
+        response = (
+            self.client.table("users").select("*").eq("user_id", user_id).execute()
+        )
+        return response.data[0] if response.data else None
+
+    def upsert_users(self, rows: List[Row]) -> None:
+        now = datetime.now(timezone.utc).isoformat()
+        rows = [{**row, "updated_at": now} for row in rows]
+        self.client.table("users").upsert(rows, on_conflict="user_id").execute()
+
+    def update_user(self, user_id: int, fields: Row) -> None:
+        fields = {column: _iso(value) for column, value in fields.items()}
+        fields["updated_at"] = datetime.now(timezone.utc).isoformat()
+        self.client.table("users").update(fields).eq("user_id", user_id).execute()
+
+    def insert_messages(self, rows: List[Row]) -> None:
+        self.client.table("messages").insert(rows).execute()
+
+    def get_summary(self, user_id: int) -> Optional[Row]:
+        response = (
+            self.client.table("conversation_summaries")
+            .select("*")
+            .eq("user_id", user_id)
+            .execute()
+        )
+        return response.data[0] if response.data else None
+
+    def upsert_summary(self, row: Row) -> None:
+        self.client.table("conversation_summaries").upsert(
+            row, on_conflict="user_id"
+        ).execute()
+
+    def get_messages(self, user_id: int, since: Timestamp, limit: int) -> List[Row]:
+        response = (
+            self.client.table("messages")
+            .select("role", "content", "created_at")
+            .eq("user_id", user_id)
+            .gte("created_at", _iso(since))
+            .order("created_at", desc=True)
+            .limit(limit)
+            .execute()
+        )
+        return response.data
+
+    def insert_stats(self, rows: Union[Row, List[Row]]) -> None:
+        self.client.table("gym_stats").insert(rows).execute()
+
+    def get_latest_stats(self) -> Optional[Row]:
+        response = (
+            self.client.table("gym_stats")
+            .select("*")
+            .order("timestamp", desc=True)
+            .limit(1)
+            .execute()
+        )
+        return response.data[0] if response.data else None
+
+    def get_stats_between(
+        self, start: Timestamp, end: Optional[Timestamp] = None
+    ) -> List[Row]:
+        query = self.client.table("gym_stats").select("*").gte("timestamp", _iso(start))
+        if end is not None:
+            query = query.lte("timestamp", _iso(end))
+        return query.order("timestamp").execute().data
+
+    def insert_raw_response(self, data: Row) -> None:
+        self.client.table("raw_responses").insert(data).execute()
+
+    def get_delivered_users(self, run_id: str) -> Set[int]:
+        response = (
+            self.client.table("broadcast_deliveries")
+            .select("user_id")
+            .eq("run_id", run_id)
+            .execute()
+        )
+        return {row["user_id"] for row in response.data}
+
+    def mark_delivered(self, run_id: str, user_id: int) -> None:
+        self.client.table("broadcast_deliveries").upsert(
+            {"run_id": run_id, "user_id": user_id},
+            on_conflict="run_id,user_id",
+            ignore_duplicates=True,
+        ).execute()
+
+    def get_pool_entries(self) -> List[Row]:
+        return self.client.table("content_pool").select("*").execute().data
+
+    def insert_pool_entries(self, rows: List[Row]) -> List[Row]:
+        return self.client.table("content_pool").insert(rows).execute().data
+
+    def get_pool_deliveries(self) -> List[Row]:
+        return (
+            self.client.table("content_pool_deliveries")
+            .select("entry_id, user_id")
+            .execute()
+            .data
+        )
+
+    def insert_pool_deliveries(self, rows: List[Row]) -> None:
+        self.client.table("content_pool_deliveries").upsert(
+            rows, on_conflict="entry_id,user_id", ignore_duplicates=True
+        ).execute()
+
+    def get_job_runs(self, since: Timestamp) -> List[Row]:
+        response = (
+            self.client.table("job_runs")
+            .select("*")
+            .gte("scheduled_for", _iso(since))
+            .execute()
+        )
+        return response.data
+
+    def claim_job_run(
+        self,
+        job: str,
+        scheduled_for: Timestamp,
+        owner: str,
+        attempts: int,
+        lease_until: Timestamp,
+        now: Timestamp,
+    ) -> bool:
+        fields = {
+            "status": "running",
+            "owner": owner,
+            "attempts": attempts + 1,
+            "lease_until": _iso(lease_until),
+            "started_at": _iso(now),
+        }
+        if attempts == 0:
+            response = (
+                self.client.table("job_runs")
+                .upsert(
+                    {"job": job, "scheduled_for": _iso(scheduled_for), **fields},
+                    on_conflict="job,scheduled_for",
+                    ignore_duplicates=True,
+                )
+                .execute()
+            )
+            if response.data:
+                return True
+            # The row exists: claimed elsewhere, or released before it counted
+        # Conditional update: only one replica can move attempts forward
+        response = (
+            self.client.table("job_runs")
+            .update(fields)
+            .eq("job", job)
+            .eq("scheduled_for", _iso(scheduled_for))
+            .eq("attempts", attempts)
+            .neq("status", "done")
+            .lt("lease_until", _iso(now))
+            .execute()
+        )
+        return bool(response.data)
+
+    def renew_job_lease(
+        self, job: str, scheduled_for: Timestamp, owner: str, lease_until: Timestamp
+    ) -> bool:
+        response = (
+            self.client.table("job_runs")
+            .update({"lease_until": _iso(lease_until)})
+            .eq("job", job)
+            .eq("scheduled_for", _iso(scheduled_for))
+            .eq("owner", owner)
+            .eq("status", "running")
+            .execute()
+        )
+        return bool(response.data)
+
+    def finish_job_run(
+        self, job: str, scheduled_for: Timestamp, owner: str, fields: Row
+    ) -> None:
+        fields = {column: _iso(value) for column, value in fields.items()}
+        self.client.table("job_runs").update(fields).eq("job", job).eq(
+            "scheduled_for", _iso(scheduled_for)
+        ).eq("owner", owner).execute()
+
+    def get_rows_before(
+        self, table: str, column: str, before: Timestamp, limit: int, columns: str = "*"
+    ) -> List[Row]:
+        response = (
+            self.client.table(table)
+            .select(columns)
+            .lt(column, _iso(before))
+            .order(column)
+            .limit(limit)
+            .execute()
+        )
+        return response.data
+
+    def delete_rows(self, table: str, ids: List[int]) -> None:
+        self.client.table(table).delete().in_("id", ids).execute()
+
+
+SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS gym_stats (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    timestamp TEXT NOT NULL,
+    "Wrocław_Ferio_Gaj" INTEGER
+);
+CREATE INDEX IF NOT EXISTS idx_gym_stats_timestamp ON gym_stats(timestamp);
+
+CREATE TABLE IF NOT EXISTS raw_responses (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    timestamp TEXT NOT NULL,
+    response TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_raw_responses_timestamp ON raw_responses(timestamp);
+
+CREATE TABLE IF NOT EXISTS goals (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INTEGER NOT NULL,
+    user_name TEXT NOT NULL,
+    target_visits INTEGER NOT NULL,
+    current_visits INTEGER NOT NULL,
+    created_at TEXT NOT NULL,
+    end_date TEXT NOT NULL,
+    status TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_goals_user_status ON goals(user_id, status);
+
+CREATE TABLE IF NOT EXISTS bans (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INTEGER NOT NULL,
+    user_name TEXT NOT NULL,
+    goal_id INTEGER NOT NULL REFERENCES goals(id),
+    ban_date TEXT NOT NULL,
+    unban_date TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_bans_user ON bans(user_id);
+
+CREATE TABLE IF NOT EXISTS messages (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INTEGER NOT NULL,
+    role TEXT NOT NULL CHECK (role IN ('user', 'assistant')),
+    content TEXT NOT NULL,
+    created_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_messages_user_time ON messages(user_id, created_at DESC);
+
+CREATE TABLE IF NOT EXISTS users (
+    user_id INTEGER PRIMARY KEY,
+    user_name TEXT NOT NULL,
+    first_seen TEXT NOT NULL,
+    last_active TEXT NOT NULL,
+    banned_until TEXT,
+    daily_motivation INTEGER NOT NULL DEFAULT 1,
+    daily_tips INTEGER NOT NULL DEFAULT 1,
+    updated_at TEXT
+);
+
+CREATE TABLE IF NOT EXISTS conversation_summaries (
+    user_id INTEGER PRIMARY KEY,
+    summary TEXT NOT NULL,
+    summarized_until TEXT NOT NULL,
+    updated_at TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS content_pool (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    kind TEXT NOT NULL,
+    bucket TEXT NOT NULL,
+    text TEXT NOT NULL,
+    created_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_content_pool_kind_bucket ON content_pool(kind, bucket);
+
+CREATE TABLE IF NOT EXISTS content_pool_deliveries (
+    entry_id INTEGER NOT NULL REFERENCES content_pool(id) ON DELETE CASCADE,
+    user_id INTEGER NOT NULL,
+    PRIMARY KEY (entry_id, user_id)
+);
+
+CREATE TABLE IF NOT EXISTS broadcast_deliveries (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    run_id TEXT NOT NULL,
+    user_id INTEGER NOT NULL,
+    delivered_at TEXT NOT NULL DEFAULT (strftime('%Y-%m-%dT%H:%M:%f+00:00', 'now')),
+    UNIQUE (run_id, user_id)
+);
+CREATE INDEX IF NOT EXISTS idx_broadcast_deliveries_delivered_at ON broadcast_deliveries(delivered_at);
+
+CREATE TABLE IF NOT EXISTS job_runs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    job TEXT NOT NULL,
+    scheduled_for TEXT NOT NULL,
+    status TEXT NOT NULL CHECK (status IN ('running', 'done', 'failed')),
+    owner TEXT NOT NULL,
+    attempts INTEGER NOT NULL,
+    lease_until TEXT NOT NULL,
+    started_at TEXT NOT NULL,
+    finished_at TEXT,
+    error TEXT,
+    UNIQUE (job, scheduled_for)
+);
+CREATE INDEX IF NOT EXISTS idx_job_runs_scheduled_for ON job_runs(scheduled_for);
+"""
+
+# Columns holding timestamps, normalized to UTC ISO strings so they sort as text
+TIMESTAMP_COLUMNS = {
+    "timestamp",
+    "created_at",
+    "end_date",
+    "ban_date",
+    "unban_date",
+    "first_seen",
+    "last_active",
+    "banned_until",
+    "summarized_until",
+    "updated_at",
+    "scheduled_for",
+    "lease_until",
+    "started_at",
+    "finished_at",
+}
+JSON_COLUMNS = {"response"}
+
+
+def _utc(value: Timestamp) -> str:
+    """Normalize a timestamp to a fixed-width UTC ISO string."""
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc).isoformat(timespec="microseconds")
+
+
+def _quote(column: str) -> str:
+    return f'"{column}"'
+
+
+class SQLiteStorage(Storage):
+    """Storage backed by an embedded SQLite database in WAL mode."""
+
+    def __init__(self, path: str = None):
+        path = path or os.getenv("SQLITE_PATH", "data/gym.db")
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+        self.path = path
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("PRAGMA foreign_keys=ON")
+        self.conn.executescript(SQLITE_SCHEMA)
+        self._migrate()
+
+    def _migrate(self) -> None:
+        """Add columns introduced after a database file was created."""
+        rows = self.conn.execute("PRAGMA table_info(users)").fetchall()
+        if "updated_at" not in {row["name"] for row in rows}:
+            self.conn.execute("ALTER TABLE users ADD COLUMN updated_at TEXT")
+        self.conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_users_updated_at ON users(updated_at)"
+        )
+
+    def _encode(self, row: Row) -> Row:
+        encoded = {}
+        for column, value in row.items():
+            if column in TIMESTAMP_COLUMNS and value is not None:
+                value = _utc(value)
+            elif column in JSON_COLUMNS:
+                value = json.dumps(value)
+            encoded[column] = value
+        return encoded
+
+    def _decode(self, row: sqlite3.Row) -> Row:
+        decoded = dict(row)
+        for column in JSON_COLUMNS & decoded.keys():
+            decoded[column] = json.loads(decoded[column])
+        return decoded
+
+    def _query(self, sql: str, params=()) -> List[Row]:
+        with self._lock:
+            rows = self.conn.execute(sql, params).fetchall()
+        return [self._decode(row) for row in rows]
+
+    def _insert(self, table: str, rows: Union[Row, List[Row]]) -> None:
+        rows = [rows] if isinstance(rows, dict) else rows
+        if not rows:
+            return
+        rows = [self._encode(row) for row in rows]
+        columns = list(rows[0])
+        sql = (
+            f"INSERT INTO {table} ({', '.join(_quote(c) for c in columns)}) "
+            f"VALUES ({', '.join('?' for _ in columns)})"
+        )
+        with self._lock, self.conn:
+            self.conn.executemany(sql, [[row[c] for c in columns] for row in rows])
+
+    def _execute(self, sql: str, params=()) -> None:
+        with self._lock, self.conn:
+            self.conn.execute(sql, params)
+
+    def insert_goal(self, data: Row) -> None:
+        self._insert("goals", data)
+
+    def get_active_goal(self, user_id: int) -> Optional[Row]:
+        rows = self._query(
+            "SELECT * FROM goals WHERE user_id = ? AND status = 'active' LIMIT 1",
+            (user_id,),
+        )
+        return rows[0] if rows else None
+
+    def get_active_goals(self, user_ids: List[int]) -> List[Row]:
+        if not user_ids:
+            return []
+        placeholders = ", ".join("?" for _ in user_ids)
+        return self._query(
+            f"SELECT * FROM goals WHERE status = 'active' AND user_id IN ({placeholders})",
+            user_ids,
+        )
+
+    def update_goal(self, goal_id: int, fields: Row) -> None:
+        fields = self._encode(fields)
+        assignments = ", ".join(f"{_quote(column)} = ?" for column in fields)
+        self._execute(
+            f"UPDATE goals SET {assignments} WHERE id = ?",
+            (*fields.values(), goal_id),
+        )
+
+    def get_expired_goals(self, before: Timestamp) -> List[Row]:
+        return self._query(
+            "SELECT * FROM goals WHERE status = 'active' AND end_date < ?",
+            (_utc(before),),
+        )
+
+    def get_goal_users(self) -> List[Row]:
+        return self._query("SELECT user_id, user_name FROM goals")
+
+    def insert_ban(self, data: Row) -> None:
+        self._insert("bans", data)
+
+    def get_active_bans(self, now: Timestamp) -> List[Row]:
+        return self._query("SELECT * FROM bans WHERE unban_date > ?", (_utc(now),))
+
+    def get_users(self, updated_since: Optional[Timestamp] = None) -> List[Row]:
+        if updated_since is None:
+            return self._query("SELECT * FROM users")
+        return self._query(
+            "SELECT * FROM users WHERE updated_at > ?", (_utc(updated_since),)
+        )
+
+    def get_user(self, user_id: int) -> Optional[Row]:
+        rows = self._query("SELECT * FROM users WHERE user_id = ?", (user_id,))
+        return rows[0] if rows else None
+
+    def upsert_users(self, rows: List[Row]) -> None:
+        if not rows:
+            return
+        now = datetime.now(timezone.utc)
+        rows = [self._encode({**row, "updated_at": now}) for row in rows]
+        columns = list(rows[0])
+        updates = ", ".join(
+            f"{_quote(c)} = excluded.{_quote(c)}" for c in columns if c != "user_id"
+        )
+        sql = (
+            f"INSERT INTO users ({', '.join(_quote(c) for c in columns)}) "
+            f"VALUES ({', '.join('?' for _ in columns)}) "
+            f"ON CONFLICT (user_id) DO UPDATE SET {updates}"
+        )
+        with self._lock, self.conn:
+            self.conn.executemany(sql, [[row[c] for c in columns] for row in rows])
+
+    def update_user(self, user_id: int, fields: Row) -> None:
+        fields = self._encode({**fields, "updated_at": datetime.now(timezone.utc)})
+        assignments = ", ".join(f"{_quote(c)} = ?" for c in fields)
+        self._execute(
+            f"UPDATE users SET {assignments} WHERE user_id = ?",
+            [*fields.values(), user_id],
+        )
+
+    def insert_messages(self, rows: List[Row]) -> None:
+        now = _utc(datetime.now(timezone.utc))
+        self._insert("messages", [{"created_at": now, **row} for row in rows])
+
+    def get_messages(self, user_id: int, since: Timestamp, limit: int) -> List[Row]:
+        return self._query(
+            "SELECT role, content, created_at FROM messages "
+            "WHERE user_id = ? AND created_at >= ? "
+            "ORDER BY created_at DESC LIMIT ?",
+            (user_id, _utc(since), limit),
+        )
+
+    def get_summary(self, user_id: int) -> Optional[Row]:
+        rows = self._query(
+            "SELECT * FROM conversation_summaries WHERE user_id = ?", (user_id,)
+        )
+        return rows[0] if rows else None
+
+    def upsert_summary(self, row: Row) -> None:
+        row = self._encode(row)
+        columns = list(row)
+        updates = ", ".join(
+            f"{_quote(c)} = excluded.{_quote(c)}" for c in columns if c != "user_id"
+        )
+        self._execute(
+            f"INSERT INTO conversation_summaries "
+            f"({', '.join(_quote(c) for c in columns)}) "
+            f"VALUES ({', '.join('?' for _ in columns)}) "
+            f"ON CONFLICT (user_id) DO UPDATE SET {updates}",
+            [row[c] for c in columns],
+        )
+
+    def insert_stats(self, rows: Union[Row, List[Row]]) -> None:
+        self._insert("gym_stats", rows)
+
+    def get_latest_stats(self) -> Optional[Row]:
+        rows = self._query("SELECT * FROM gym_stats ORDER BY timestamp DESC LIMIT 1")
+        return rows[0] if rows else None
+
+    def get_stats_between(
+        self, start: Timestamp, end: Optional[Timestamp] = None
+    ) -> List[Row]:
+        if end is None:
+            return self._query(
+                "SELECT * FROM gym_stats WHERE timestamp >= ? ORDER BY timestamp",
+                (_utc(start),),
+            )
+        return self._query(
+            "SELECT * FROM gym_stats WHERE timestamp >= ? AND timestamp <= ? "
+            "ORDER BY timestamp",
+            (_utc(start), _utc(end)),
+        )
+
+    def insert_raw_response(self, data: Row) -> None:
+        self._insert("raw_responses", data)
+
+    def get_delivered_users(self, run_id: str) -> Set[int]:
+        rows = self._query(
+            "SELECT user_id FROM broadcast_deliveries WHERE run_id = ?", (run_id,)
+        )
+        return {row["user_id"] for row in rows}
+
+    def mark_delivered(self, run_id: str, user_id: int) -> None:
+        self._execute(
+            "INSERT OR IGNORE INTO broadcast_deliveries (run_id, user_id) VALUES (?, ?)",
+            (run_id, user_id),
+        )
+
+    def get_pool_entries(self) -> List[Row]:
+        return self._query("SELECT * FROM content_pool")
+
+    def insert_pool_entries(self, rows: List[Row]) -> List[Row]:
+        inserted = []
+        with self._lock, self.conn:
+            for row in rows:
+                encoded = self._encode(row)
+                columns = list(encoded)
+                cursor = self.conn.execute(
+                    f"INSERT INTO content_pool ({', '.join(_quote(c) for c in columns)}) "
+                    f"VALUES ({', '.join('?' for _ in columns)})",
+                    list(encoded.values()),
+                )
+                inserted.append({"id": cursor.lastrowid, **encoded})
+        return inserted
+
+    def get_pool_deliveries(self) -> List[Row]:
+        return self._query("SELECT entry_id, user_id FROM content_pool_deliveries")
+
+    def insert_pool_deliveries(self, rows: List[Row]) -> None:
+        with self._lock, self.conn:
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO content_pool_deliveries (entry_id, user_id) "
+                "VALUES (?, ?)",
+                [(row["entry_id"], row["user_id"]) for row in rows],
+            )
+
+    def get_job_runs(self, since: Timestamp) -> List[Row]:
+        return self._query(
+            "SELECT * FROM job_runs WHERE scheduled_for >= ?", (_utc(since),)
+        )
+
+    def claim_job_run(
+        self,
+        job: str,
+        scheduled_for: Timestamp,
+        owner: str,
+        attempts: int,
+        lease_until: Timestamp,
+        now: Timestamp,
+    ) -> bool:
+        fields = (owner, attempts + 1, _utc(lease_until), _utc(now))
+        with self._lock, self.conn:
+            if attempts == 0:
+                cursor = self.conn.execute(
+                    "INSERT OR IGNORE INTO job_runs (job, scheduled_for, status, "
+                    "owner, attempts, lease_until, started_at) "
+                    "VALUES (?, ?, 'running', ?, ?, ?, ?)",
+                    (job, _utc(scheduled_for), *fields),
+                )
+                if cursor.rowcount == 1:
+                    return True
+                # The row exists: claimed elsewhere, or released before it counted
+            cursor = self.conn.execute(
+                "UPDATE job_runs SET status = 'running', owner = ?, attempts = ?, "
+                "lease_until = ?, started_at = ? "
+                "WHERE job = ? AND scheduled_for = ? AND attempts = ? "
+                "AND status != 'done' AND lease_until < ?",
+                (*fields, job, _utc(scheduled_for), attempts, _utc(now)),
+            )
+        return cursor.rowcount == 1
+
+    def renew_job_lease(
+        self, job: str, scheduled_for: Timestamp, owner: str, lease_until: Timestamp
+    ) -> bool:
+        with self._lock, self.conn:
+            cursor = self.conn.execute(
+                "UPDATE job_runs SET lease_until = ? WHERE job = ? "
+                "AND scheduled_for = ? AND owner = ? AND status = 'running'",
+                (_utc(lease_until), job, _utc(scheduled_for), owner),
+            )
+        return cursor.rowcount == 1
+
+    def finish_job_run(
+        self, job: str, scheduled_for: Timestamp, owner: str, fields: Row
+    ) -> None:
+        fields = self._encode(fields)
+        assignments = ", ".join(f"{_quote(c)} = ?" for c in fields)
+        self._execute(
+            f"UPDATE job_runs SET {assignments} "
+            "WHERE job = ? AND scheduled_for = ? AND owner = ?",
+            [*fields.values(), job, _utc(scheduled_for), owner],
+        )
+
+    def get_rows_before(
+        self, table: str, column: str, before: Timestamp, limit: int, columns: str = "*"
+    ) -> List[Row]:
+        return self._query(
+            f"SELECT {columns} FROM {table} WHERE {column} < ? "
+            f"ORDER BY {column} LIMIT ?",
+            (_utc(before), limit),
+        )
+
+    def delete_rows(self, table: str, ids: List[int]) -> None:
+        if not ids:
+            return
+        placeholders = ", ".join("?" for _ in ids)
+        self._execute(f"DELETE FROM {table} WHERE id IN ({placeholders})", ids)
+
+
+STORAGE_BACKENDS = {
+    "supabase": SupabaseStorage,
+    "sqlite": SQLiteStorage,
+}
+
+_storage: Optional[Storage] = None
+
+
+def get_storage() -> Storage:
+    """Get the shared, instrumented storage backend selected by STORAGE_BACKEND."""
+    global _storage
+    if _storage is None:
+        backend = os.getenv("STORAGE_BACKEND", "supabase").lower()
+        if backend not in STORAGE_BACKENDS:
+            raise ValueError(f"Unknown storage backend: {backend}")
+        _storage = InstrumentedStorage(STORAGE_BACKENDS[backend]())
+        logger.info(f"Using {backend} storage backend")
+    return _storage
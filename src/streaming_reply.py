@@ -0,0 +1,119 @@
+import os
+import time
+import asyncio
+import logging
+from datetime import timedelta
+from typing import AsyncIterator, Optional
+
+from telegram.constants import MessageLimit
+from telegram.error import BadRequest, RetryAfter
+
+from llm_service import ResponseSuperseded
+from rate_limit import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+# Telegram tolerates roughly one edit per second per chat
+STREAM_EDIT_INTERVAL = float(os.getenv("STREAM_EDIT_INTERVAL", "1.0"))  # seconds
+PLACEHOLDER = "💭..."
+MAX_FINAL_EDIT_RETRIES = 3
+
+
+def _seconds(delay) -> float:
+    return delay.total_seconds() if isinstance(delay, timedelta) else float(delay)
+
+
+class StreamingReply:
+    """Reply to a message with a placeholder that is edited as text streams in.
+
+    Chunks are coalesced: the message is edited at most once per
+    STREAM_EDIT_INTERVAL with everything received so far, intermediate edits
+    are skipped when the shared global limiter has no token or Telegram asks
+    to back off, and the final text is always written.
+    """
+
+    def __init__(
+        self,
+        message,
+        limiter: Optional[TokenBucket] = None,
+        interval: float = STREAM_EDIT_INTERVAL,
+    ):
+        self.message = message
+        self.limiter = limiter
+        self.interval = interval
+        self._reply = None
+        self._shown = ""
+        self._next_edit = 0.0
+
+    async def _edit(self, text: str) -> bool:
+        """Edit the placeholder, returning False if Telegram asked to back off."""
+        if text == self._shown:
+            return True
+        try:
+            await self._reply.edit_text(text)
+        except RetryAfter as e:
+            self._next_edit = time.monotonic() + _seconds(e.retry_after)
+            return False
+        except BadRequest as e:
+            # Same text as before is not an error for us
+            if "not modified" not in str(e).lower():
+                raise
+        self._shown = text
+        self._next_edit = time.monotonic() + self.interval
+        return True
+
+    async def _progress(self, text: str) -> None:
+        """Show intermediate text if an edit is due and allowed."""
+        if time.monotonic() < self._next_edit:
+            return
+        if self.limiter and not self.limiter.try_acquire():
+            return
+        await self._edit(text[: MessageLimit.MAX_TEXT_LENGTH])
+
+    async def _finish(self, text: str) -> None:
+        """Write the final text, sending any overflow as extra messages."""
+        limit = MessageLimit.MAX_TEXT_LENGTH
+        for attempt in range(MAX_FINAL_EDIT_RETRIES):
+            delay = self._next_edit - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            if self.limiter:
+                await self.limiter.acquire()
+            if await self._edit(text[:limit]):
+                break
+        else:
+            logger.warning("Giving up on final edit, sending reply as a new message")
+            await self.message.reply_text(text[:limit])
+
+        for start in range(limit, len(text), limit):
+            await self.message.reply_text(text[start : start + limit])
+
+    async def render(self, chunks: AsyncIterator[str]) -> Optional[str]:
+        """
+        Stream chunks into the chat.
+
+        Returns:
+            str: Full reply text, or None if the stream was superseded by a
+                newer message or empty (the placeholder is then deleted)
+        """
+        self._reply = await self.message.reply_text(PLACEHOLDER)
+        self._shown = PLACEHOLDER
+
+        text = ""
+        try:
+            async for chunk in chunks:
+                text += chunk
+                if text.strip():
+                    await self._progress(text)
+        except ResponseSuperseded:
+            text = ""
+
+        text = text.strip()
+        if not text:
+            try:
+                await self._reply.delete()
+            except Exception as e:
+                logger.warning(f"Could not delete reply placeholder: {e}")
+            return None
+        await self._finish(text)
+        return text
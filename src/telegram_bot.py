@@ -1,5 +1,8 @@
+from services import LazyService, log_startup_times, mark_startup, timed_import
 import logging
 from telegram import Update
+from telegram.error import BadRequest
+from telegram.request import HTTPXRequest
 from telegram.ext import (
     Application,
     CommandHandler,
@@ -7,16 +10,36 @@ from telegram.ext import (
     filters,
     ContextTypes,
     ConversationHandler,
+    TypeHandler,
 )
 from dotenv import load_dotenv
 import os
-from gym_stats import GymStats
 from datetime import datetime, time, timedelta
 from database import Database
-from supabase import create_client, Client
-from llm_service import LLMService
+from llm_service import LLMService, BATCH_SIZE as LLM_BATCH_SIZE
+from llm_scheduler import log_queue_summary, scheduler as llm_scheduler
+from llm_telemetry import log_llm_summary
+from metrics import counter, start_metrics_server
+from content_pool import ContentPool
+from intent_router import IntentRouter
+from conversation_buffer import ConversationBuffer
+from retention import run_retention
+from instrumentation import tracked, log_storage_summary
+from broadcast import Broadcaster
+from streaming_reply import StreamingReply
+from update_processor import PerUserUpdateProcessor
+from photo_cache import PhotoCache
+from message_coalescer import MessageCoalescer
+from rate_limit import KeyedTokenBuckets
+from job_scheduler import SCHEDULER_INTERVAL, Daily, DailyBetween, Every, JobScheduler
+from status_snapshot import PLOT_INTERVALS, STATUS_SOCKET, SnapshotSubscriber
+from user_registry import USERS_REFRESH_INTERVAL
+from tracing import CLIENT, init_tracing, shutdown_tracing, span
 import re
-import random
+import asyncio
+import io
+
+mark_startup("import bot modules")
 
 # Load environment variables
 load_dotenv()
@@ -45,26 +68,120 @@ if not token:
         f"TELEGRAM_BOT_TOKEN{'_DEV' if ENV == 'development' else ''} not found in environment variables"
     )
 
-# Initialize services
-stats = GymStats(processed_dir="processed")
+
+def create_stats():
+    # pandas is only imported once stats are first needed
+    gym_stats = timed_import("gym_stats")
+    return gym_stats.GymStats(processed_dir="processed", storage=db.storage)
+
+
+def create_llm() -> LLMService:
+    service = LLMService()
+    service.sessions.on_evict = persist_evicted_session
+    return service
+
+
+def persist_evicted_session(session) -> None:
+    """Make sure an evicted chat session's turns reach the database; the
+    session is rebuilt from stored history on the user's next message."""
+    asyncio.ensure_future(conversation.flush())
+
+
+# Initialize services; stats and llm are created on first use
 db = Database()
-supabase: Client = create_client(os.getenv("SUPABASE_URL"), os.getenv("SUPABASE_KEY"))
-llm = LLMService()
+stats = LazyService("stats", create_stats)
+llm = LazyService("llm", create_llm)
+conversation = ConversationBuffer(
+    db, summarizer=lambda summary, turns: llm.summarize_conversation(summary, turns)
+)
+broadcaster = Broadcaster(db.storage)
+pool = ContentPool(db.storage, llm)
+router = IntentRouter(stats, db)
+plot_photos = PhotoCache()  # file_ids of uploaded /status plots
+plot_render_lock = asyncio.Lock()  # pyplot is global state, render one at a time
+snapshots = SnapshotSubscriber()  # status pushed by the scraper
+snapshot_task = None
+jobs = JobScheduler(db.storage)  # scheduled jobs, run once across replicas
+coalescer = MessageCoalescer()  # merges a user's rapid messages into one turn
+mark_startup("create bot services")
 
 # Conversation states
 VISITS = range(1)
 
-# Define the times for scheduled jobs
+# Define the times for scheduled jobs (Europe/Warsaw)
 WEEKLY_CHECK_TIME = time(hour=23, minute=50)  # Saturday 23:50
 DAILY_MOTIVATION_TIME = time(hour=17, minute=10)  # Every day at 17:10
 DAILY_TIP_START = time(hour=12, minute=0)  # Tips start time
 DAILY_TIP_END = time(hour=18, minute=0)  # Tips end time
+RETENTION_TIME = time(hour=4, minute=0)  # Every day at 04:00
+
+# How late a run missed during downtime is still caught up
+WEEKLY_CHECK_CATCH_UP = timedelta(days=2)
+DAILY_MOTIVATION_CATCH_UP = timedelta(hours=4)
+DAILY_TIP_CATCH_UP = timedelta(hours=6)
+RETENTION_CATCH_UP = timedelta(days=1)
+POOL_FILL_START = time(hour=1, minute=0)  # Content pool is filled at night
+POOL_FILL_END = time(hour=6, minute=0)
+POOL_FILL_INTERVAL = 300  # seconds between filler runs
+POOL_FILL_MAX_BATCHES = 10  # LLM requests per filler run
+
+# Longest /status range, in days
+MAX_STATUS_DAYS = 30
 
 # Constants for message history
 IMAGE_COMMAND_PATTERN = r"^/(status|plot|graph|chart|visualize|latestdata)"
+MESSAGE_FLUSH_INTERVAL = int(os.getenv("MESSAGE_FLUSH_INTERVAL", "5"))  # seconds
+METRICS_LOG_INTERVAL = int(os.getenv("METRICS_LOG_INTERVAL", "3600"))  # seconds
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))  # 0 disables /metrics
+
+# Per-user budget of LLM chat turns, so one user can't use up the shared quota
+USER_CHAT_RPM = float(os.getenv("USER_CHAT_RPM", "4"))
+USER_CHAT_BURST = int(os.getenv("USER_CHAT_BURST", "3"))
+chat_budget = KeyedTokenBuckets(USER_CHAT_RPM / 60, USER_CHAT_BURST)
+throttle_notified = set()  # users told to slow down since their last chat turn
+throttled_messages = counter(
+    "chat_throttled_total", "Chat turns rejected by the per-user budget"
+)
 
-# Create the Application
-application = Application.builder().token(token).build()
+# How updates are received: "polling" or "webhook"
+BOT_MODE = os.getenv("BOT_MODE", "polling").lower()
+UPDATE_CONCURRENCY = int(os.getenv("UPDATE_CONCURRENCY", "16"))  # across users
+WEBHOOK_URL = os.getenv(
+    "WEBHOOK_URL", ""
+)  # public base URL, e.g. https://bot.example.com
+WEBHOOK_LISTEN = os.getenv("WEBHOOK_LISTEN", "127.0.0.1")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8443"))
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "telegram")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "")
+
+if BOT_MODE == "webhook" and not WEBHOOK_URL:
+    raise ValueError("WEBHOOK_URL is required when BOT_MODE is webhook")
+
+# Every handler works on messages, other update types are not delivered
+ALLOWED_UPDATES = [Update.MESSAGE]
+
+
+class TracedRequest(HTTPXRequest):
+    """Bot API requests as spans of the handler or job trace making them."""
+
+    async def do_request(self, url: str, method: str, *args, **kwargs):
+        api_method = url.rsplit("/", 1)[-1]
+        with span(
+            f"telegram {api_method}", CLIENT, **{"telegram.method": api_method}
+        ) as request_span:
+            code, payload = await super().do_request(url, method, *args, **kwargs)
+            request_span.set_attribute("http.status_code", code)
+            return code, payload
+
+
+# Create the Application; updates are handled concurrently, in order per user
+application = (
+    Application.builder()
+    .token(token)
+    .request(TracedRequest(connection_pool_size=256))
+    .concurrent_updates(PerUserUpdateProcessor(UPDATE_CONCURRENCY))
+    .build()
+)
 
 
 async def send_ban_message(update: Update) -> None:
@@ -75,6 +192,7 @@ async def send_ban_message(update: Update) -> None:
     )
 
 
+@tracked
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Send a message when the command /start is issued."""
     if db.is_user_banned(update.effective_user.id):
@@ -90,6 +208,7 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     )
 
 
+@tracked
 async def goal(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Start the goal setting process."""
     if db.is_user_banned(update.effective_user.id):
@@ -117,6 +236,7 @@ async def goal(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     return VISITS
 
 
+@tracked
 async def set_visits(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Handle the number of visits response."""
     try:
@@ -150,6 +270,7 @@ async def set_visits(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     return ConversationHandler.END
 
 
+@tracked
 async def checkgoal(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Check current goal progress."""
     if db.is_user_banned(update.effective_user.id):
@@ -175,7 +296,10 @@ async def checkgoal(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     )
 
 
-async def check_failed_goals(context: ContextTypes.DEFAULT_TYPE) -> None:
+@tracked
+async def check_failed_goals(
+    context: ContextTypes.DEFAULT_TYPE, scheduled_for: datetime = None
+) -> None:
     """Check for failed goals and ban users."""
     failed_goals = db.check_goals()
     for goal in failed_goals:
@@ -197,6 +321,7 @@ async def check_failed_goals(context: ContextTypes.DEFAULT_TYPE) -> None:
                 )
 
 
+@tracked
 async def status(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Send current gym statistics."""
     if db.is_user_banned(update.effective_user.id):
@@ -212,9 +337,9 @@ async def status(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         if context.args:
             try:
                 days = int(context.args[0])
-                if days < 1:
+                if not 1 <= days <= MAX_STATUS_DAYS:
                     await update.message.reply_text(
-                        "Please provide a positive number of days!"
+                        f"Please provide a number of days from 1 to {MAX_STATUS_DAYS}!"
                     )
                     return
             except ValueError:
@@ -223,8 +348,18 @@ async def status(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
                 )
                 return
 
-        # Get stats summary
-        summary = stats.get_stats_summary()
+        # Answer from the snapshot pushed by the scraper, if it is fresh
+        snapshot = snapshots.latest()
+        if snapshot:
+            summary = {
+                "current_members": snapshot["current"],
+                "max_14d": snapshot["max_14d"],
+            }
+            version = snapshot["timestamp"]
+        else:
+            summary = stats.get_stats_summary()
+            latest = stats.get_latest_record()
+            version = str(latest["timestamp"]) if latest else None
         current_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
 
         # Create status message
@@ -233,34 +368,84 @@ async def status(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
             f"Current members: {summary['current_members']} 👥\n"
             f"Maximum in last 14 days: {summary['max_14d']} 📈\n"
         )
+        if snapshot and snapshot["trend"] is not None:
+            trend = snapshot["trend"]
+            message += f"Last hour: {trend:+d} {'📈' if trend > 0 else '📉' if trend < 0 else '➡️'}\n"
 
         # Send text message first
         await update.message.reply_text(message)
 
-        DAYS_INTERVAL_RATIO_DICT = {
-            1: "20min",
-            2: "30min",
-            3: "40min",
-            4: "60min",
-        }
+        interval = PLOT_INTERVALS.get(days, "60min")
 
-        interval = DAYS_INTERVAL_RATIO_DICT.get(days, "60min")
+        caption = (
+            f"Members count over the last {days} {'day' if days == 1 else 'days'} 📊"
+        )
 
-        # Create and send the plot with specified number of days
-        logger.info(f"Generating time series plot for {days} days")
-        plot_buf = stats.create_time_series_plot(hours=24 * days, interval=interval)
+        # Reuse the photo Telegram already has if the data hasn't changed
+        plot_key = (days, interval)
+        async with plot_photos.lock(plot_key):
+            file_id = plot_photos.get(version, plot_key)
+            if file_id:
+                try:
+                    await update.message.reply_photo(photo=file_id, caption=caption)
+                    return
+                except BadRequest as e:
+                    logger.warning(f"Cached plot photo rejected, uploading again: {e}")
+                    plot_photos.discard(version, plot_key)
+
+            if snapshot and days in snapshot["plots"]:
+                plot_buf = io.BytesIO(snapshot["plots"][days])
+            else:
+                # Create the plot with specified number of days
+                logger.info(f"Generating time series plot for {days} days")
+                # Rendering takes seconds, keep it off the event loop
+                async with plot_render_lock:
+                    plot_buf = await asyncio.to_thread(
+                        stats.create_time_series_plot,
+                        hours=24 * days,
+                        interval=interval,
+                    )
 
-        # Send the plot
-        await update.message.reply_photo(
-            photo=plot_buf,
-            caption=f"Members count over the last {days} {'day' if days == 1 else 'days'} 📊",
-        )
+            # Send the plot
+            sent = await update.message.reply_photo(photo=plot_buf, caption=caption)
+            if version and sent.photo:
+                plot_photos.put(version, plot_key, sent.photo[-1].file_id)
 
     except Exception as e:
         logger.error(f"Error sending status: {e}")
         await update.message.reply_text("Sorry, couldn't fetch gym stats right now 😔")
 
 
+@tracked
+async def register_user(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Record every user who contacts the bot in the users registry."""
+    user = update.effective_user
+    if user:
+        db.register_user(user.id, user.full_name)
+
+
+@tracked
+async def notify(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Turn daily motivation and tips on or off."""
+    user = update.effective_user
+    if not context.args or context.args[0].lower() not in ("on", "off"):
+        await update.message.reply_text("Usage: /notify on or /notify off")
+        return
+
+    enabled = context.args[0].lower() == "on"
+    if db.set_notifications(user.id, user.full_name, enabled):
+        await update.message.reply_text(
+            "Daily motivation and tips are on! 🔔💪"
+            if enabled
+            else "Daily motivation and tips are off. 🔕"
+        )
+    else:
+        await update.message.reply_text(
+            "Sorry, couldn't update your notifications right now 😔"
+        )
+
+
+@tracked
 async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Send help message when the command /help or /h is issued."""
     if db.is_user_banned(update.effective_user.id):
@@ -273,14 +458,16 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
     await update.message.reply_text(
         "Do you even lift bro? 💪\n\n"
         "Available commands:\n"
-        "/status [days] - Check current gym stats (optionally specify number of days)\n"
+        f"/status [days] - Check current gym stats (optionally for up to {MAX_STATUS_DAYS} days)\n"
         "/goal - Set your weekly gym goal\n"
         "/checkgoal - Check your current goal progress\n"
         "/latestdata - Get the most recent gym data\n"
+        "/notify on|off - Turn daily motivation and tips on or off\n"
         "/help or /h - Show this help message"
     )
 
 
+@tracked
 async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Handle regular messages."""
     if db.is_user_banned(update.effective_user.id):
@@ -299,82 +486,147 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         )
         return
 
-    # Get user's goal status
-    active_goal = db.get_active_goal(user.id)
+    # Read the user's recent history into memory, if it isn't there yet
+    await conversation.load(user.id)
+
+    # Answer stats questions from local data instead of the LLM
+    reply = await router.route(message_text, user.id, user.full_name)
+    if reply:
+        conversation.add_message(user.id, message_text, role="user")
+        conversation.add_message(user.id, reply, role="assistant")
+        if llm.initialized:
+            # Otherwise the session is built from stored history on first chat
+            llm.sessions.append(user.id, "user", message_text)
+            llm.sessions.append(user.id, "model", reply)
+        await update.message.reply_text(reply)
+        return
+
+    # Wait briefly for follow-up messages; if one arrives, its handler
+    # answers all of them in one turn (cancelling an in-flight reply)
+    texts = await coalescer.submit(user.id, message_text)
+    if texts is None:
+        return
+    message_text = "\n".join(texts)
 
-    # Store user's message
-    db.add_message(user.id, message_text, role="user")
+    if not chat_budget.try_acquire(user.id):
+        throttled_messages.inc()
+        if user.id not in throttle_notified:
+            throttle_notified.add(user.id)
+            wait = max(1, round(chat_budget.delay(user.id)))
+            await update.message.reply_text(
+                f"Easy bro, that's a lot of messages! 😅 "
+                f"Give me {wait} seconds to catch my breath 💪"
+            )
+        return
+    throttle_notified.discard(user.id)
 
-    # Get message history
-    history = db.get_message_history(user.id)
+    # Get user's goal status
+    active_goal = db.get_active_goal(user.id)
 
-    # Get LLM response with history
-    response = await llm.get_response(
-        message=message_text,
-        user_name=user.full_name,
-        has_active_goal=bool(active_goal),
-        history=history,
+    # Store user's message (persisted in the background)
+    conversation.add_message(user.id, message_text, role="user")
+
+    # Get recent messages (and the summary of older ones) from the in-memory buffer
+    history = conversation.get_history(user.id)
+
+    # Stream the LLM response into a placeholder reply that is edited as
+    # chunks arrive (None if a newer message superseded it)
+    reply = StreamingReply(update.message, limiter=broadcaster.global_limiter)
+    response = await reply.render(
+        llm.stream_response(
+            message=message_text,
+            user_name=user.full_name,
+            user_id=user.id,
+            has_active_goal=bool(active_goal),
+            history=history,
+            summary=conversation.get_summary(user.id),
+        )
     )
+    if response is None:
+        return
 
     # Store bot's response
-    db.add_message(user.id, response, role="assistant")
-
-    # Send response
-    await update.message.reply_text(response)
+    conversation.add_message(user.id, response, role="assistant")
 
 
-async def send_daily_motivation(context: ContextTypes.DEFAULT_TYPE) -> None:
+@tracked
+async def send_daily_motivation(
+    context: ContextTypes.DEFAULT_TYPE, scheduled_for: datetime = None
+) -> None:
     """Send daily motivational messages to all users."""
     try:
-        # Get all users who have interacted with the bot (from goals table)
-        response = supabase.table("goals").select("user_id, user_name").execute()
-        unique_users = {(goal["user_id"], goal["user_name"]) for goal in response.data}
+        # Get all unbanned users who opted in (from the in-memory registry)
+        recipients = await asyncio.to_thread(db.get_recipients, "daily_motivation")
 
-        for user_id, user_name in unique_users:
-            if not db.is_user_banned(user_id):
-                try:
-                    # Get user's current goal if any
-                    active_goal = db.get_active_goal(user_id)
-
-                    # Get motivational message
-                    message = await llm.get_daily_motivation(
-                        user_name=user_name,
-                        has_active_goal=bool(active_goal),
-                        current_visits=(
+        async def make_batch(batch):
+            # Get current goals of the whole batch in one query
+            goals = await asyncio.to_thread(
+                db.get_active_goals, [user_id for user_id, _ in batch]
+            )
+            texts = {}
+            users = []
+            for user_id, user_name in batch:
+                active_goal = goals.get(user_id)
+
+                # Use a pre-generated message when the pool has one
+                text = pool.take_motivation(user_id, user_name, active_goal)
+                if text:
+                    texts[user_id] = text
+                    continue
+
+                users.append(
+                    {
+                        "user_id": user_id,
+                        "user_name": user_name,
+                        "has_active_goal": bool(active_goal),
+                        "current_visits": (
                             active_goal["current_visits"] if active_goal else 0
                         ),
-                        target_visits=(
+                        "target_visits": (
                             active_goal["target_visits"] if active_goal else 0
                         ),
-                    )
+                    }
+                )
 
-                    # Send the message
-                    await context.bot.send_message(chat_id=user_id, text=message)
+            await pool.flush()
 
-                except Exception as e:
-                    logger.error(f"Error sending motivation to user {user_id}: {e}")
-                    continue
+            # Generate messages for users the pool couldn't serve
+            if users:
+                texts.update(await llm.get_daily_motivations(users))
+            return texts
+
+        report = await broadcaster.run(
+            "daily_motivation",
+            context.bot,
+            recipients,
+            make_batch=make_batch,
+            batch_size=LLM_BATCH_SIZE,
+            day=scheduled_for.date() if scheduled_for else None,
+        )
+        if report["failed"]:
+            raise RuntimeError(f"{report['failed']} deliveries failed")
 
     except Exception as e:
         logger.error(f"Error in daily motivation job: {e}")
+        raise  # retried by the job scheduler, resuming past delivered users
 
 
-async def download_newest_data_from_supabase(
+@tracked
+async def download_newest_data(
     update: Update, context: ContextTypes.DEFAULT_TYPE
 ) -> None:
-    """Download the newest data from Supabase and send it to the user."""
+    """Download the newest data from storage and send it to the user."""
     try:
-        # Query the newest data
-        response = (
-            supabase.table("gym_stats")
-            .select("*")
-            .order("timestamp", desc=True)
-            .limit(1)
-            .execute()
-        )
-        data = response.data
-        if data:
-            latest_record = data[0]
+        # Use the pushed snapshot, or query the newest data
+        snapshot = snapshots.latest()
+        if snapshot:
+            latest_record = {
+                "timestamp": snapshot["timestamp"],
+                "Wrocław_Ferio_Gaj": snapshot["current"],
+            }
+        else:
+            latest_record = stats.get_latest_record()
+        if latest_record:
             message = (
                 f"Latest Gym Data 📊\n"
                 f"Timestamp: {latest_record['timestamp']}\n"
@@ -382,9 +634,9 @@ async def download_newest_data_from_supabase(
             )
             await update.message.reply_text(message)
         else:
-            await update.message.reply_text("No data found in Supabase.")
+            await update.message.reply_text("No data found.")
     except Exception as e:
-        logger.error(f"Error downloading data from Supabase: {str(e)}")
+        logger.error(f"Error downloading latest data: {str(e)}")
         await update.message.reply_text(
             "Sorry, couldn't fetch the latest data right now 😔"
         )
@@ -402,51 +654,122 @@ async def error_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> N
         logger.error(f"Error in error handler: {e}")
 
 
-async def send_daily_tip(context: ContextTypes.DEFAULT_TYPE) -> None:
+@tracked
+async def send_daily_tip(
+    context: ContextTypes.DEFAULT_TYPE, scheduled_for: datetime = None
+) -> None:
     """Send daily gym tips to all users at random time."""
     try:
-        # Get all users who have interacted with the bot
-        response = supabase.table("goals").select("user_id, user_name").execute()
-        unique_users = {(goal["user_id"], goal["user_name"]) for goal in response.data}
-
-        for user_id, user_name in unique_users:
-            if not db.is_user_banned(user_id):
-                try:
-                    # Get tip message
-                    message = await llm.get_daily_tip(user_name=user_name)
-                    await context.bot.send_message(chat_id=user_id, text=message)
-                except Exception as e:
-                    logger.error(f"Error sending tip to user {user_id}: {e}")
-                    continue
+        # Get all unbanned users who opted in (from the in-memory registry)
+        recipients = await asyncio.to_thread(db.get_recipients, "daily_tips")
+
+        async def make_batch(batch):
+            # Use pre-generated tips when the pool has them
+            texts = {}
+            users = []
+            for user_id, user_name in batch:
+                text = pool.take_tip(user_id, user_name)
+                if text:
+                    texts[user_id] = text
+                else:
+                    users.append({"user_id": user_id, "user_name": user_name})
+            await pool.flush()
+
+            # Generate tips for users the pool couldn't serve
+            if users:
+                texts.update(await llm.get_daily_tips(users))
+            return texts
+
+        report = await broadcaster.run(
+            "daily_tip",
+            context.bot,
+            recipients,
+            make_batch=make_batch,
+            batch_size=LLM_BATCH_SIZE,
+            day=scheduled_for.date() if scheduled_for else None,
+        )
+        if report["failed"]:
+            raise RuntimeError(f"{report['failed']} deliveries failed")
 
     except Exception as e:
         logger.error(f"Error in daily tip job: {e}")
+        raise  # retried by the job scheduler, resuming past delivered users
 
 
-def get_random_time(start: time, end: time) -> datetime:
-    """Get a random time between start and end for today."""
-    now = datetime.now()
-    start_dt = datetime.combine(now.date(), start)
-    end_dt = datetime.combine(now.date(), end)
-
-    # If current time is past end time, schedule for tomorrow
-    if now.time() > end:
-        start_dt += timedelta(days=1)
-        end_dt += timedelta(days=1)
-    # If current time is before start time, use today
-    elif now.time() < start:
-        pass
-    # If current time is between start and end, use remaining time today
-    else:
-        start_dt = now
+@tracked
+async def fill_content_pool(
+    context: ContextTypes.DEFAULT_TYPE, scheduled_for: datetime = None
+) -> None:
+    """Pre-generate tips and motivations at night while the LLM is idle."""
+    added = 0
+    for _ in range(POOL_FILL_MAX_BATCHES):
+        if not llm_scheduler.idle:
+            break
+        batch_added = await pool.fill_once()
+        if not batch_added:
+            break
+        added += batch_added
+
+    if added:
+        logger.info(f"Content pool filler added {added} entries")
+
+
+@tracked
+async def flush_messages(context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Persist buffered conversation messages to the database."""
+    saved = await conversation.flush()
+    if saved and DEBUG_MODE:
+        logger.info(f"Flushed {saved} buffered messages")
+
+
+@tracked
+async def run_message_retention(
+    context: ContextTypes.DEFAULT_TYPE, scheduled_for: datetime = None
+) -> None:
+    """Delete expired chat messages, job run and broadcast delivery records."""
+    await asyncio.to_thread(
+        run_retention, db.storage, ["messages", "job_runs", "broadcast_deliveries"]
+    )
+
+
+async def refresh_users(context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Pick up users, bans and opt-outs changed on other replicas."""
+    await asyncio.to_thread(db.refresh_users)
+
+
+async def log_metrics(context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Log a summary of storage call latencies, LLM queue waits and LLM calls."""
+    log_storage_summary()
+    log_queue_summary()
+    log_llm_summary()
 
-    time_diff = (end_dt - start_dt).total_seconds()
-    random_seconds = random.randint(0, int(time_diff))
-    return start_dt + timedelta(seconds=random_seconds)
+
+async def on_startup(application: Application) -> None:
+    """Load the users registry and subscribe to the status snapshots pushed
+    by the scraper."""
+    global snapshot_task
+    await asyncio.to_thread(db.refresh_users)
+    mark_startup("initialize application")
+    log_startup_times()
+    if STATUS_SOCKET:
+        snapshot_task = asyncio.create_task(snapshots.run())
+
+
+async def on_shutdown(application: Application) -> None:
+    """Release running jobs and write out buffered messages before stopping."""
+    if snapshot_task:
+        snapshot_task.cancel()
+    await jobs.shutdown()
+    await conversation.flush()
+    shutdown_tracing()
 
 
 def main() -> None:
     """Start the bot."""
+    if METRICS_PORT:
+        start_metrics_server(METRICS_PORT)
+    init_tracing("gym-bot")
+
     # Add conversation handler for goal setting
     goal_handler = ConversationHandler(
         entry_points=[CommandHandler("goal", goal)],
@@ -456,52 +779,96 @@ def main() -> None:
         fallbacks=[],
     )
 
+    # Register every user before other handlers run
+    application.add_handler(TypeHandler(Update, register_user), group=-1)
+
     # Add handlers
     application.add_handler(CommandHandler("start", start))
     application.add_handler(CommandHandler(["status", "s"], status))
     application.add_handler(CommandHandler(["checkgoal", "cg"], checkgoal))
     application.add_handler(CommandHandler(["help", "h"], help_command))
+    application.add_handler(CommandHandler("notify", notify))
     application.add_handler(goal_handler)
+    # Chat runs without blocking, so other updates are handled during LLM calls
     application.add_handler(
-        MessageHandler(filters.TEXT & ~filters.COMMAND, handle_message)
+        MessageHandler(filters.TEXT & ~filters.COMMAND, handle_message, block=False)
     )
 
     # Add error handler
     application.add_error_handler(error_handler)
 
-    # Schedule jobs
-    job_queue = application.job_queue
-
-    # Weekly goal check (every Saturday at 23:50)
-    job_queue.run_daily(
+    # Scheduled jobs, recorded in storage so each runs once across restarts
+    # and replicas, and runs missed during downtime are caught up
+    jobs.add(
+        "weekly_goal_check",
         check_failed_goals,
-        time=WEEKLY_CHECK_TIME,
-        days=(5,),  # 5 represents Saturday (0-6 = Monday-Sunday)
+        Daily(WEEKLY_CHECK_TIME, days=(5,)),  # 5 represents Saturday (0-6 = Mon-Sun)
+        WEEKLY_CHECK_CATCH_UP,
+    )
+    jobs.add(
+        "daily_motivation",
+        send_daily_motivation,
+        Daily(DAILY_MOTIVATION_TIME),
+        DAILY_MOTIVATION_CATCH_UP,
+    )
+    # A different time every day, but the same on every replica
+    jobs.add(
+        "daily_tip",
+        send_daily_tip,
+        DailyBetween(DAILY_TIP_START, DAILY_TIP_END, seed="daily_tip"),
+        DAILY_TIP_CATCH_UP,
+    )
+    # Content pool filler (every 5 minutes at night)
+    jobs.add(
+        "content_pool_fill",
+        fill_content_pool,
+        Every(POOL_FILL_INTERVAL, between=(POOL_FILL_START, POOL_FILL_END)),
+        timedelta(seconds=POOL_FILL_INTERVAL),
     )
+    jobs.add(
+        "message_retention",
+        run_message_retention,
+        Daily(RETENTION_TIME),
+        RETENTION_CATCH_UP,
+    )
+    for name, at in jobs.next_runs().items():
+        logger.info(f"Next {name} run: {at}")
 
-    # Daily motivation (every day at 17:10)
-    job_queue.run_daily(send_daily_motivation, time=DAILY_MOTIVATION_TIME)
+    job_queue = application.job_queue
+    job_queue.run_repeating(jobs.tick, interval=SCHEDULER_INTERVAL, first=1)
 
-    # Schedule first daily tip
-    first_tip_time = get_random_time(DAILY_TIP_START, DAILY_TIP_END)
-    job_queue.run_once(send_daily_tip, when=first_tip_time)
+    # Write-behind persistence of conversation messages
+    job_queue.run_repeating(flush_messages, interval=MESSAGE_FLUSH_INTERVAL)
 
-    # Add callback to schedule next day's tip after current one runs
-    async def schedule_next_tip(context: ContextTypes.DEFAULT_TYPE) -> None:
-        next_tip_time = get_random_time(DAILY_TIP_START, DAILY_TIP_END)
-        context.job_queue.run_once(send_daily_tip, when=next_tip_time)
-        logger.info(f"Scheduled next tip for: {next_tip_time}")
+    # Users, bans and opt-outs changed on other replicas
+    job_queue.run_repeating(refresh_users, interval=USERS_REFRESH_INTERVAL)
+    application.post_init = on_startup
+    application.post_shutdown = on_shutdown
 
-    job_queue.run_once(schedule_next_tip, when=first_tip_time)
+    # Periodic storage latency summary
+    job_queue.run_repeating(log_metrics, interval=METRICS_LOG_INTERVAL)
 
     # Add a command handler for downloading the newest data
     application.add_handler(
-        CommandHandler("latestdata", download_newest_data_from_supabase)
+        CommandHandler("latestdata", download_newest_data)
     )
 
     # Run the bot until the user presses Ctrl-C
-    logger.info("Bot started")
-    application.run_polling(allowed_updates=Update.ALL_TYPES)
+    if BOT_MODE == "webhook":
+        logger.info(
+            f"Bot started with webhook on {WEBHOOK_LISTEN}:{WEBHOOK_PORT}/{WEBHOOK_PATH}"
+        )
+        application.run_webhook(
+            listen=WEBHOOK_LISTEN,
+            port=WEBHOOK_PORT,
+            url_path=WEBHOOK_PATH,
+            webhook_url=f"{WEBHOOK_URL.rstrip('/')}/{WEBHOOK_PATH}",
+            secret_token=WEBHOOK_SECRET or None,
+            allowed_updates=ALLOWED_UPDATES,
+        )
+    else:
+        logger.info("Bot started with polling")
+        application.run_polling(allowed_updates=ALLOWED_UPDATES)
 
 
 if __name__ == "__main__":
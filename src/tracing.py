@@ -0,0 +1,357 @@
+import os
+import json
+import time
+import queue
+import random
+import inspect
+import logging
+import functools
+import threading
+import contextvars
+import urllib.request
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional
+
+from dotenv import load_dotenv
+
+from metrics import counter
+
+logger = logging.getLogger(__name__)
+
+load_dotenv()
+
+# Where finished traces go: "file", "otlp" (OTLP/HTTP JSON collector) or "" (off)
+TRACE_EXPORTER = os.getenv("TRACE_EXPORTER", "").lower()
+TRACE_FILE = os.getenv("TRACE_FILE", "traces.jsonl")
+TRACE_OTLP_ENDPOINT = os.getenv(
+    "TRACE_OTLP_ENDPOINT", "http://localhost:4318/v1/traces"
+)
+# Share of traces exported, decided when a trace starts
+TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", "0.1"))
+# Traces slower than this (or failed) are exported even if not sampled; 0 = off
+TRACE_KEEP_SLOW_MS = float(os.getenv("TRACE_KEEP_SLOW_MS", "3000"))
+TRACE_MAX_SPANS = int(os.getenv("TRACE_MAX_SPANS", "1000"))  # per trace
+TRACE_EXPORT_INTERVAL = 5  # seconds between export batches
+TRACE_EXPORT_BATCH = 512  # spans
+
+# OTLP span kinds
+INTERNAL, SERVER, CLIENT = 1, 2, 3
+STATUS_ERROR = 2
+
+exported_spans = counter("trace_spans_exported_total", "Spans handed to the exporter")
+
+current_span = contextvars.ContextVar("current_span", default=None)
+
+_exporter: Optional["_Exporter"] = None
+
+
+class _Trace:
+    """Spans of one trace, exported together once the root span ends."""
+
+    def __init__(self, sampled: bool):
+        self.trace_id = f"{random.getrandbits(128):032x}"
+        self.sampled = sampled
+        self.kept: Optional[bool] = None  # decided when the root span ends
+        self.failed = False
+        self.spans: List["Span"] = []
+        self.dropped = 0
+        self.lock = threading.Lock()
+
+    def finished(self, span: "Span") -> None:
+        with self.lock:
+            if self.kept is None:
+                if len(self.spans) < TRACE_MAX_SPANS:
+                    self.spans.append(span)
+                else:
+                    self.dropped += 1
+                if span.parent_id is not None:
+                    return
+                # Root span ended: keep the trace or drop it
+                slow = (
+                    TRACE_KEEP_SLOW_MS
+                    and (span.end_ns - span.start_ns) / 1e6 >= TRACE_KEEP_SLOW_MS
+                )
+                self.kept = self.sampled or self.failed or bool(slow)
+                if self.dropped:
+                    span.attributes["trace.dropped_spans"] = self.dropped
+                spans, self.spans = self.spans, []
+            elif self.kept:
+                spans = [span]  # ended after the root, e.g. in a background task
+            else:
+                return
+        if self.kept and _exporter:
+            _exporter.submit(spans)
+
+
+class Span:
+    """A timed operation within a trace."""
+
+    __slots__ = (
+        "trace",
+        "span_id",
+        "parent_id",
+        "name",
+        "kind",
+        "start_ns",
+        "end_ns",
+        "attributes",
+        "status",
+        "message",
+    )
+
+    def __init__(
+        self,
+        trace: _Trace,
+        name: str,
+        parent_id: Optional[str],
+        kind: int,
+        attributes: Dict[str, Any],
+    ):
+        self.trace = trace
+        self.span_id = f"{random.getrandbits(64):016x}"
+        self.parent_id = parent_id
+        self.name = name
+        self.kind = kind
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+        self.attributes = attributes
+        self.status = 0
+        self.message = ""
+
+    @property
+    def recording(self) -> bool:
+        return True
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        self.attributes[key] = value
+
+    def record_error(self, error: BaseException) -> None:
+        self.status = STATUS_ERROR
+        self.message = f"{type(error).__name__}: {error}"[:500]
+        self.trace.failed = True
+
+    def end(self) -> None:
+        if self.end_ns is None:
+            self.end_ns = time.time_ns()
+            self.trace.finished(self)
+
+    def to_otlp(self) -> Dict[str, Any]:
+        span = {
+            "traceId": self.trace.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": self.kind,
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns),
+            "attributes": _otlp_attributes(self.attributes),
+        }
+        if self.parent_id:
+            span["parentSpanId"] = self.parent_id
+        if self.status:
+            span["status"] = {"code": self.status, "message": self.message}
+        return span
+
+
+class _NoopSpan:
+    """Stand-in when the current trace is not recorded."""
+
+    recording = False
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        pass
+
+    def record_error(self, error: BaseException) -> None:
+        pass
+
+    def end(self) -> None:
+        pass
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+def _otlp_value(value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def _otlp_attributes(attributes: Dict[str, Any]) -> List[Dict[str, Any]]:
+    return [
+        {"key": key, "value": _otlp_value(value)}
+        for key, value in attributes.items()
+        if value is not None
+    ]
+
+
+def start_trace(name: str, kind: int = SERVER, **attributes) -> Span:
+    """Start the root span of a new trace (not made current)."""
+    if _exporter is None:
+        return NOOP_SPAN
+    sampled = random.random() < TRACE_SAMPLE_RATE
+    if not sampled and not TRACE_KEEP_SLOW_MS:
+        return NOOP_SPAN
+    return Span(_Trace(sampled), name, None, kind, attributes)
+
+
+def start_span(
+    name: str, parent: Optional[Span] = None, kind: int = INTERNAL, **attributes
+) -> Span:
+    """Start a child of parent (default: the current span), not made current.
+
+    Outside of a recorded trace this returns a no-op span, so operations
+    only show up as part of the update, job or scraper cycle that ran them.
+    """
+    parent = parent or current_span.get()
+    if parent is None or not parent.recording:
+        return NOOP_SPAN
+    return Span(parent.trace, name, parent.span_id, kind, attributes)
+
+
+@contextmanager
+def _activate(span) -> Iterator:
+    token = current_span.set(span) if span.recording else None
+    try:
+        yield span
+    except Exception as e:
+        span.record_error(e)
+        raise
+    finally:
+        if token is not None:
+            current_span.reset(token)
+        span.end()
+
+
+def trace(name: str, kind: int = SERVER, **attributes):
+    """Context manager running the block as the root span of a new trace."""
+    return _activate(start_trace(name, kind, **attributes))
+
+
+def span(name: str, kind: int = INTERNAL, **attributes):
+    """Context manager running the block as a child of the current span."""
+    return _activate(start_span(name, kind=kind, **attributes))
+
+
+def traced(name: str = None, kind: int = INTERNAL):
+    """Decorator running a sync or async function in a span."""
+
+    def decorator(func):
+        span_name = name or func.__qualname__
+        if inspect.iscoroutinefunction(func):
+
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with span(span_name, kind):
+                    return await func(*args, **kwargs)
+
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(span_name, kind):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+class _Exporter:
+    """Batches finished spans and writes them as OTLP/JSON from a thread."""
+
+    def __init__(self, service_name: str, kind: str):
+        self.kind = kind
+        self.resource = {"attributes": _otlp_attributes({"service.name": service_name})}
+        self._queue: "queue.Queue[Optional[List[Span]]]" = queue.Queue()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def submit(self, spans: List[Span]) -> None:
+        exported_spans.inc(len(spans))
+        self._queue.put(spans)
+
+    def _run(self) -> None:
+        batch: List[Span] = []
+        deadline = time.monotonic() + TRACE_EXPORT_INTERVAL
+        while True:
+            try:
+                spans = self._queue.get(timeout=max(0, deadline - time.monotonic()))
+            except queue.Empty:
+                spans = []
+            if spans is None:  # shutdown
+                self._export(batch)
+                return
+            batch += spans
+            if len(batch) >= TRACE_EXPORT_BATCH or time.monotonic() >= deadline:
+                self._export(batch)
+                batch = []
+                deadline = time.monotonic() + TRACE_EXPORT_INTERVAL
+
+    def _export(self, spans: List[Span]) -> None:
+        if not spans:
+            return
+        payload = json.dumps(
+            {
+                "resourceSpans": [
+                    {
+                        "resource": self.resource,
+                        "scopeSpans": [
+                            {
+                                "scope": {"name": "gym-stats"},
+                                "spans": [span.to_otlp() for span in spans],
+                            }
+                        ],
+                    }
+                ]
+            }
+        )
+        try:
+            if self.kind == "file":
+                os.makedirs(os.path.dirname(TRACE_FILE) or ".", exist_ok=True)
+                with open(TRACE_FILE, "a", encoding="utf-8") as f:
+                    f.write(payload + "\n")
+            else:
+                request = urllib.request.Request(
+                    TRACE_OTLP_ENDPOINT,
+                    data=payload.encode("utf-8"),
+                    headers={"Content-Type": "application/json"},
+                )
+                urllib.request.urlopen(request, timeout=10).close()
+        except Exception as e:
+            logger.warning(f"Could not export {len(spans)} spans: {e}")
+
+    def shutdown(self) -> None:
+        self._queue.put(None)
+        self._thread.join(timeout=15)
+
+
+def init_tracing(service_name: str) -> None:
+    """Start exporting traces as configured by TRACE_EXPORTER."""
+    global _exporter
+    if _exporter is not None or not TRACE_EXPORTER:
+        return
+    if TRACE_EXPORTER not in ("file", "otlp"):
+        logger.error(f"Unknown trace exporter: {TRACE_EXPORTER}")
+        return
+    _exporter = _Exporter(service_name, TRACE_EXPORTER)
+    target = TRACE_FILE if TRACE_EXPORTER == "file" else TRACE_OTLP_ENDPOINT
+    logger.info(
+        f"Tracing {service_name} to {target}, sampling {TRACE_SAMPLE_RATE:.0%}"
+        + (
+            f", keeping traces over {TRACE_KEEP_SLOW_MS:.0f} ms"
+            if TRACE_KEEP_SLOW_MS
+            else ""
+        )
+    )
+
+
+def shutdown_tracing() -> None:
+    """Export the remaining spans."""
+    global _exporter
+    if _exporter is not None:
+        _exporter.shutdown()
+        _exporter = None
@@ -0,0 +1,68 @@
+import logging
+from collections import deque
+from typing import Any, Awaitable, Deque, Dict, Optional
+
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+logger = logging.getLogger(__name__)
+
+
+class PerUserUpdateProcessor(BaseUpdateProcessor):
+    """Process updates concurrently, but one at a time per user.
+
+    Updates from a user who already has one in progress are queued behind it
+    and run by the same slot in arrival order. This keeps multi-step flows
+    like the goal conversation consistent, and a user sending many updates
+    never holds more than one of the max_concurrent_updates slots.
+    """
+
+    def __init__(self, max_concurrent_updates: int):
+        super().__init__(max_concurrent_updates)
+        self._pending: Dict[int, Deque[Awaitable[Any]]] = {}
+
+    @staticmethod
+    def _key(update: object) -> Optional[int]:
+        if not isinstance(update, Update):
+            return None
+        if update.effective_user:
+            return update.effective_user.id
+        if update.effective_chat:
+            return update.effective_chat.id
+        return None
+
+    async def do_process_update(
+        self, update: object, coroutine: Awaitable[Any]
+    ) -> None:
+        key = self._key(update)
+        if key is None:
+            await coroutine
+            return
+
+        pending = self._pending.get(key)
+        if pending is not None:
+            # The slot processing this user's earlier update will run it
+            pending.append(coroutine)
+            return
+
+        self._pending[key] = pending = deque()
+        try:
+            while True:
+                try:
+                    await coroutine
+                except Exception as e:
+                    logger.error(f"Error processing update from {key}: {e}")
+                if not pending:
+                    break
+                coroutine = pending.popleft()
+        finally:
+            del self._pending[key]
+            # Only left over when cancelled during shutdown
+            for leftover in pending:
+                leftover.close()
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
@@ -0,0 +1,240 @@
+import os
+import logging
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Minimum seconds between persisted last_active updates for the same user
+LAST_ACTIVE_RESOLUTION = 900
+# Seconds between reads of the users table, for changes made by other replicas
+USERS_REFRESH_INTERVAL = int(os.getenv("USERS_REFRESH_INTERVAL", "300"))
+# Rows updated this many seconds before the last read are read again, in case
+# the replicas' clocks differ
+USERS_REFRESH_OVERLAP = 60
+
+# Broadcast opt-in flags stored per user
+OPT_IN_FLAGS = ("daily_motivation", "daily_tips")
+
+
+def _epoch(value) -> Optional[float]:
+    if value is None:
+        return None
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    return value.timestamp()
+
+
+def _iso(value: Optional[float]) -> Optional[str]:
+    if value is None:
+        return None
+    return datetime.fromtimestamp(value, timezone.utc).isoformat()
+
+
+class UserRecord:
+    """A user known to the bot."""
+
+    __slots__ = (
+        "user_id",
+        "user_name",
+        "first_seen",
+        "last_active",
+        "banned_until",
+        "daily_motivation",
+        "daily_tips",
+        "persisted_active",
+    )
+
+    def __init__(
+        self,
+        user_id: int,
+        user_name: str,
+        first_seen: float,
+        last_active: float,
+        banned_until: Optional[float] = None,
+        daily_motivation: bool = True,
+        daily_tips: bool = True,
+    ):
+        self.user_id = user_id
+        self.user_name = user_name
+        self.first_seen = first_seen
+        self.last_active = last_active
+        self.banned_until = banned_until
+        self.daily_motivation = daily_motivation
+        self.daily_tips = daily_tips
+        self.persisted_active = last_active
+
+    @classmethod
+    def from_row(cls, row: Dict) -> "UserRecord":
+        return cls(
+            user_id=row["user_id"],
+            user_name=row["user_name"],
+            first_seen=_epoch(row["first_seen"]),
+            last_active=_epoch(row["last_active"]),
+            banned_until=_epoch(row.get("banned_until")),
+            daily_motivation=bool(row.get("daily_motivation", True)),
+            daily_tips=bool(row.get("daily_tips", True)),
+        )
+
+    def as_row(self) -> Dict:
+        return {
+            "user_id": self.user_id,
+            "user_name": self.user_name,
+            "first_seen": _iso(self.first_seen),
+            "last_active": _iso(self.last_active),
+            "banned_until": _iso(self.banned_until),
+            "daily_motivation": self.daily_motivation,
+            "daily_tips": self.daily_tips,
+        }
+
+    def is_banned(self, now: float = None) -> bool:
+        return self.banned_until is not None and self.banned_until > (
+            now or time.time()
+        )
+
+
+class UserRegistry:
+    """In-memory registry of users backed by the `users` table.
+
+    Ban checks are answered from memory only. Only the columns that changed
+    are written back, so replicas don't overwrite each other's bans and
+    opt-outs. `refresh()` reads the users updated since the last read, which
+    picks up users, bans and opt-outs from other replicas; the bot runs it
+    off the event loop every USERS_REFRESH_INTERVAL seconds, and
+    `recipients()` runs it before every recipient list.
+    """
+
+    def __init__(self, storage):
+        self.storage = storage
+        self._users: Optional[Dict[int, UserRecord]] = None
+        self._read_at: Optional[float] = None  # wall time of the last read
+        self._lock = threading.Lock()
+
+    def _load(self) -> Dict[int, UserRecord]:
+        if self._users is not None:
+            return self._users
+        with self._lock:
+            if self._users is None:
+                read_at = time.time()
+                rows = self.storage.get_users()
+                if not rows:
+                    rows = self._seed()
+                self._users = {row["user_id"]: UserRecord.from_row(row) for row in rows}
+                self._read_at = read_at
+                logger.info(f"Loaded {len(self._users)} users into the registry")
+        return self._users
+
+    def refresh(self) -> None:
+        """Read the users updated since the last read, keeping activity not
+        yet written back. Blocking: run it in a thread."""
+        if self._users is None:
+            self._load()
+            return
+        with self._lock:
+            read_at = time.time()
+            try:
+                rows = self.storage.get_users(
+                    updated_since=datetime.fromtimestamp(
+                        self._read_at - USERS_REFRESH_OVERLAP, timezone.utc
+                    )
+                )
+            except Exception as e:
+                logger.error(f"Error refreshing the users registry: {e}")
+                return
+            self._read_at = read_at
+            for row in rows:
+                stored = UserRecord.from_row(row)
+                record = self._users.get(stored.user_id)
+                if record is None:
+                    self._users[stored.user_id] = stored
+                    continue
+                # Updated in place, handlers may hold the record
+                record.user_name = stored.user_name
+                record.banned_until = stored.banned_until
+                record.daily_motivation = stored.daily_motivation
+                record.daily_tips = stored.daily_tips
+                record.last_active = max(record.last_active, stored.last_active)
+
+    def _seed(self) -> List[Dict]:
+        """Build the registry from goals and active bans on first run."""
+        now = time.time()
+        records: Dict[int, UserRecord] = {}
+        for row in self.storage.get_goal_users():
+            records[row["user_id"]] = UserRecord(
+                row["user_id"], row["user_name"], now, now
+            )
+        for ban in self.storage.get_active_bans(datetime.now(timezone.utc)):
+            record = records.setdefault(
+                ban["user_id"], UserRecord(ban["user_id"], ban["user_name"], now, now)
+            )
+            record.banned_until = max(
+                record.banned_until or 0, _epoch(ban["unban_date"])
+            )
+
+        rows = [record.as_row() for record in records.values()]
+        if rows:
+            self.storage.upsert_users(rows)
+            logger.info(f"Seeded users registry with {len(rows)} users")
+        return rows
+
+    def _update(self, record: UserRecord, *columns: str) -> None:
+        row = record.as_row()
+        self.storage.update_user(record.user_id, {c: row[c] for c in columns})
+        if "last_active" in columns:
+            record.persisted_active = record.last_active
+
+    def get(self, user_id: int) -> Optional[UserRecord]:
+        return self._load().get(user_id)
+
+    def touch(self, user_id: int, user_name: str) -> UserRecord:
+        """Register a user on first contact and update their last active time."""
+        users = self._load()
+        now = time.time()
+        record = users.get(user_id)
+        if record is None:
+            # Possibly registered on another replica since the last refresh
+            row = self.storage.get_user(user_id)
+            if row is None:
+                record = users[user_id] = UserRecord(user_id, user_name, now, now)
+                self.storage.upsert_users([record.as_row()])
+                return record
+            record = users[user_id] = UserRecord.from_row(row)
+
+        record.last_active = now
+        if (
+            record.user_name != user_name
+            or now - record.persisted_active >= LAST_ACTIVE_RESOLUTION
+        ):
+            record.user_name = user_name
+            self._update(record, "user_name", "last_active")
+        return record
+
+    def is_banned(self, user_id: int) -> bool:
+        record = self.get(user_id)
+        return record is not None and record.is_banned()
+
+    def set_ban(self, user_id: int, user_name: str, until: datetime) -> None:
+        record = self.get(user_id) or self.touch(user_id, user_name)
+        record.banned_until = until.timestamp()
+        self._update(record, "banned_until")
+
+    def set_opt_in(self, user_id: int, user_name: str, **flags: bool) -> None:
+        record = self.get(user_id) or self.touch(user_id, user_name)
+        for flag, enabled in flags.items():
+            if flag not in OPT_IN_FLAGS:
+                raise ValueError(f"Unknown opt-in flag: {flag}")
+            setattr(record, flag, enabled)
+        self._update(record, *flags)
+
+    def recipients(self, flag: str) -> List[Tuple[int, str]]:
+        """Get (user_id, user_name) of users opted in to a broadcast and not
+        banned. Blocking: run it in a thread."""
+        self.refresh()
+        now = time.time()
+        return [
+            (record.user_id, record.user_name)
+            for record in list(self._users.values())
+            if getattr(record, flag) and not record.is_banned(now)
+        ]
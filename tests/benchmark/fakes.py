@@ -0,0 +1,223 @@
+import asyncio
+import hashlib
+import itertools
+import json
+import math
+import random
+import re
+from collections import Counter
+from typing import Any, Dict, List, Optional
+
+
+class LatencyModel:
+    """Log-normal latency with a given median, sampled deterministically.
+
+    Every sample is seeded from the model's seed and a key (e.g. the prompt),
+    so the same request gets the same latency no matter how concurrent tasks
+    interleave.
+    """
+
+    def __init__(self, median: float, sigma: float, seed: int = 0):
+        self.median = median
+        self.sigma = sigma
+        self.seed = seed
+        self._calls = Counter()
+
+    def rng(self, key: str) -> random.Random:
+        self._calls[key] += 1
+        digest = hashlib.sha256(f"{self.seed}:{key}:{self._calls[key]}".encode())
+        return random.Random(digest.hexdigest())
+
+    def sample(self, rng: random.Random) -> float:
+        if self.median <= 0:
+            return 0.0
+        return self.median * math.exp(self.sigma * rng.gauss(0, 1))
+
+
+class _Usage:
+    def __init__(self, prompt_tokens: int, response_tokens: int):
+        self.prompt_token_count = prompt_tokens
+        self.candidates_token_count = response_tokens
+
+
+class _Response:
+    """Mimics the parts of a Gemini response (or stream chunk) the service reads."""
+
+    def __init__(self, text: str, usage: Optional[_Usage] = None, chunks=None):
+        self.text = text
+        self.parts = [text] if text else []
+        self.usage_metadata = usage
+        self._chunks = chunks or []
+
+    async def __aiter__(self):
+        for delay, chunk in self._chunks:
+            await asyncio.sleep(delay)
+            yield chunk
+
+
+class StubModel:
+    """Offline stand-in for genai.GenerativeModel.
+
+    Replies are derived from the prompt, so a run is fully reproducible.
+    Batched (JSON) prompts get one message per user listed in the prompt.
+    """
+
+    CHUNK_WORDS = 4
+
+    def __init__(
+        self,
+        name: str,
+        system_instruction: Optional[str],
+        latency: LatencyModel,
+        error_rate: float = 0.0,
+    ):
+        self.name = name
+        self.system_instruction = system_instruction
+        self.latency = latency
+        self.error_rate = error_rate
+        self.calls = 0
+
+    def _reply(self, prompt: str, json_output: bool) -> str:
+        if json_output:
+            match = re.search(r"\(JSON\):\s*(\[.*?\])\s*\n", prompt, re.DOTALL)
+            users = json.loads(match.group(1)) if match else []
+            return json.dumps(
+                [
+                    {
+                        "id": user["id"],
+                        "message": f"Yo {user['name']}! Hit the gym today bro 💪",
+                    }
+                    for user in users
+                ]
+            )
+        digest = int(hashlib.sha256(prompt.encode()).hexdigest(), 16)
+        words = ["bro", "gains", "💪", "let's", "go", "lift", "heavy", "🔥"]
+        return " ".join(words[(digest >> i) % len(words)] for i in range(0, 120, 5))
+
+    async def generate_content_async(
+        self, contents, generation_config=None, stream: bool = False
+    ):
+        self.calls += 1
+        prompt = contents if isinstance(contents, str) else json.dumps(contents)
+        json_output = (generation_config or {}).get(
+            "response_mime_type"
+        ) == "application/json"
+        rng = self.latency.rng(f"{self.name}:{prompt}")
+        latency = self.latency.sample(rng)
+        text = self._reply(prompt, json_output)
+        usage = _Usage(len(prompt) // 4, len(text) // 4)
+
+        if rng.random() < self.error_rate:
+            await asyncio.sleep(latency)
+            raise RuntimeError(f"Stub {self.name} failed")
+
+        if not stream:
+            await asyncio.sleep(latency)
+            return _Response(text, usage)
+
+        # Time to first chunk is part of the latency, the rest is spread out
+        words = text.split(" ")
+        pieces = [
+            " ".join(words[i : i + self.CHUNK_WORDS]) + " "
+            for i in range(0, len(words), self.CHUNK_WORDS)
+        ]
+        await asyncio.sleep(latency * 0.3)
+        gap = latency * 0.7 / max(len(pieces), 1)
+        chunks = [(0 if i == 0 else gap, _Response(p)) for i, p in enumerate(pieces)]
+        chunks[-1] = (chunks[-1][0], _Response(pieces[-1], usage))
+        return _Response("", chunks=chunks)
+
+
+class FakeTelegram:
+    """Shared state of the fake Telegram Bot API: latency and sent messages."""
+
+    def __init__(self, latency: LatencyModel, upload_rate: float = 1_000_000):
+        self.latency = latency
+        self.upload_rate = upload_rate  # bytes per second
+        self.sent: Counter = Counter()
+        self.uploaded_bytes = 0
+        self._message_ids = itertools.count(1)
+
+    async def call(self, method: str, chat_id: int, upload: bytes = b"") -> int:
+        self.sent[method] += 1
+        self.uploaded_bytes += len(upload)
+        rng = self.latency.rng(f"{method}:{chat_id}")
+        await asyncio.sleep(self.latency.sample(rng) + len(upload) / self.upload_rate)
+        return next(self._message_ids)
+
+
+class FakePhotoSize:
+    def __init__(self, file_id: str):
+        self.file_id = file_id
+
+
+class FakeBot:
+    """The subset of telegram.Bot used by jobs."""
+
+    def __init__(self, telegram: FakeTelegram):
+        self.telegram = telegram
+
+    async def send_message(self, chat_id: int, text: str, **kwargs):
+        message_id = await self.telegram.call("sendMessage", chat_id)
+        return FakeMessage(self.telegram, chat_id, text, message_id)
+
+
+class FakeMessage:
+    """The subset of telegram.Message used by handlers."""
+
+    def __init__(
+        self, telegram: FakeTelegram, chat_id: int, text: str = "", message_id: int = 0
+    ):
+        self.telegram = telegram
+        self.chat_id = chat_id
+        self.text = text
+        self.message_id = message_id
+        self.photo: List[FakePhotoSize] = []
+
+    async def reply_text(self, text: str, **kwargs) -> "FakeMessage":
+        message_id = await self.telegram.call("sendMessage", self.chat_id)
+        return FakeMessage(self.telegram, self.chat_id, text, message_id)
+
+    async def reply_photo(self, photo, caption: str = None, **kwargs) -> "FakeMessage":
+        # A file_id is sent as is, a buffer is uploaded
+        upload = b"" if isinstance(photo, str) else photo.read()
+        message_id = await self.telegram.call("sendPhoto", self.chat_id, upload)
+        message = FakeMessage(self.telegram, self.chat_id, caption or "", message_id)
+        message.photo = [FakePhotoSize(f"photo-{message_id}")]
+        return message
+
+    async def edit_text(self, text: str, **kwargs) -> "FakeMessage":
+        await self.telegram.call("editMessageText", self.chat_id)
+        self.text = text
+        return self
+
+    async def delete(self) -> bool:
+        await self.telegram.call("deleteMessage", self.chat_id)
+        return True
+
+
+class FakeUser:
+    def __init__(self, user_id: int, name: str):
+        self.id = user_id
+        self.full_name = name
+        self.first_name = name
+        self.username = name.lower()
+
+
+class FakeUpdate:
+    """An incoming text message or command."""
+
+    def __init__(self, telegram: FakeTelegram, user: FakeUser, text: str):
+        self.effective_user = user
+        self.message = FakeMessage(telegram, user.id, text)
+
+
+class FakeContext:
+    """The subset of CallbackContext used by handlers and jobs."""
+
+    def __init__(self, bot: FakeBot, args: List[str] = None):
+        self.bot = bot
+        self.args = args or []
+        self.job_queue = None
+        self.error = None
+        self.user_data: Dict[str, Any] = {}
@@ -0,0 +1,370 @@
+"""
+Offline latency benchmarks for the Telegram bot.
+
+Replays synthetic update streams against the real handlers and jobs, with
+Gemini replaced by a deterministic stub, Telegram by a fake Bot API and the
+storage by an in-memory SQLite database. Reports handler latency
+percentiles, throughput and how long the event loop was blocked.
+
+The LLM rate limit defaults to a high value so the bot's own overhead is
+measured; set LLM_RPM / LLM_BURST to benchmark with the production limits.
+
+Usage:
+    python tests/benchmark/run_benchmarks.py [--scenarios chat,spam,status,broadcast]
+"""
+
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import logging
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, List, Tuple
+
+# Offline configuration, set before the bot modules read it
+os.environ.update(
+    STORAGE_BACKEND="sqlite",
+    SQLITE_PATH=":memory:",
+    ENVIRONMENT="development",
+    METRICS_PORT="0",
+)
+os.environ.setdefault("TELEGRAM_BOT_TOKEN_DEV", "123456:benchmark")
+os.environ.setdefault("GEMINI_API_KEY", "benchmark")
+os.environ.setdefault("LLM_RPM", "6000")
+os.environ.setdefault("LLM_BURST", "50")
+os.environ.setdefault("STATUS_SOCKET", "")
+
+sys.path.append(str(Path(__file__).parent))
+sys.path.append(str(Path(__file__).parent.parent.parent / "src"))
+
+from fakes import (
+    FakeBot,
+    FakeContext,
+    FakeTelegram,
+    FakeUpdate,
+    FakeUser,
+    LatencyModel,
+    StubModel,
+)
+
+# The bot writes plots to ./processed, keep that out of the repo
+WORKING_DIR = os.getcwd()
+os.chdir(tempfile.mkdtemp(prefix="gym-bench-"))
+
+import telegram_bot as bot  # noqa: E402
+import tracing  # noqa: E402
+from status_snapshot import build_snapshot  # noqa: E402
+
+SEED = 42
+LOOP_PROBE_INTERVAL = 0.005  # seconds between event loop probes
+LOOP_BLOCK_THRESHOLD = 0.02  # lag counted as blocking, seconds
+
+CHAT_MESSAGES = [
+    "yo bro, leg day or chest day today?",
+    "I'm so tired but I want to train",
+    "how many people are at the gym right now?",
+    "what's the best time to go to the gym tomorrow?",
+    "how is my goal going?",
+    "give me a quick tip for bench press",
+    "is creatine worth it?",
+    "I skipped the gym yesterday 😔",
+]
+
+Event = Tuple[float, Callable[[], Awaitable[Any]]]
+
+
+class LoopMonitor:
+    """Measures event loop lag by sleeping a fixed interval and timing it."""
+
+    def __init__(self, interval: float = LOOP_PROBE_INTERVAL):
+        self.interval = interval
+        self.lags: List[float] = []
+        self._task = None
+
+    async def _probe(self) -> None:
+        while True:
+            start = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            self.lags.append(max(0.0, time.perf_counter() - start - self.interval))
+
+    def start(self) -> None:
+        self.lags = []
+        self._task = asyncio.ensure_future(self._probe())
+
+    def stop(self) -> Dict[str, float]:
+        self._task.cancel()
+        blocked = [lag for lag in self.lags if lag >= LOOP_BLOCK_THRESHOLD]
+        return {
+            "loop_lag_p99": percentile(self.lags, 99),
+            "loop_lag_max": max(self.lags, default=0.0),
+            "loop_blocked_s": sum(blocked),
+        }
+
+
+def percentile(values: List[float], p: float) -> float:
+    if not values:
+        return 0.0
+    if len(values) == 1:
+        return values[0]
+    return statistics.quantiles(values, n=100, method="inclusive")[int(p) - 1]
+
+
+def arrivals(count: int, rate: float, rng: random.Random) -> List[float]:
+    """Poisson arrival offsets (seconds) for count events at rate per second."""
+    offsets, now = [], 0.0
+    for _ in range(count):
+        offsets.append(now)
+        now += rng.expovariate(rate)
+    return offsets
+
+
+async def replay(name: str, events: List[Event]) -> Dict[str, Any]:
+    """
+    Run events at their offsets, measuring each from arrival to completion.
+
+    Returns:
+        dict: Latency percentiles, throughput and event loop blocking
+    """
+    monitor = LoopMonitor()
+    latencies: List[float] = []
+    errors = 0
+
+    async def run(offset: float, handler) -> None:
+        nonlocal errors
+        await asyncio.sleep(max(0.0, start + offset - time.perf_counter()))
+        arrived = time.perf_counter()
+        try:
+            await handler()
+        except Exception as e:
+            errors += 1
+            logging.getLogger(__name__).error(f"{name} handler failed: {e}")
+        latencies.append(time.perf_counter() - arrived)
+
+    monitor.start()
+    start = time.perf_counter()
+    # Handlers print progress (GymStats); keep the report readable
+    with contextlib.redirect_stdout(io.StringIO()):
+        await asyncio.gather(*(run(offset, handler) for offset, handler in events))
+    wall = time.perf_counter() - start
+    result = {
+        "scenario": name,
+        "events": len(events),
+        "errors": errors,
+        "wall_s": wall,
+        "throughput_per_s": len(events) / wall if wall else 0.0,
+        "p50": percentile(latencies, 50),
+        "p95": percentile(latencies, 95),
+        "p99": percentile(latencies, 99),
+        "max": max(latencies, default=0.0),
+    }
+    result.update(monitor.stop())
+    return result
+
+
+def seed_gym_stats(days: int = 14) -> None:
+    """Insert a plausible occupancy curve every 10 minutes."""
+    rng = random.Random(SEED)
+    now = datetime.now().replace(second=0, microsecond=0)
+    rows = []
+    for step in range(days * 24 * 6):
+        at = now - timedelta(minutes=10 * step)
+        peak = 60 if at.weekday() < 5 else 40
+        count = max(0, int(peak * max(0.0, 1 - abs(at.hour - 18) / 10)))
+        rows.append(
+            {
+                "timestamp": at.isoformat(),
+                "Wrocław_Ferio_Gaj": count + rng.randint(0, 5),
+            }
+        )
+    bot.db.storage.insert_stats(rows)
+
+
+def register_users(count: int) -> List[FakeUser]:
+    users = [FakeUser(1000 + i, f"User{i}") for i in range(count)]
+    for user in users:
+        bot.db.register_user(user.id, user.full_name)
+    return users
+
+
+def chat_burst(
+    telegram: FakeTelegram, users: List[FakeUser], count: int, rate: float
+) -> List[Event]:
+    """Chat messages from random users, mixing LLM chat and routed questions."""
+    rng = random.Random(SEED)
+    context = FakeContext(FakeBot(telegram))
+    events = []
+    for offset in arrivals(count, rate, rng):
+        update = FakeUpdate(telegram, rng.choice(users), rng.choice(CHAT_MESSAGES))
+        events.append(
+            (offset, lambda u=update: bot.handle_message(u, context)),
+        )
+    return events
+
+
+def spam_bursts(
+    telegram: FakeTelegram, users: List[FakeUser], messages: int, gap: float
+) -> List[Event]:
+    """Every user fires messages back to back, gap seconds apart."""
+    rng = random.Random(SEED + 2)
+    context = FakeContext(FakeBot(telegram))
+    events = []
+    for user in users:
+        start = rng.uniform(0, 1)
+        for i in range(messages):
+            update = FakeUpdate(telegram, user, rng.choice(CHAT_MESSAGES))
+            events.append(
+                (start + i * gap, lambda u=update: bot.handle_message(u, context))
+            )
+    return events
+
+
+def status_storm(
+    telegram: FakeTelegram, users: List[FakeUser], count: int, rate: float
+) -> List[Event]:
+    """/status commands with 1-4 day plots."""
+    rng = random.Random(SEED + 1)
+    events = []
+    for offset in arrivals(count, rate, rng):
+        update = FakeUpdate(telegram, rng.choice(users), "/status")
+        context = FakeContext(FakeBot(telegram), args=[str(rng.randint(1, 4))])
+        events.append((offset, lambda u=update, c=context: bot.status(u, c)))
+    return events
+
+
+def daily_broadcast(telegram: FakeTelegram) -> List[Event]:
+    """The 17:10 daily motivation job, once."""
+    context = FakeContext(FakeBot(telegram))
+    return [(0.0, lambda: bot.send_daily_motivation(context))]
+
+
+def format_report(results: List[Dict[str, Any]]) -> str:
+    lines = [
+        "| Scenario | Events | Errors | Wall | Throughput | p50 | p95 | p99 | Max "
+        "| Loop lag p99 | Loop lag max | Loop blocked |",
+        "|---|---|---|---|---|---|---|---|---|---|---|---|",
+    ]
+    for r in results:
+        lines.append(
+            f"| {r['scenario']} | {r['events']} | {r['errors']} | {r['wall_s']:.2f}s "
+            f"| {r['throughput_per_s']:.1f}/s | {r['p50'] * 1000:.0f}ms "
+            f"| {r['p95'] * 1000:.0f}ms | {r['p99'] * 1000:.0f}ms "
+            f"| {r['max'] * 1000:.0f}ms | {r['loop_lag_p99'] * 1000:.1f}ms "
+            f"| {r['loop_lag_max'] * 1000:.1f}ms | {r['loop_blocked_s']:.2f}s |"
+        )
+    for r in results:
+        if "extra" in r:
+            lines.append(f"\n{r['scenario']}: {r['extra']}")
+    return "\n".join(lines)
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark bot handlers offline")
+    parser.add_argument("--scenarios", default="chat,spam,status,broadcast")
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--chat-messages", type=int, default=200)
+    parser.add_argument("--chat-rate", type=float, default=20, help="messages/s")
+    parser.add_argument("--spam-users", type=int, default=5)
+    parser.add_argument("--spam-messages", type=int, default=10, help="per user")
+    parser.add_argument("--spam-gap", type=float, default=0.4, help="seconds")
+    parser.add_argument("--status-requests", type=int, default=30)
+    parser.add_argument("--status-rate", type=float, default=5, help="requests/s")
+    parser.add_argument("--llm-median", type=float, default=1.0, help="seconds")
+    parser.add_argument("--llm-sigma", type=float, default=0.5)
+    parser.add_argument("--llm-error-rate", type=float, default=0.0)
+    parser.add_argument("--telegram-median", type=float, default=0.05, help="seconds")
+    parser.add_argument("--telegram-sigma", type=float, default=0.3)
+    parser.add_argument(
+        "--snapshot",
+        action="store_true",
+        help="answer /status from a status snapshot, as pushed by the scraper",
+    )
+    parser.add_argument(
+        "--trace",
+        help="record every trace to this JSONL file, e.g. to measure tracing overhead",
+    )
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args()
+
+    # Only warnings and errors from the bot, the report goes to stdout
+    logging.getLogger().setLevel(logging.WARNING)
+
+    llm_latency = LatencyModel(args.llm_median, args.llm_sigma, SEED)
+    stubs = []
+
+    def make_model(name, system_instruction):
+        stubs.append(
+            StubModel(name, system_instruction, llm_latency, args.llm_error_rate)
+        )
+        return stubs[-1]
+
+    bot.llm.cascade.make_model = make_model
+    telegram = FakeTelegram(LatencyModel(args.telegram_median, args.telegram_sigma))
+
+    if args.trace:
+        tracing.TRACE_EXPORTER = "file"
+        tracing.TRACE_FILE = os.path.join(WORKING_DIR, args.trace)
+        tracing.TRACE_SAMPLE_RATE = 1.0
+        tracing.init_tracing("gym-bot-benchmark")
+
+    seed_gym_stats()
+    if args.snapshot:
+        with contextlib.redirect_stdout(io.StringIO()):
+            bot.snapshots.snapshot = build_snapshot(bot.stats)
+    users = register_users(args.users)
+
+    results = []
+    for scenario in args.scenarios.split(","):
+        scenario = scenario.strip()
+        sent_before = sum(telegram.sent.values())
+        llm_calls_before = sum(stub.calls for stub in stubs)
+        if scenario == "chat":
+            events = chat_burst(telegram, users, args.chat_messages, args.chat_rate)
+        elif scenario == "spam":
+            events = spam_bursts(
+                telegram, users[: args.spam_users], args.spam_messages, args.spam_gap
+            )
+        elif scenario == "status":
+            events = status_storm(
+                telegram, users, args.status_requests, args.status_rate
+            )
+        elif scenario == "broadcast":
+            events = daily_broadcast(telegram)
+        else:
+            print(f"Unknown scenario: {scenario}")
+            continue
+
+        result = await replay(scenario, events)
+        sent = sum(telegram.sent.values()) - sent_before
+        result["telegram_calls"] = sent
+        result["llm_calls"] = sum(stub.calls for stub in stubs) - llm_calls_before
+        if scenario == "spam":
+            result["extra"] = f"{result['llm_calls']} LLM calls, {sent} Telegram calls"
+        if scenario == "broadcast":
+            result["extra"] = (
+                f"{sent} messages, {sent / result['wall_s']:.1f} msg/s delivered"
+            )
+        results.append(result)
+        await bot.conversation.flush()
+
+    print(format_report(results))
+    print(
+        f"\nLLM calls: {sum(stub.calls for stub in stubs)}, "
+        f"Telegram calls: {dict(telegram.sent)}, "
+        f"uploaded {telegram.uploaded_bytes / 1024:.0f} KiB"
+    )
+    tracing.shutdown_tracing()
+    if args.json:
+        with open(os.path.join(WORKING_DIR, args.json), "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=1)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,18 @@
+import os
+import sys
+from pathlib import Path
+
+# Offline configuration, set before the bot modules read it
+os.environ.update(
+    STORAGE_BACKEND="sqlite",
+    SQLITE_PATH=":memory:",
+    ENVIRONMENT="development",
+    METRICS_PORT="0",
+    STATUS_SOCKET="",
+)
+os.environ.setdefault("TELEGRAM_BOT_TOKEN_DEV", "123456:test")
+os.environ.setdefault("GEMINI_API_KEY", "test")
+os.environ.setdefault("LLM_RPM", "6000")
+os.environ.setdefault("LLM_BURST", "50")
+
+sys.path.append(str(Path(__file__).parent.parent / "src"))
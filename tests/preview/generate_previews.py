@@ -1,23 +1,40 @@
 import asyncio
+import argparse
+import contextvars
+import difflib
+import hashlib
+import json
 import os
-from datetime import datetime
+import random
+import re
+import statistics
 import sys
-from pathlib import Path
 import time
-import random
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional
 
 # Add src directory to Python path
 sys.path.append(str(Path(__file__).parent.parent.parent / "src"))
 
 from llm_service import LLMService
+from llm_scheduler import INTERACTIVE
+from model_cascade import LLM_MODELS
+from rate_limit import TokenBucket
 from dotenv import load_dotenv
 
 # Load environment variables
 load_dotenv()
 
-# Rate limiting settings
-REQUESTS_PER_MINUTE = 9
-DELAY_BETWEEN_REQUESTS = 60.0 / REQUESTS_PER_MINUTE  # seconds
+PREVIEW_DIR = Path(__file__).parent
+CACHE_DIR = PREVIEW_DIR / ".cache"
+CACHE_FILE = CACHE_DIR / "responses.jsonl"  # prompt hash -> response
+CHECKPOINT_FILE = CACHE_DIR / "checkpoint.jsonl"  # cases done in the current run
+
+# Rate limiting settings (the service's own LLM_RPM limit applies as well)
+REQUESTS_PER_MINUTE = float(os.getenv("PREVIEW_RPM", "9"))
+CONCURRENCY = int(os.getenv("PREVIEW_CONCURRENCY", "4"))
+SEED = 0  # makes topic selection repeatable between runs
 
 # Test data
 TEST_USERS = [
@@ -41,168 +58,418 @@ TEST_MESSAGES = [
     "How do I get motivated on lazy days?",
 ]
 
-
-class PreviewGenerator:
-    def __init__(self):
-        self.llm = LLMService()
-        self.last_request_time = 0
-        self.results_file = None
-        self.current_section = None
-
-    async def rate_limit(self):
-        """Ensure we don't exceed rate limits."""
-        now = time.time()
-        time_since_last = now - self.last_request_time
-        if time_since_last < DELAY_BETWEEN_REQUESTS:
-            await asyncio.sleep(DELAY_BETWEEN_REQUESTS - time_since_last)
-        self.last_request_time = time.time()
-
-    def start_results_file(self):
-        """Initialize results file and write header."""
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        filename = f"tests/preview/results_{timestamp}.md"
-        self.results_file = open(filename, "w", encoding="utf-8")
-
-        header = f"""# LLM Preview Tests
-Generated on: {datetime.now().strftime("%Y-%m-%d %H:%M:%S")}
-Model: gemini-2.0-flash-experimental
-
-"""
-        self.results_file.write(header)
-        self.results_file.flush()
-        print(f"Started generating preview results in: {filename}")
-
-    def write_section(self, title: str, description: str = ""):
-        """Write a new section header."""
-        self.current_section = title
-        self.results_file.write(f"\n## {title}\n{description}\n\n")
-        self.results_file.flush()
-        print(f"\nStarting section: {title}")
-
-    def write_result(self, content: str):
-        """Write a result and flush immediately."""
-        self.results_file.write(content)
-        self.results_file.flush()
-        # Print a short preview
-        preview = content.split("\n")[0][:100] + "..."
-        print(f"Added result to {self.current_section}: {preview}")
-
-    async def generate_daily_motivation_previews(self, count: int = 10):
-        """Generate sample daily motivations."""
-        self.write_section(
-            "Daily Motivations", "Testing different scenarios (with/without goals)"
+SECTIONS = {
+    "motivation": (
+        "Daily Motivations",
+        "Testing different scenarios (with/without goals)",
+    ),
+    "tips": ("Daily Tips", "Testing random topics from our list"),
+    "chat": ("Conversation Responses", "Testing various user questions/scenarios"),
+}
+
+# Measurements of the case being generated, set per case task
+current_case: contextvars.ContextVar = contextvars.ContextVar("preview_case")
+
+
+def prompt_hash(**request) -> str:
+    """Hash of everything that determines a response, including the models."""
+    payload = json.dumps(
+        {"models": LLM_MODELS, **request}, sort_keys=True, ensure_ascii=False
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """Append-only JSONL cache of responses keyed by prompt hash."""
+
+    def __init__(self, path: Path = CACHE_FILE):
+        self.path = path
+        self.entries: Dict[str, Dict[str, Any]] = {}
+        if path.exists():
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    entry = json.loads(line)
+                    self.entries[entry["hash"]] = entry
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        return self.entries.get(key)
+
+    def put(self, key: str, response: str, latency: float) -> None:
+        entry = {"hash": key, "response": response, "latency": latency}
+        self.entries[key] = entry
+        self.path.parent.mkdir(exist_ok=True)
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+
+class PreviewLLMService(LLMService):
+    """LLMService answering unchanged prompts from the response cache.
+
+    Every request the service makes goes through _generate_with_retry, so
+    the cache sees the final prompt text: editing a prompt template only
+    regenerates the cases whose prompts actually changed.
+    """
+
+    def __init__(self, cache: ResponseCache, bucket: TokenBucket, use_cache: bool):
+        super().__init__()
+        self.cache = cache
+        self.bucket = bucket
+        self.use_cache = use_cache
+
+    async def _generate_with_retry(
+        self,
+        prompt,
+        temperature: float = 1.5,
+        json_output: bool = False,
+        priority: int = INTERACTIVE,
+        system_instruction: Optional[str] = None,
+    ) -> str:
+        case = current_case.get()
+        key = prompt_hash(
+            prompt=prompt,
+            temperature=temperature,
+            json_output=json_output,
+            system_instruction=system_instruction,
         )
-
-        for i in range(count):
-            user = TEST_USERS[i % len(TEST_USERS)]
-            try:
-                await self.rate_limit()
-                response = await self.llm.get_daily_motivation(
-                    user_name=user["name"],
-                    has_active_goal=user["has_goal"],
-                    current_visits=user.get("visits", 0),
-                    target_visits=user.get("target", 0),
-                )
-
-                content = f"{i+1}. **Scenario**: {'With goal' if user['has_goal'] else 'No goal'}"
-                if user["has_goal"]:
-                    content += f" ({user['visits']}/{user['target']} visits)"
-                content += f"\n   **User**: {user['name']}\n"
-                content += f"   **Response**: {response}\n\n"
-
-                self.write_result(content)
-
-            except Exception as e:
-                error_content = (
-                    f"{i+1}. **ERROR**: {str(e)}\n   **User**: {user['name']}\n\n"
-                )
-                self.write_result(error_content)
-                print(f"Error in daily motivation: {str(e)}")
-
-    async def generate_daily_tip_previews(self, count: int = 10):
-        """Generate sample daily tips."""
-        self.write_section("Daily Tips", "Testing random topics from our list")
-
-        used_topics = set()
+        case["hashes"].append(key)
+
+        entry = self.cache.get(key) if self.use_cache else None
+        if entry:
+            case["latency"] += entry["latency"]
+            return entry["response"]
+
+        case["cached"] = False
+        await self.bucket.acquire()
+        start = time.monotonic()
+        try:
+            text = await super()._generate_with_retry(
+                prompt, temperature, json_output, priority, system_instruction
+            )
+        except Exception:
+            # The public method falls back to a canned reply, which must not
+            # be checkpointed as a result
+            case["error"] = True
+            raise
+        latency = time.monotonic() - start
+        self.cache.put(key, text, latency)
+        case["latency"] += latency
+        return text
+
+
+def build_cases(sections: List[str], count: int) -> List[Dict[str, Any]]:
+    """Every case of the run, in the order they are written to the results."""
+    topics = random.Random(SEED).sample(
+        LLMService.GYM_TOPICS, len(LLMService.GYM_TOPICS)
+    )
+    cases = []
+    for section in sections:
         for i in range(count):
             user = TEST_USERS[i % len(TEST_USERS)]
-            try:
-                available_topics = [
-                    t for t in self.llm.GYM_TOPICS if t not in used_topics
-                ]
-                if not available_topics:
-                    used_topics.clear()
-                    available_topics = self.llm.GYM_TOPICS
-
-                topic = random.choice(available_topics)
-                used_topics.add(topic)
-
-                await self.rate_limit()
-                response = await self.llm.get_daily_tip(
-                    user_name=user["name"], topic=topic
-                )
+            case = {"id": f"{section}-{i + 1}", "section": section, "index": i + 1}
+            case["user"] = user
+            if section == "tips":
+                case["topic"] = topics[i % len(topics)]
+            elif section == "chat":
+                case["message"] = TEST_MESSAGES[i % len(TEST_MESSAGES)]
+            cases.append(case)
+    return cases
+
+
+def format_case(case: Dict[str, Any], result: Dict[str, Any]) -> str:
+    """Render a case in the results markdown format."""
+    user = case["user"]
+    section = case["section"]
+    if result.get("error"):
+        content = f"{case['index']}. **ERROR**: {result['response']}\n"
+        content += f"   **User**: {user['name']}\n\n"
+        return content
+
+    if section == "motivation":
+        content = f"{case['index']}. **Scenario**: {'With goal' if user['has_goal'] else 'No goal'}"
+        if user["has_goal"]:
+            content += f" ({user['visits']}/{user['target']} visits)"
+        content += f"\n   **User**: {user['name']}\n"
+    elif section == "tips":
+        content = f"{case['index']}. **Topic**: {case['topic']}\n"
+        content += f"   **User**: {user['name']}\n"
+    else:
+        content = f"{case['index']}. **User**: {user['name']} "
+        content += f"({'With goal' if user['has_goal'] else 'No goal'})\n"
+        content += f"   **Message**: \"{case['message']}\"\n"
+    content += f"   **Response**: {result['response']}\n\n"
+    return content
+
+
+def parse_results(path: Path) -> Dict[tuple, Dict[str, Any]]:
+    """
+    Load a previous run as {(section title, index): result}.
+
+    Runs that wrote a JSON sidecar also provide latencies; older runs only
+    have the markdown, so their responses are parsed from it.
+    """
+    sidecar = path.with_suffix(".json")
+    if sidecar.exists():
+        with open(sidecar, encoding="utf-8") as f:
+            return {(SECTIONS[r["section"]][0], r["index"]): r for r in json.load(f)}
+
+    results = {}
+    section, index, lines = None, None, []
+
+    def close_item():
+        if section and index is not None:
+            text = "\n".join(lines)
+            match = re.search(r"\*\*Response\*\*: (.*)", text, re.DOTALL)
+            results[(section, index)] = {
+                "response": match.group(1).strip() if match else "",
+                "error": "**ERROR**" in text,
+            }
+
+    with open(path, encoding="utf-8") as f:
+        for line in f.read().splitlines():
+            heading = re.match(r"^## (.+)$", line)
+            item = re.match(r"^(\d+)\. \*\*", line)
+            if heading or item:
+                close_item()
+                lines = []
+                if heading:
+                    section, index = heading.group(1).strip(), None
+                else:
+                    index = int(item.group(1))
+            if index is not None:
+                lines.append(line)
+    close_item()
+    return results
+
+
+def _percentile(values: List[float], p: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))]
+
+
+def _sentences(text: str) -> List[str]:
+    return re.split(r"(?<=[.!?])\s+", text.strip())
+
+
+def build_diff(
+    cases: List[Dict[str, Any]],
+    results: Dict[str, Dict[str, Any]],
+    previous: Dict[tuple, Dict[str, Any]],
+    previous_name: str,
+) -> str:
+    """Structured comparison of this run with the previous one as markdown."""
+    out = [f"# Preview Diff\nCompared with: {previous_name}\n"]
+    out.append(
+        "| Section | Cases | Unchanged | Changed | New | Removed | Cached "
+        "| Avg length (prev → now) | Latency p50 / p95 (prev → now) |"
+    )
+    out.append("|---|---|---|---|---|---|---|---|---|")
+
+    changes = []
+    for section in dict.fromkeys(case["section"] for case in cases):
+        title = SECTIONS[section][0]
+        section_cases = [case for case in cases if case["section"] == section]
+        now = [results[case["id"]] for case in section_cases]
+        before = {k[1]: v for k, v in previous.items() if k[0] == title}
+
+        unchanged = changed = new = 0
+        for case, result in zip(section_cases, now):
+            old = before.get(case["index"])
+            if old is None:
+                new += 1
+            elif old["response"] == result["response"]:
+                unchanged += 1
+            else:
+                changed += 1
+                changes.append((title, case, old["response"], result["response"]))
+        removed = len(set(before) - {case["index"] for case in section_cases})
+        cached = sum(1 for result in now if result.get("cached"))
+
+        def avg_length(items) -> str:
+            lengths = [len(r["response"]) for r in items if not r.get("error")]
+            return f"{statistics.mean(lengths):.0f}" if lengths else "n/a"
+
+        def latency(items) -> str:
+            values = [r["latency"] for r in items if r.get("latency") is not None]
+            if not values:
+                return "n/a"
+            return f"{_percentile(values, 50):.2f}s / {_percentile(values, 95):.2f}s"
+
+        out.append(
+            f"| {title} | {len(now)} | {unchanged} | {changed} | {new} | {removed} "
+            f"| {cached} | {avg_length(before.values())} → {avg_length(now)} "
+            f"| {latency(before.values())} → {latency(now)} |"
+        )
 
-                content = f"{i+1}. **Topic**: {topic}\n"
-                content += f"   **User**: {user['name']}\n"
-                content += f"   **Response**: {response}\n\n"
+    out.append("\n## Changed Responses\n")
+    if not changes:
+        out.append("No responses changed.\n")
+    for title, case, old, new in changes:
+        out.append(f"### {title} #{case['index']} ({case['user']['name']})\n")
+        out.append("```diff")
+        out.extend(
+            difflib.unified_diff(
+                _sentences(old), _sentences(new), "previous", "current", lineterm=""
+            )
+        )
+        out.append("```\n")
+    return "\n".join(out)
 
-                self.write_result(content)
 
-            except Exception as e:
-                error_content = f"{i+1}. **ERROR**: {str(e)}\n   **Topic**: {topic}\n   **User**: {user['name']}\n\n"
-                self.write_result(error_content)
-                print(f"Error in daily tip: {str(e)}")
-
-    async def generate_conversation_previews(self, count: int = 10):
-        """Generate sample conversations."""
-        self.write_section(
-            "Conversation Responses", "Testing various user questions/scenarios"
+class PreviewGenerator:
+    def __init__(self, rpm: float, concurrency: int, use_cache: bool):
+        self.cache = ResponseCache()
+        self.llm = PreviewLLMService(
+            self.cache, TokenBucket(rate=rpm / 60), use_cache=use_cache
         )
-
-        for i in range(count):
-            message = TEST_MESSAGES[i % len(TEST_MESSAGES)]
-            user = TEST_USERS[i % len(TEST_USERS)]
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.timestamp = None
+        self.done: Dict[str, Dict[str, Any]] = {}
+
+    def load_checkpoint(self, fresh: bool) -> None:
+        """Resume an interrupted run, or start a new one."""
+        if fresh or not CHECKPOINT_FILE.exists():
+            CACHE_DIR.mkdir(exist_ok=True)
+            self.timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+            with open(CHECKPOINT_FILE, "w", encoding="utf-8") as f:
+                f.write(json.dumps({"timestamp": self.timestamp}) + "\n")
+            return
+
+        with open(CHECKPOINT_FILE, encoding="utf-8") as f:
+            self.timestamp = json.loads(f.readline())["timestamp"]
+            for line in f:
+                result = json.loads(line)
+                self.done[result["id"]] = result
+        print(f"Resuming run {self.timestamp}: {len(self.done)} cases already done")
+
+    def checkpoint(self, result: Dict[str, Any]) -> None:
+        with open(CHECKPOINT_FILE, "a", encoding="utf-8") as f:
+            f.write(json.dumps(result, ensure_ascii=False) + "\n")
+
+    async def generate(self, case: Dict[str, Any]) -> Dict[str, Any]:
+        """Generate one case (from cache when its prompts are unchanged)."""
+        user = case["user"]
+        current_case.set({"latency": 0.0, "cached": True, "hashes": []})
+        async with self.semaphore:
             try:
-                await self.rate_limit()
-                response = await self.llm.get_response(
-                    message=message,
-                    user_name=user["name"],
-                    has_active_goal=user["has_goal"],
-                )
-
-                content = f"{i+1}. **User**: {user['name']} "
-                content += f"({'With goal' if user['has_goal'] else 'No goal'})\n"
-                content += f'   **Message**: "{message}"\n'
-                content += f"   **Response**: {response}\n\n"
-
-                self.write_result(content)
-
+                if case["section"] == "motivation":
+                    response = await self.llm.get_daily_motivation(
+                        user_name=user["name"],
+                        has_active_goal=user["has_goal"],
+                        current_visits=user.get("visits", 0),
+                        target_visits=user.get("target", 0),
+                    )
+                elif case["section"] == "tips":
+                    response = await self.llm.get_daily_tip(
+                        user_name=user["name"], topic=case["topic"]
+                    )
+                else:
+                    response = await self.llm.get_response(
+                        message=case["message"],
+                        user_name=user["name"],
+                        has_active_goal=user["has_goal"],
+                    )
+                stats = current_case.get()
             except Exception as e:
-                error_content = (
-                    f"{i+1}. **ERROR**: {str(e)}\n"
-                    f"   **User**: {user['name']}\n"
-                    f'   **Message**: "{message}"\n\n'
-                )
-                self.write_result(error_content)
-                print(f"Error in conversation: {str(e)}")
-
-    def close(self):
-        """Close the results file."""
-        if self.results_file:
-            self.results_file.close()
-            print("\nFinished generating preview results!")
+                stats = {**current_case.get(), "error": True}
+                response = str(e)
+
+        result = {
+            "id": case["id"],
+            "section": case["section"],
+            "index": case["index"],
+            "response": response,
+            "latency": stats["latency"],
+            "cached": stats["cached"],
+            "prompt_hashes": stats["hashes"],
+            "error": stats.get("error", False),
+        }
+        if not result["error"]:
+            self.checkpoint(result)
+        print(
+            f"{case['id']}: {'cached' if result['cached'] else 'generated'}"
+            f"{' (ERROR)' if result['error'] else ''} - {response[:80]}..."
+        )
+        return result
+
+    async def run(self, cases: List[Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+        todo = [case for case in cases if case["id"] not in self.done]
+        results = await asyncio.gather(*(self.generate(case) for case in todo))
+        return {**self.done, **{result["id"]: result for result in results}}
+
+    def write_results(
+        self, cases: List[Dict[str, Any]], results: Dict[str, Dict[str, Any]]
+    ) -> Path:
+        """Write the results markdown and its JSON sidecar."""
+        path = PREVIEW_DIR / f"results_{self.timestamp}.md"
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(
+                f"# LLM Preview Tests\n"
+                f"Generated on: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n"
+                f"Model: {LLM_MODELS[0]}\n\n"
+            )
+            section = None
+            for case in cases:
+                if case["section"] != section:
+                    section = case["section"]
+                    title, description = SECTIONS[section]
+                    f.write(f"\n## {title}\n{description}\n\n")
+                f.write(format_case(case, results[case["id"]]))
+
+        with open(path.with_suffix(".json"), "w", encoding="utf-8") as f:
+            json.dump(
+                [results[case["id"]] for case in cases], f, ensure_ascii=False, indent=1
+            )
+        return path
+
+
+def previous_results(current: Path) -> Optional[Path]:
+    runs = sorted(p for p in PREVIEW_DIR.glob("results_*.md") if p != current)
+    return runs[-1] if runs else None
 
 
 async def main():
-    generator = PreviewGenerator()
-    generator.start_results_file()
-
-    try:
-        # await generator.generate_daily_motivation_previews()
-        await generator.generate_daily_tip_previews()
-        # await generator.generate_conversation_previews()
-    finally:
-        generator.close()
+    parser = argparse.ArgumentParser(description="Generate LLM response previews")
+    parser.add_argument(
+        "--sections",
+        default=",".join(SECTIONS),
+        help=f"comma separated, any of: {', '.join(SECTIONS)}",
+    )
+    parser.add_argument("--count", type=int, default=10, help="cases per section")
+    parser.add_argument("--rpm", type=float, default=REQUESTS_PER_MINUTE)
+    parser.add_argument("--concurrency", type=int, default=CONCURRENCY)
+    parser.add_argument(
+        "--no-cache", action="store_true", help="regenerate every response"
+    )
+    parser.add_argument(
+        "--fresh", action="store_true", help="discard an interrupted run"
+    )
+    args = parser.parse_args()
+
+    sections = [s.strip() for s in args.sections.split(",") if s.strip() in SECTIONS]
+    cases = build_cases(sections, args.count)
+
+    generator = PreviewGenerator(args.rpm, args.concurrency, not args.no_cache)
+    generator.load_checkpoint(args.fresh)
+
+    start = time.monotonic()
+    results = await generator.run(cases)
+    failed = [r["id"] for r in results.values() if r["error"]]
+
+    path = generator.write_results(cases, results)
+    print(f"\nWrote {path} in {time.monotonic() - start:.1f}s")
+
+    previous = previous_results(path)
+    if previous:
+        diff = build_diff(cases, results, parse_results(previous), previous.name)
+        diff_path = PREVIEW_DIR / f"diff_{generator.timestamp}.md"
+        diff_path.write_text(diff, encoding="utf-8")
+        print(diff.split("\n## Changed Responses")[0])
+        print(f"Full diff: {diff_path}")
+
+    if failed:
+        print(f"{len(failed)} cases failed, run again to retry them: {failed}")
+    else:
+        CHECKPOINT_FILE.unlink(missing_ok=True)
 
 
 if __name__ == "__main__":
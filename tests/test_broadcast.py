@@ -0,0 +1,105 @@
+import asyncio
+from datetime import date
+
+import pytest
+from telegram.error import Forbidden, RetryAfter
+
+from broadcast import MAX_SEND_RETRIES, Broadcaster
+from rate_limit import KeyedRateLimiter
+from storage import SQLiteStorage
+
+DAY = date(2025, 1, 25)
+
+
+class FakeBot:
+    """Records sent messages; chats can be made to fail a number of times."""
+
+    def __init__(self):
+        self.sent = []
+        self.errors = {}  # chat_id -> exceptions raised by the next sends
+
+    async def send_message(self, chat_id, text):
+        errors = self.errors.get(chat_id)
+        if errors:
+            raise errors.pop(0)
+        self.sent.append((chat_id, text))
+
+
+@pytest.fixture
+def broadcaster():
+    broadcaster = Broadcaster(SQLiteStorage(":memory:"))
+    broadcaster.chat_limiter = KeyedRateLimiter(0)
+    return broadcaster
+
+
+async def greet(user_id, user_name):
+    return f"Hi {user_name}"
+
+
+RECIPIENTS = [(1, "Ala"), (2, "Bob"), (3, "Cez")]
+
+
+def test_retries_after_flood_control(broadcaster):
+    bot = FakeBot()
+    bot.errors[2] = [RetryAfter(0), RetryAfter(0)]
+
+    report = asyncio.run(
+        broadcaster.run("tip", bot, RECIPIENTS, make_message=greet, day=DAY)
+    )
+
+    assert sorted(bot.sent) == [(1, "Hi Ala"), (2, "Hi Bob"), (3, "Hi Cez")]
+    assert (report["delivered"], report["failed"]) == (3, 0)
+
+
+def test_gives_up_after_max_retries(broadcaster):
+    bot = FakeBot()
+    bot.errors[2] = [RetryAfter(0)] * MAX_SEND_RETRIES
+    bot.errors[3] = [Forbidden("bot was blocked by the user")]
+
+    report = asyncio.run(
+        broadcaster.run("tip", bot, RECIPIENTS, make_message=greet, day=DAY)
+    )
+
+    assert bot.sent == [(1, "Hi Ala")]
+    assert (report["delivered"], report["skipped"], report["failed"]) == (1, 1, 1)
+
+
+def test_run_is_idempotent_per_run_id(broadcaster):
+    bot = FakeBot()
+    bot.errors[2] = [RuntimeError("network down")]
+
+    first = asyncio.run(
+        broadcaster.run("tip", bot, RECIPIENTS, make_message=greet, day=DAY)
+    )
+    second = asyncio.run(
+        broadcaster.run("tip", bot, RECIPIENTS, make_message=greet, day=DAY)
+    )
+    other_day = asyncio.run(
+        broadcaster.run(
+            "tip", bot, RECIPIENTS, make_message=greet, day=date(2025, 1, 26)
+        )
+    )
+
+    assert first["failed"] == 1
+    assert (second["already_delivered"], second["delivered"]) == (2, 1)
+    assert other_day["delivered"] == 3
+    assert [chat_id for chat_id, _ in bot.sent].count(1) == 2
+
+
+def test_batches_skip_users_without_a_message(broadcaster):
+    bot = FakeBot()
+    batches = []
+
+    async def make_batch(batch):
+        batches.append([user_id for user_id, _ in batch])
+        return {user_id: f"Tip for {name}" for user_id, name in batch if user_id != 3}
+
+    report = asyncio.run(
+        broadcaster.run(
+            "tip", bot, RECIPIENTS, make_batch=make_batch, batch_size=2, day=DAY
+        )
+    )
+
+    assert batches == [[1, 2], [3]]
+    assert sorted(bot.sent) == [(1, "Tip for Ala"), (2, "Tip for Bob")]
+    assert (report["delivered"], report["skipped"]) == (2, 1)
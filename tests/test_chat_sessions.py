@@ -0,0 +1,101 @@
+import asyncio
+
+import chat_sessions
+import llm_service
+from chat_sessions import ChatSessions
+from llm_service import LLMService
+
+
+def test_repeated_roles_are_merged_into_one_turn():
+    sessions = ChatSessions()
+    session = sessions.start(1, "context", [{"role": "user", "parts": ["hey"]}])
+
+    session.add("user", "you there?")
+    sessions.append(1, "model", "Yo bro")
+
+    assert session.contents == [
+        {"role": "user", "parts": ["hey", "you there?"]},
+        {"role": "model", "parts": ["Yo bro"]},
+    ]
+
+
+def test_sessions_are_dropped_when_the_context_changes():
+    sessions = ChatSessions()
+    sessions.start(1, "no goal", [])
+
+    assert sessions.get(1, "no goal") is not None
+    assert sessions.get(1, "goal: 3 visits") is None
+    assert sessions.get(1, "no goal") is None
+
+
+def test_long_sessions_are_rebuilt(monkeypatch):
+    monkeypatch.setattr(chat_sessions, "MAX_SESSION_CONTENTS", 4)
+    sessions = ChatSessions()
+    session = sessions.start(1, "context", [])
+    for i in range(4):
+        session.add("user" if i % 2 == 0 else "model", f"turn {i}")
+
+    assert sessions.get(1, "context") is None
+
+
+def test_least_recently_used_sessions_are_evicted():
+    evicted = []
+
+    def on_evict(session):
+        evicted.append(session.user_id)
+        raise RuntimeError("database is down")
+
+    sessions = ChatSessions(max_sessions=2, on_evict=on_evict)
+    sessions.start(1, "context", [])
+    sessions.start(2, "context", [])
+    sessions.get(1, "context")
+    sessions.start(3, "context", [])
+
+    assert evicted == [2]
+    assert len(sessions) == 2
+    assert sessions.get(1, "context") is not None
+
+
+class _Response:
+    def __init__(self, text: str):
+        self.text = text
+        self.usage_metadata = None
+
+
+class Model:
+    """Records the contents of every request."""
+
+    def __init__(self):
+        self.requests = []
+
+    async def generate_content_async(self, contents, generation_config=None):
+        self.requests.append(list(contents))
+        return _Response(f"Reply {len(self.requests)}")
+
+
+def test_turns_extend_the_previous_request(monkeypatch):
+    monkeypatch.setattr(llm_service, "RETRY_DELAY", 0)
+    service = LLMService()
+    instructions = set()
+    model = Model()
+
+    def make_model(name, system_instruction):
+        instructions.add(system_instruction)
+        return model
+
+    service.cascade.make_model = make_model
+
+    async def main():
+        await service.get_response("hey", "Ala", user_id=1)
+        await service.get_response("leg day?", "Ala", user_id=1)
+
+    asyncio.run(main())
+
+    first, second = model.requests
+    assert second[: len(first)] == first
+    assert second[len(first) :] == [
+        {"role": "model", "parts": ["Reply 1"]},
+        {"role": "user", "parts": ["leg day?"]},
+    ]
+    # The system instruction doesn't depend on the user
+    assert len(instructions) == 1
@@ -0,0 +1,101 @@
+import asyncio
+
+import pytest
+
+import content_pool
+from content_pool import MOTIVATION, TIP, ContentPool, motivation_bucket
+from storage import SQLiteStorage
+
+
+class FakeLLM:
+    """Generates numbered templates for the requested kind and bucket."""
+
+    GYM_TOPICS = ["squats", "cardio"]
+
+    def __init__(self, extra=()):
+        self.requests = []
+        self.extra = list(extra)
+
+    async def generate_pool_entries(self, kind, description, count):
+        self.requests.append((kind, description))
+        start = len(self.requests) * 10
+        return [
+            f"{description} #{start + i} for {{name}}" for i in range(count)
+        ] + self.extra
+
+
+@pytest.fixture
+def storage():
+    return SQLiteStorage(":memory:")
+
+
+@pytest.fixture
+def pool(storage, monkeypatch):
+    monkeypatch.setattr(content_pool, "POOL_BATCH_SIZE", 3)
+    monkeypatch.setattr(content_pool, "POOL_TARGET_PER_BUCKET", 3)
+    return ContentPool(storage, FakeLLM())
+
+
+def fill(pool):
+    while asyncio.run(pool.fill_once()):
+        pass
+
+
+def test_never_repeats_an_entry_for_a_user(pool):
+    fill(pool)
+
+    tips = [pool.take_tip(1, "Ala") for _ in range(6)]
+
+    assert None not in tips
+    assert len(set(tips)) == 6
+    assert pool.take_tip(1, "Ala") is None
+    assert pool.take_tip(2, "Bob") is not None
+
+
+def test_deliveries_survive_a_reload(pool, storage):
+    fill(pool)
+    seen = {pool.take_tip(1, "Ala") for _ in range(5)}
+    asyncio.run(pool.flush())
+
+    reloaded = ContentPool(storage, FakeLLM())
+
+    last = reloaded.take_tip(1, "Ala")
+    assert last is not None and last not in seen
+    assert reloaded.take_tip(1, "Ala") is None
+
+
+def test_used_up_entries_are_pruned(pool, monkeypatch):
+    monkeypatch.setattr(content_pool, "POOL_MAX_USES", 2)
+    fill(pool)
+    for user_id in (1, 2):
+        for _ in range(6):
+            pool.take_tip(user_id, "Ala")
+
+    assert pool.stock(TIP, "squats") == 0
+    assert pool.prune() == 6
+    assert pool.take_tip(3, "Cez") is None
+
+
+def test_fill_fills_every_bucket_and_skips_malformed_templates(storage, monkeypatch):
+    monkeypatch.setattr(content_pool, "POOL_BATCH_SIZE", 2)
+    monkeypatch.setattr(content_pool, "POOL_TARGET_PER_BUCKET", 2)
+    llm = FakeLLM(extra=["Hey {nam}!", "Only {current/target"])
+    pool = ContentPool(storage, llm)
+
+    fill(pool)
+
+    buckets = FakeLLM.GYM_TOPICS + list(content_pool.MOTIVATION_BUCKETS)
+    assert len(llm.requests) == len(buckets)
+    assert all(pool.stock(TIP, topic) == 2 for topic in FakeLLM.GYM_TOPICS)
+    assert pool.stock(MOTIVATION, "goal_done") == 2
+
+
+def test_motivation_matches_the_goal_progress(pool):
+    fill(pool)
+    goal = {"current_visits": 2, "target_visits": 3}
+
+    text = pool.take_motivation(1, "Ala", goal)
+
+    assert motivation_bucket(goal) == "goal_almost_done"
+    assert text.startswith("The user needs just one more gym visit")
+    assert text.endswith("for Ala")
@@ -0,0 +1,220 @@
+import asyncio
+import threading
+from datetime import datetime
+
+import pytest
+
+import conversation_buffer
+from conversation_buffer import ConversationBuffer
+
+
+class FakeDatabase:
+    """Message store whose writes can be held in flight."""
+
+    def __init__(self, commit_before_wait: bool = False):
+        self.rows = []
+        self.summaries = {}
+        self.fail = False
+        self.writing = threading.Event()
+        self.release = threading.Event()
+        self.release.set()
+        self.commit_before_wait = commit_before_wait
+
+    def add_messages(self, messages):
+        if self.fail:
+            return False
+        if self.commit_before_wait:
+            self.rows += messages
+        self.writing.set()
+        self.release.wait(5)
+        if not self.commit_before_wait:
+            self.rows += messages
+        return True
+
+    def get_message_history(self, user_id, max_messages, max_age_hours, since=None):
+        return [
+            {key: row[key] for key in ("role", "content", "created_at")}
+            for row in self.rows
+            if row["user_id"] == user_id
+            and (since is None or datetime.fromisoformat(row["created_at"]) > since)
+        ]
+
+    def get_conversation_summary(self, user_id):
+        return self.summaries.get(user_id)
+
+    def save_conversation_summary(self, user_id, summary, summarized_until):
+        self.summaries[user_id] = {
+            "summary": summary,
+            "summarized_until": summarized_until.isoformat(),
+        }
+
+
+def contents(buffer, user_id):
+    return [message["content"] for message in buffer.get_history(user_id)]
+
+
+@pytest.mark.parametrize("commit_before_wait", [False, True])
+def test_user_hydrated_during_a_flush_keeps_the_batch(commit_before_wait):
+    db = FakeDatabase(commit_before_wait)
+    buffer = ConversationBuffer(db, max_users=1)
+
+    async def main():
+        buffer.add_message(1, "hey")
+        buffer.add_message(1, "yo bro", role="model")
+        db.release.clear()
+        flush = asyncio.create_task(buffer.flush())
+        await asyncio.to_thread(db.writing.wait, 5)
+
+        contents(buffer, 2)  # evicts user 1
+        assert contents(buffer, 1) == ["hey", "yo bro"]
+
+        db.release.set()
+        assert await flush == 2
+        contents(buffer, 2)
+        assert contents(buffer, 1) == ["hey", "yo bro"]
+
+    asyncio.run(main())
+
+
+def test_failed_flushes_keep_at_most_max_pending(monkeypatch):
+    monkeypatch.setattr(conversation_buffer, "MAX_PENDING", 3)
+    db = FakeDatabase()
+    buffer = ConversationBuffer(db)
+
+    async def main():
+        db.fail = True
+        for i in range(5):
+            buffer.add_message(1, f"message {i}")
+        assert await buffer.flush() == 0
+        buffer.add_message(1, "message 5")
+        assert await buffer.flush() == 0
+
+        db.fail = False
+        assert await buffer.flush() == 3
+
+    asyncio.run(main())
+    assert [row["content"] for row in db.rows] == [
+        "message 3",
+        "message 4",
+        "message 5",
+    ]
+
+
+def test_load_reads_history_off_the_event_loop():
+    db = FakeDatabase()
+    db.rows = [
+        {
+            "user_id": 1,
+            "role": "user",
+            "content": "stored",
+            "created_at": "2099-01-01T00:00:00+00:00",
+        }
+    ]
+    reads = []
+    reading, release = threading.Event(), threading.Event()
+    get_message_history = db.get_message_history
+
+    def slow_history(*args, **kwargs):
+        reads.append(threading.current_thread())
+        reading.set()
+        release.wait(5)
+        return get_message_history(*args, **kwargs)
+
+    db.get_message_history = slow_history
+    buffer = ConversationBuffer(db)
+
+    async def main():
+        loads = [asyncio.create_task(buffer.load(1)) for _ in range(2)]
+        # The loop keeps running while the history is read
+        await asyncio.to_thread(reading.wait, 5)
+        release.set()
+        await asyncio.gather(*loads)
+
+    asyncio.run(main())
+
+    assert len(reads) == 1
+    assert reads[0] is not threading.main_thread()
+    assert contents(buffer, 1) == ["stored"]
+
+
+class Summarizer:
+    """Joins the folded turns onto the previous summary."""
+
+    def __init__(self, fail=False):
+        self.calls = []
+        self.fail = fail
+
+    async def __call__(self, previous, turns):
+        self.calls.append((previous, [turn["content"] for turn in turns]))
+        if self.fail:
+            return None
+        return " ".join([previous or "summary:"] + [t["content"] for t in turns])
+
+
+def add_messages(buffer, user_id, start, stop):
+    for i in range(start, stop):
+        buffer.add_message(user_id, f"message {i}")
+
+
+async def summarized(buffer):
+    while buffer._summarizing:
+        await asyncio.sleep(0.01)
+
+
+def test_aged_turns_are_folded_into_the_summary(monkeypatch):
+    monkeypatch.setattr(conversation_buffer, "SUMMARY_BATCH", 2)
+    summarizer = Summarizer()
+    buffer = ConversationBuffer(FakeDatabase(), summarizer=summarizer, window=2)
+
+    async def main():
+        add_messages(buffer, 1, 0, 4)
+        await summarized(buffer)
+        add_messages(buffer, 1, 4, 6)
+        await summarized(buffer)
+
+    asyncio.run(main())
+
+    assert summarizer.calls == [
+        (None, ["message 0", "message 1"]),
+        ("summary: message 0 message 1", ["message 2", "message 3"]),
+    ]
+    assert buffer.get_summary(1) == "summary: message 0 message 1 message 2 message 3"
+    assert contents(buffer, 1) == ["message 4", "message 5"]
+
+
+def test_turns_stay_verbatim_while_summarizing_fails(monkeypatch):
+    monkeypatch.setattr(conversation_buffer, "SUMMARY_BATCH", 2)
+    summarizer = Summarizer(fail=True)
+    buffer = ConversationBuffer(FakeDatabase(), summarizer=summarizer, window=2)
+
+    async def main():
+        add_messages(buffer, 1, 0, 4)
+        await summarized(buffer)
+        add_messages(buffer, 1, 4, 5)
+        await summarized(buffer)
+
+    asyncio.run(main())
+
+    assert len(summarizer.calls) == 2
+    assert buffer.get_summary(1) is None
+    assert contents(buffer, 1) == [f"message {i}" for i in range(5)]
+
+
+def test_hydration_skips_turns_covered_by_the_stored_summary(monkeypatch):
+    monkeypatch.setattr(conversation_buffer, "SUMMARY_BATCH", 2)
+    db = FakeDatabase()
+    buffer = ConversationBuffer(db, summarizer=Summarizer(), window=2)
+
+    async def main():
+        add_messages(buffer, 1, 0, 4)
+        await summarized(buffer)
+        await buffer.flush()
+
+        reloaded = ConversationBuffer(db, summarizer=Summarizer(), window=2)
+        await reloaded.load(1)
+        return reloaded
+
+    reloaded = asyncio.run(main())
+
+    assert reloaded.get_summary(1) == "summary: message 0 message 1"
+    assert contents(reloaded, 1) == ["message 2", "message 3"]
@@ -0,0 +1,80 @@
+import asyncio
+import json
+import logging
+from datetime import datetime, timezone
+
+import pytest
+
+import instrumentation
+from instrumentation import (
+    InstrumentedStorage,
+    _payload_size,
+    storage_latency,
+    storage_rows,
+    track,
+    tracked,
+)
+from storage import SQLiteStorage
+
+
+@pytest.fixture
+def storage():
+    return InstrumentedStorage(SQLiteStorage(":memory:"))
+
+
+def test_calls_are_recorded_per_table_and_operation(storage):
+    latency = storage_latency.count(table="messages", operation="insert")
+    rows = [{"user_id": 1, "role": "user", "content": f"message {i}"} for i in range(3)]
+
+    with track("handler") as calls:
+        storage.insert_messages(rows)
+        storage.get_messages(1, datetime(2000, 1, 1, tzinfo=timezone.utc), 10)
+        storage.get_rows_before("messages", "created_at", "2000-01-01", 10)
+
+    assert storage_latency.count(table="messages", operation="insert") == latency + 1
+    assert [(c["table"], c["operation"], c["rows"]) for c in calls] == [
+        ("messages", "insert", 3),
+        ("messages", "select", 3),
+        ("messages", "select", 0),
+    ]
+    assert storage_rows.count(table="messages", operation="select") >= 2
+
+
+def test_slow_calls_are_logged_with_the_handler(storage, monkeypatch, caplog):
+    monkeypatch.setattr(instrumentation, "SLOW_QUERY_MS", 0)
+
+    @tracked
+    async def status(update, context):
+        storage.get_latest_stats()
+
+    with caplog.at_level(logging.WARNING, logger="instrumentation"):
+        asyncio.run(status(None, None))
+
+    assert "gym_stats.select (get_latest_stats)" in caplog.text
+    assert "[handler: status]" in caplog.text
+
+
+def test_payload_size_is_exact_for_small_payloads():
+    rows = [{"timestamp": "2025-01-25T12:00:00+00:00", "count": i} for i in range(5)]
+
+    assert _payload_size(rows) == len(json.dumps(rows))
+    assert _payload_size(None) == 0
+
+
+def test_payload_size_of_large_results_is_estimated_from_samples(monkeypatch):
+    rows = [
+        {"timestamp": f"2025-01-{1 + i % 28:02d}T12:00:00+00:00", "count": i % 97}
+        for i in range(4000)
+    ]
+    dumps = json.dumps
+    serialized = []
+    monkeypatch.setattr(
+        instrumentation.json,
+        "dumps",
+        lambda value, **kwargs: serialized.append(len(value)) or dumps(value, **kwargs),
+    )
+
+    estimate = _payload_size(rows)
+
+    assert serialized == [instrumentation.SIZE_SAMPLE_ROWS]
+    assert abs(estimate - len(dumps(rows))) / len(dumps(rows)) < 0.05
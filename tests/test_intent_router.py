@@ -0,0 +1,65 @@
+import pytest
+
+from intent_router import BEST_TIME, CHAT, GOAL_PROGRESS, OCCUPANCY, IntentRouter
+
+
+@pytest.fixture(scope="module")
+def router():
+    return IntentRouter(stats=None, db=None)
+
+
+@pytest.mark.parametrize(
+    "text, intent",
+    [
+        # Questions about the gym's current state
+        ("is the gym busy", OCCUPANCY),
+        ("Is it busy right now?", OCCUPANCY),
+        ("how busy is the gym rn", OCCUPANCY),
+        ("how crowded is it", OCCUPANCY),
+        ("is it packed today", OCCUPANCY),
+        ("how many people are at the gym", OCCUPANCY),
+        ("how many people now", OCCUPANCY),
+        ("anyone at the gym?", OCCUPANCY),
+        ("gym busy rn", OCCUPANCY),
+        ("current occupancy", OCCUPANCY),
+        ("ile osób jest na siłowni", OCCUPANCY),
+        ("when is it least busy", BEST_TIME),
+        ("what time is the gym quiet tomorrow", BEST_TIME),
+        ("when should i go to the gym to avoid crowds", BEST_TIME),
+        ("good time to hit the gym", BEST_TIME),
+        ("when is the best time to go", BEST_TIME),
+        ("how is my goal going", GOAL_PROGRESS),
+        ("what's my progress this week?", GOAL_PROGRESS),
+        ("how many visits left", GOAL_PROGRESS),
+        ("did i hit my goal", GOAL_PROGRESS),
+        ("am i on track this week", GOAL_PROGRESS),
+        # Chat that mentions the gym, or something full, empty or busy
+        ("is it normal that my stomach feels full after a protein shake?", CHAT),
+        ("this is why it feels so empty without leg day", CHAT),
+        ("what is the best time of day to take creatine before the gym", CHAT),
+        ("my gym bag is full of sweaty clothes, is it gross?", CHAT),
+        ("the gym is full of bros lol", CHAT),
+        ("the gym was packed, how do i get a bench", CHAT),
+        ("is it worth going to the gym when sick", CHAT),
+        ("when is it ok to skip the gym", CHAT),
+        ("best time to eat before the gym", CHAT),
+        ("what time do you go to the gym", CHAT),
+        ("how busy are you this week", CHAT),
+        ("how full is your stomach", CHAT),
+        ("how many people skip leg day", CHAT),
+        ("how is my form on squats", CHAT),
+        ("my goal is to bench 100kg", CHAT),
+        ("is leg day the best day", CHAT),
+        # Questions about the past or another time than now
+        ("how many people were at the gym yesterday", CHAT),
+        ("how many people are at the gym at 6pm", CHAT),
+        ("is the gym busy on monday", CHAT),
+        ("was the gym busy last week", CHAT),
+        ("is it busy tomorrow", CHAT),
+        ("how crowded is the gym tonight", CHAT),
+        ("when is the gym quiet next week", CHAT),
+        ("did i hit my goal last week", CHAT),
+    ],
+)
+def test_classify(router, text, intent):
+    assert router.classify(text)[0] == intent
@@ -0,0 +1,230 @@
+import asyncio
+from datetime import date, datetime, time, timedelta
+
+import pytest
+
+import job_scheduler
+from job_scheduler import TIMEZONE, DailyBetween, Every, JobScheduler
+from storage import SQLiteStorage
+
+
+class Once:
+    """A single occurrence at a fixed time."""
+
+    def __init__(self, at: datetime):
+        self.at = at
+
+    def occurrences(self, start: datetime, end: datetime):
+        return [self.at] if start <= self.at <= end else []
+
+
+class At:
+    """Occurrences at the given times."""
+
+    def __init__(self, *times: datetime):
+        self.times = sorted(times)
+
+    def occurrences(self, start: datetime, end: datetime):
+        return [at for at in self.times if start <= at <= end]
+
+
+@pytest.fixture
+def storage():
+    return SQLiteStorage(":memory:")
+
+
+@pytest.fixture
+def scheduled_for():
+    return datetime.now(TIMEZONE).replace(microsecond=0) - timedelta(minutes=1)
+
+
+def replica(storage, owner, callback, scheduled_for):
+    scheduler = JobScheduler(storage, owner)
+    scheduler.add("job", callback, Once(scheduled_for), timedelta(hours=1))
+    return scheduler
+
+
+async def settle(*schedulers):
+    """Wait for the runs the schedulers started."""
+    for scheduler in schedulers:
+        await asyncio.gather(*scheduler._running.values(), return_exceptions=True)
+
+
+def run_row(storage):
+    (row,) = storage.get_job_runs(datetime.now(TIMEZONE) - timedelta(days=1))
+    return row
+
+
+def test_two_replicas_run_each_occurrence_once(storage, scheduled_for):
+    runs = []
+
+    async def job(context, at):
+        runs.append(at)
+
+    async def main():
+        a = replica(storage, "a", job, scheduled_for)
+        b = replica(storage, "b", job, scheduled_for)
+        await asyncio.gather(a.tick(None), b.tick(None))
+        await settle(a, b)
+        await asyncio.gather(a.tick(None), b.tick(None))
+        await settle(a, b)
+
+    asyncio.run(main())
+    assert runs == [scheduled_for]
+    assert run_row(storage)["status"] == "done"
+
+
+def test_failed_run_is_retried(storage, scheduled_for, monkeypatch):
+    monkeypatch.setattr(job_scheduler, "JOB_RETRY_DELAY", 0)
+    attempts = []
+
+    async def job(context, at):
+        attempts.append(at)
+        if len(attempts) == 1:
+            raise RuntimeError("first attempt fails")
+
+    async def main():
+        a = replica(storage, "a", job, scheduled_for)
+        b = replica(storage, "b", job, scheduled_for)
+        await a.tick(None)
+        await settle(a)
+        assert run_row(storage)["status"] == "failed"
+        await b.tick(None)
+        await settle(b)
+
+    asyncio.run(main())
+    assert len(attempts) == 2
+    row = run_row(storage)
+    assert (row["status"], row["attempts"], row["error"]) == ("done", 2, None)
+
+
+def test_crashed_replica_run_is_taken_over_after_its_lease(storage, scheduled_for):
+    runs = []
+
+    async def job(context, at):
+        runs.append(at)
+
+    # A replica claimed the run and died; its lease has expired since
+    now = datetime.now(TIMEZONE)
+    assert storage.claim_job_run("job", scheduled_for, "dead", 0, now, now)
+
+    async def main():
+        b = replica(storage, "b", job, scheduled_for)
+        await b.tick(None)
+        await settle(b)
+
+    asyncio.run(main())
+    assert runs == [scheduled_for]
+    row = run_row(storage)
+    assert (row["status"], row["owner"], row["attempts"]) == ("done", "b", 2)
+
+
+def test_leased_run_is_not_taken_over(storage, scheduled_for):
+    runs = []
+
+    async def job(context, at):
+        runs.append(at)
+
+    now = datetime.now(TIMEZONE)
+    lease_until = now + timedelta(minutes=5)
+    assert storage.claim_job_run("job", scheduled_for, "a", 0, lease_until, now)
+
+    async def main():
+        b = replica(storage, "b", job, scheduled_for)
+        await b.tick(None)
+        await settle(b)
+
+    asyncio.run(main())
+    assert runs == []
+
+
+@pytest.mark.parametrize("failed_attempts", [0, 1])
+def test_released_run_is_resumed_by_another_replica(
+    storage, scheduled_for, failed_attempts, monkeypatch
+):
+    monkeypatch.setattr(job_scheduler, "JOB_RETRY_DELAY", 0)
+    calls = []
+
+    async def job(context, at):
+        calls.append(context)
+        if context == "a":
+            if len(calls) <= failed_attempts:
+                raise RuntimeError("attempt fails")
+            await asyncio.Event().wait()  # runs until the replica shuts down
+
+    async def main():
+        a = replica(storage, "a", job, scheduled_for)
+        for _ in range(failed_attempts):
+            await a.tick("a")
+            await settle(a)
+        await a.tick("a")
+        await asyncio.sleep(0)
+        assert a._running
+        await a.shutdown()
+
+        row = run_row(storage)
+        assert row["attempts"] == failed_attempts  # the release didn't count
+
+        b = replica(storage, "b", job, scheduled_for)
+        await b.tick("b")
+        await settle(b)
+
+    asyncio.run(main())
+    assert calls[-1] == "b"
+    row = run_row(storage)
+    assert (row["status"], row["owner"]) == ("done", "b")
+    assert row["attempts"] == failed_attempts + 1
+
+
+def test_missed_runs_are_caught_up_oldest_first(storage, scheduled_for):
+    runs = []
+
+    async def job(context, at):
+        runs.append(at)
+
+    too_old = scheduled_for - timedelta(hours=3)
+    missed = scheduled_for - timedelta(hours=2)
+
+    async def main():
+        scheduler = JobScheduler(storage, "a")
+        scheduler.add(
+            "job",
+            job,
+            At(too_old, missed, scheduled_for),
+            timedelta(hours=2, minutes=30),
+        )
+        for _ in range(3):
+            await scheduler.tick(None)
+            await settle(scheduler)
+
+    asyncio.run(main())
+    assert runs == [missed, scheduled_for]
+
+
+def test_daily_between_times_agree_across_replicas():
+    schedule = DailyBetween(time(9), time(12), seed="tip")
+    days = [date(2025, 1, 20) + timedelta(days=i) for i in range(7)]
+
+    times = [schedule.time_on(day) for day in days]
+
+    assert times == [DailyBetween(time(9), time(12), "tip").time_on(d) for d in days]
+    assert all(time(9) <= at < time(12) for at in times)
+    assert len(set(times)) > 1
+
+
+def test_every_is_aligned_and_limited_to_its_hours():
+    schedule = Every(900, between=(time(6), time(8)))
+    start = TIMEZONE.localize(datetime(2025, 1, 25, 5, 50, 7))
+
+    occurrences = schedule.occurrences(start, start + timedelta(hours=3))
+
+    assert [at.strftime("%H:%M:%S") for at in occurrences] == [
+        "06:00:00",
+        "06:15:00",
+        "06:30:00",
+        "06:45:00",
+        "07:00:00",
+        "07:15:00",
+        "07:30:00",
+        "07:45:00",
+    ]
@@ -0,0 +1,78 @@
+import asyncio
+
+import pytest
+
+from llm_scheduler import (
+    BACKGROUND,
+    BROADCAST,
+    INTERACTIVE,
+    LLMScheduler,
+    SchedulerOverloaded,
+)
+
+
+async def take(scheduler, priority, order):
+    await scheduler.acquire(priority)
+    order.append(priority)
+
+
+def test_waiters_get_slots_in_priority_order():
+    scheduler = LLMScheduler(rpm=1200, burst=1)
+    order = []
+
+    async def main():
+        assert scheduler.try_acquire()
+        waiters = [
+            asyncio.create_task(take(scheduler, priority, order))
+            for priority in (BACKGROUND, BROADCAST, INTERACTIVE)
+        ]
+        await asyncio.sleep(0)
+        assert scheduler.queue_length == 3
+        await asyncio.gather(*waiters)
+
+    asyncio.run(main())
+
+    assert order == [INTERACTIVE, BROADCAST, BACKGROUND]
+
+
+def test_full_queue_sheds_the_lowest_priority():
+    scheduler = LLMScheduler(rpm=1200, burst=1, max_queue=2)
+    order = []
+
+    async def main():
+        assert scheduler.try_acquire()
+        background = asyncio.create_task(take(scheduler, BACKGROUND, order))
+        broadcast = asyncio.create_task(take(scheduler, BROADCAST, order))
+        await asyncio.sleep(0)
+
+        interactive = asyncio.create_task(take(scheduler, INTERACTIVE, order))
+        await asyncio.sleep(0)
+        with pytest.raises(SchedulerOverloaded):
+            await background
+
+        # Nothing queued is less important than a new background request
+        with pytest.raises(SchedulerOverloaded):
+            await scheduler.acquire(BACKGROUND)
+        await asyncio.gather(broadcast, interactive)
+
+    asyncio.run(main())
+
+    assert order == [INTERACTIVE, BROADCAST]
+    assert scheduler.queue_length == 0
+
+
+def test_cancelled_waiters_do_not_take_a_slot():
+    scheduler = LLMScheduler(rpm=1200, burst=1)
+    order = []
+
+    async def main():
+        assert scheduler.try_acquire()
+        cancelled = asyncio.create_task(take(scheduler, INTERACTIVE, order))
+        waiter = asyncio.create_task(take(scheduler, BACKGROUND, order))
+        await asyncio.sleep(0)
+        cancelled.cancel()
+        await waiter
+
+    asyncio.run(main())
+
+    assert order == [BACKGROUND]
@@ -0,0 +1,128 @@
+import asyncio
+
+import pytest
+
+import llm_service
+from llm_service import CHAT_FALLBACK, LLMService
+from llm_telemetry import calls_total, fallbacks_total
+
+
+class _Chunk:
+    def __init__(self, text: str):
+        self.text = text
+        self.parts = [text] if text else []
+        self.usage_metadata = None
+
+
+class StreamModel:
+    """Stand-in for genai.GenerativeModel streaming the given chunk texts."""
+
+    def __init__(self, texts):
+        self.texts = texts
+        self.calls = 0
+
+    async def generate_content_async(
+        self, contents, generation_config=None, stream=False
+    ):
+        self.calls += 1
+
+        async def chunks():
+            for text in self.texts:
+                yield _Chunk(text)
+
+        return chunks()
+
+
+class _Response:
+    def __init__(self, text: str):
+        self.text = text
+        self.usage_metadata = None
+
+
+class Model:
+    """Stand-in for genai.GenerativeModel; requests whose newest message
+    contains "slow" hang."""
+
+    def __init__(self):
+        self.calls = 0
+        self.cancelled = 0
+
+    async def generate_content_async(self, contents, generation_config=None):
+        self.calls += 1
+        if "slow" in contents[-1]["parts"][-1]:
+            try:
+                await asyncio.sleep(3600)
+            except asyncio.CancelledError:
+                self.cancelled += 1
+                raise
+        return _Response("Yo bro")
+
+
+@pytest.fixture
+def service(monkeypatch):
+    monkeypatch.setattr(llm_service, "RETRY_DELAY", 0)
+    return LLMService()
+
+
+def stream(service, model):
+    service.cascade.make_model = lambda name, system_instruction: model
+
+    async def collect():
+        return [
+            chunk async for chunk in service.stream_response("hey", "Ala", user_id=1)
+        ]
+
+    return asyncio.run(collect())
+
+
+def test_stream_response_yields_the_chunks(service):
+    model = StreamModel(["Yo ", "", "bro"])
+
+    assert stream(service, model) == ["Yo ", "bro"]
+    assert model.calls == 1
+
+
+@pytest.mark.parametrize("texts", [[], ["", ""]])
+def test_empty_stream_yields_the_fallback(service, texts):
+    model = StreamModel(texts)
+    labels = {"method": "stream_response", "model": service.cascade.primary}
+    errors = calls_total.value(outcome="error", **labels)
+    oks = calls_total.value(outcome="ok", **labels)
+    fallbacks = fallbacks_total.value(method="stream_response", kind="canned")
+
+    assert stream(service, model) == [CHAT_FALLBACK]
+    assert model.calls == llm_service.MAX_RETRIES  # retried as a failed attempt
+    assert service.sessions.get(1, "") is None and len(service.sessions) == 0
+    assert calls_total.value(outcome="error", **labels) == errors + 1
+    assert calls_total.value(outcome="ok", **labels) == oks
+    assert (
+        fallbacks_total.value(method="stream_response", kind="canned") == fallbacks + 1
+    )
+
+
+def test_newer_message_cancels_the_users_inflight_generation(service, monkeypatch):
+    monkeypatch.setattr(llm_service, "LLM_TIMEOUT", 1)
+    model = Model()
+    service.cascade.make_model = lambda name, system_instruction: model
+
+    async def main():
+        first = asyncio.create_task(service.get_response("slow one", "Ala", user_id=1))
+        other_user = asyncio.create_task(service.get_response("hey", "Bob", user_id=2))
+        await asyncio.sleep(0.01)
+        second = await service.get_response("hey", "Ala", user_id=1)
+        return await first, await other_user, second
+
+    assert asyncio.run(main()) == (None, "Yo bro", "Yo bro")
+    assert model.cancelled == 1
+    assert service._inflight == {}
+
+
+def test_hanging_model_times_out_into_the_fallback(service, monkeypatch):
+    monkeypatch.setattr(llm_service, "LLM_TIMEOUT", 0.01)
+    model = Model()
+    service.cascade.make_model = lambda name, system_instruction: model
+
+    reply = asyncio.run(service.get_response("slow", "Ala"))
+
+    assert reply == CHAT_FALLBACK
+    assert model.calls >= llm_service.MAX_RETRIES
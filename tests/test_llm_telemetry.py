@@ -0,0 +1,101 @@
+import asyncio
+
+import pytest
+
+import llm_telemetry
+from llm_scheduler import SchedulerOverloaded
+from llm_telemetry import (
+    HEDGE_MIN_SAMPLES,
+    LLMCall,
+    calls_total,
+    cost_total,
+    hedge_delay,
+    measured,
+    observe_attempt,
+    outcome_of,
+    prompt_tokens,
+    response_tokens,
+)
+from model_cascade import CircuitOpen
+
+
+class _Usage:
+    def __init__(self, prompt, candidates):
+        self.prompt_token_count = prompt
+        self.candidates_token_count = candidates
+
+
+class _Response:
+    def __init__(self, prompt, candidates):
+        self.usage_metadata = _Usage(prompt, candidates)
+
+
+def test_calls_are_attributed_to_the_measured_method():
+    @measured
+    async def get_tip():
+        return LLMCall("test-model").method
+
+    @measured
+    async def stream_tip():
+        yield LLMCall("test-model").method
+
+    async def main():
+        return await get_tip(), [method async for method in stream_tip()]
+
+    assert asyncio.run(main()) == ("get_tip", ["stream_tip"])
+    assert LLMCall("test-model").method == "unknown"
+
+
+def test_successful_calls_record_tokens_and_cost(monkeypatch):
+    monkeypatch.setattr(llm_telemetry, "LLM_PRICE_INPUT", 1.0)
+    monkeypatch.setattr(llm_telemetry, "LLM_PRICE_OUTPUT", 2.0)
+    labels = {"method": "unknown", "model": "cost-model"}
+    call = LLMCall("cost-model")
+
+    # Streams report cumulative usage; the last chunk has the totals
+    call.add_usage(_Response(100, 10))
+    call.add_usage(_Response(100, 50))
+    call.finish("ok")
+
+    assert calls_total.value(outcome="ok", **labels) == 1
+    assert prompt_tokens.percentile(50, **labels) == 100
+    assert response_tokens.percentile(50, **labels) == 50
+    assert cost_total.value(model="cost-model") == pytest.approx(200 / 1_000_000)
+
+
+def test_failed_calls_record_no_tokens():
+    labels = {"method": "unknown", "model": "failing-model"}
+    call = LLMCall("failing-model")
+    call.add_usage(_Response(100, 0))
+
+    call.finish(outcome_of(TimeoutError()))
+
+    assert calls_total.value(outcome="timeout", **labels) == 1
+    assert prompt_tokens.count(**labels) == 0
+    assert cost_total.value(model="failing-model") == 0
+
+
+@pytest.mark.parametrize(
+    "error, outcome",
+    [
+        (SchedulerOverloaded("full"), "shed"),
+        (CircuitOpen("open"), "circuit_open"),
+        (asyncio.TimeoutError(), "timeout"),
+        (asyncio.CancelledError(), "cancelled"),
+        (ValueError("bad"), "error"),
+    ],
+)
+def test_outcome_of(error, outcome):
+    assert outcome_of(error) == outcome
+
+
+def test_hedge_delay_follows_the_observed_p95(monkeypatch):
+    monkeypatch.setattr(llm_telemetry, "LLM_HEDGE_DELAY", 4)
+    assert hedge_delay("hedge-model", stream=False) == 4
+
+    for _ in range(HEDGE_MIN_SAMPLES):
+        observe_attempt("hedge-model", 0.01, stream=False)
+
+    # Fast models are still given HEDGE_MIN_DELAY before hedging
+    assert hedge_delay("hedge-model", stream=False) == llm_telemetry.HEDGE_MIN_DELAY
+    assert hedge_delay("hedge-model", stream=True) == 4
@@ -0,0 +1,62 @@
+import asyncio
+
+from message_coalescer import MessageCoalescer
+
+
+async def send(coalescer, user_id, texts, interval):
+    """Submit texts from a user at a fixed interval, returning every result."""
+    handlers = []
+    for text in texts:
+        handlers.append(asyncio.create_task(coalescer.submit(user_id, text)))
+        await asyncio.sleep(interval)
+    return await asyncio.gather(*handlers)
+
+
+def test_message_after_a_quiet_period_is_answered_right_away():
+    coalescer = MessageCoalescer(window=10, max_wait=10)
+
+    async def main():
+        return await asyncio.wait_for(coalescer.submit(1, "hey"), 1)
+
+    assert asyncio.run(main()) == ["hey"]
+
+
+def test_rapid_messages_are_answered_as_one_turn():
+    coalescer = MessageCoalescer(window=0.1, max_wait=1)
+
+    results = asyncio.run(send(coalescer, 1, ["hey", "bro", "is it leg day?"], 0.01))
+
+    assert results == [["hey"], None, ["bro", "is it leg day?"]]
+    assert coalescer._batches == {}
+
+
+def test_users_are_coalesced_separately():
+    coalescer = MessageCoalescer(window=0.1, max_wait=1)
+
+    async def main():
+        return await asyncio.gather(
+            send(coalescer, 1, ["a1", "a2"], 0.01),
+            send(coalescer, 2, ["b1", "b2"], 0.01),
+        )
+
+    assert asyncio.run(main()) == [[["a1"], ["a2"]], [["b1"], ["b2"]]]
+
+
+def test_batch_is_flushed_at_max_wait_while_messages_keep_coming():
+    coalescer = MessageCoalescer(window=0.1, max_wait=0.2)
+    texts = [f"message {i}" for i in range(20)]
+
+    results = asyncio.run(send(coalescer, 1, texts, 0.02))
+
+    turns = [batch for batch in results if batch is not None]
+    # Without max_wait the 0.4s stream would be one batch after the first
+    assert len(turns) >= 3
+    assert [text for turn in turns for text in turn] == texts
+
+
+def test_disabled_coalescer_passes_messages_through():
+    coalescer = MessageCoalescer(window=0)
+
+    results = asyncio.run(send(coalescer, 1, ["hey", "bro"], 0))
+
+    assert results == [["hey"], ["bro"]]
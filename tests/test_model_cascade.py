@@ -0,0 +1,131 @@
+import asyncio
+
+import pytest
+
+import llm_service
+from llm_service import LLMService
+from model_cascade import CircuitBreaker, CircuitOpen, ModelCascade
+
+
+def elapse(breaker):
+    """Pretend the breaker's reset timeout has passed."""
+    breaker.opened_at -= breaker.reset_timeout
+
+
+def open_breaker(breaker):
+    for _ in range(breaker.failure_threshold):
+        breaker.record_failure()
+
+
+def test_breaker_opens_after_consecutive_failures():
+    breaker = CircuitBreaker("model", failure_threshold=3, reset_timeout=60)
+
+    breaker.record_failure()
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    breaker.record_failure()
+    assert breaker.state == "closed"
+
+    breaker.record_failure()
+    assert breaker.state == "open"
+    assert not breaker.available()
+
+
+def test_half_open_probe_success_closes_the_circuit():
+    breaker = CircuitBreaker("model", failure_threshold=2, reset_timeout=60)
+    open_breaker(breaker)
+    elapse(breaker)
+
+    assert breaker.state == "half_open"
+    breaker.begin()
+    # Only one probe at a time
+    assert not breaker.available()
+
+    breaker.record_success()
+    assert breaker.state == "closed"
+    assert breaker.available()
+
+
+def test_half_open_probe_failure_reopens_the_circuit():
+    breaker = CircuitBreaker("model", failure_threshold=2, reset_timeout=60)
+    open_breaker(breaker)
+    elapse(breaker)
+
+    breaker.begin()
+    breaker.record_failure()
+
+    assert breaker.state == "open"
+
+
+def test_abandoned_probe_lets_another_one_through():
+    breaker = CircuitBreaker("model", failure_threshold=2, reset_timeout=60)
+    open_breaker(breaker)
+    elapse(breaker)
+
+    breaker.begin()
+    breaker.abandon()
+
+    assert breaker.state == "half_open"
+    assert breaker.available()
+
+
+def test_cascade_skips_open_and_excluded_models():
+    cascade = ModelCascade(["a", "b", "c"], make_model=lambda name, instruction: name)
+    open_breaker(cascade.breakers["a"])
+
+    assert cascade.available() == ["b", "c"]
+    assert cascade.available(exclude=["b"]) == ["c"]
+    # Excluding every healthy model retries them rather than giving up
+    assert cascade.available(exclude=["b", "c"]) == ["b", "c"]
+
+    open_breaker(cascade.breakers["b"])
+    open_breaker(cascade.breakers["c"])
+    with pytest.raises(CircuitOpen):
+        cascade.available()
+
+
+def test_clients_are_shared_per_model_and_instruction():
+    made = []
+    cascade = ModelCascade(
+        ["a"], make_model=lambda name, instruction: made.append(instruction) or object()
+    )
+
+    assert cascade.model("a", "chat") is cascade.model("a", "chat")
+    assert cascade.model("a", "tips") is not cascade.model("a", "chat")
+    assert made == ["chat", "tips"]
+
+
+class _Response:
+    def __init__(self, text: str):
+        self.text = text
+        self.usage_metadata = None
+
+
+class Model:
+    def __init__(self, name, fail):
+        self.name = name
+        self.fail = fail
+        self.calls = 0
+
+    async def generate_content_async(self, contents, generation_config=None):
+        self.calls += 1
+        if self.fail:
+            raise RuntimeError(f"{self.name} is down")
+        return _Response(f"Yo bro from {self.name}")
+
+
+def test_service_falls_over_to_the_next_model(monkeypatch):
+    monkeypatch.setattr(llm_service, "RETRY_DELAY", 0)
+    service = LLMService()
+    primary, secondary = service.cascade.names[:2]
+    models = {primary: Model(primary, fail=True), secondary: Model(secondary, False)}
+    service.cascade.make_model = lambda name, system_instruction: models[name]
+
+    replies = [asyncio.run(service.get_response("hey", "Ala")) for _ in range(4)]
+
+    assert replies == [f"Yo bro from {secondary}"] * 4
+    threshold = service.cascade.breakers[primary].failure_threshold
+    # Once its circuit opened the primary is no longer tried
+    assert models[primary].calls == threshold
+    assert service.cascade.breakers[primary].state == "open"
@@ -0,0 +1,47 @@
+import asyncio
+
+from photo_cache import PhotoCache
+
+
+def test_lock_serializes_a_key_and_is_dropped_when_released():
+    cache = PhotoCache()
+    order = []
+
+    async def render(name):
+        async with cache.lock((1, "10min")):
+            order.append(f"{name} start")
+            await asyncio.sleep(0)
+            order.append(f"{name} end")
+
+    async def main():
+        await asyncio.gather(render("a"), render("b"))
+
+    asyncio.run(main())
+
+    assert order == ["a start", "a end", "b start", "b end"]
+    assert cache._locks == {} and cache._waiters == {}
+
+
+def test_lock_is_dropped_when_the_holder_fails():
+    cache = PhotoCache()
+
+    async def main():
+        try:
+            async with cache.lock(7):
+                raise RuntimeError("upload failed")
+        except RuntimeError:
+            pass
+
+    asyncio.run(main())
+
+    assert cache._locks == {} and cache._waiters == {}
+
+
+def test_file_ids_of_an_old_version_are_dropped():
+    cache = PhotoCache()
+    cache.put("v1", 1, "file-1")
+    cache.put("v2", 2, "file-2")
+
+    assert cache.get("v1", 1) is None
+    assert cache.get("v2", 1) is None
+    assert cache.get("v2", 2) == "file-2"
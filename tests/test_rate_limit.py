@@ -0,0 +1,52 @@
+import asyncio
+import time
+
+from rate_limit import KeyedRateLimiter, KeyedTokenBuckets, TokenBucket
+
+
+def test_keyed_rate_limiter_spaces_events_per_key():
+    limiter = KeyedRateLimiter(0.05)
+
+    async def main():
+        start = time.monotonic()
+        await limiter.acquire("a")
+        await limiter.acquire("b")  # other keys don't wait
+        assert time.monotonic() - start < 0.04
+        await limiter.acquire("a")
+        assert time.monotonic() - start >= 0.045
+
+    asyncio.run(main())
+
+
+def test_keyed_rate_limiter_drops_keys_that_no_longer_delay():
+    limiter = KeyedRateLimiter(0.01)
+
+    async def main():
+        for chat_id in range(100):
+            await limiter.acquire(chat_id)
+        await asyncio.sleep(0.02)
+        await limiter.acquire("new")
+
+    asyncio.run(main())
+
+    assert list(limiter._next) == ["new"]
+
+
+def test_keyed_token_buckets_are_separate_per_key():
+    buckets = KeyedTokenBuckets(rate=0.001, capacity=2)
+
+    assert buckets.try_acquire(1) and buckets.try_acquire(1)
+    assert not buckets.try_acquire(1)
+    assert buckets.delay(1) > 0
+    assert buckets.try_acquire(2)
+    assert buckets.delay(3) == 0
+
+
+def test_keyed_token_buckets_drop_full_buckets_past_max_keys():
+    buckets = KeyedTokenBuckets(rate=0.001, capacity=1, max_keys=2)
+    buckets.try_acquire("busy")
+    buckets._buckets["idle"] = TokenBucket(0.001, 1)
+
+    buckets.try_acquire("new")
+
+    assert set(buckets._buckets) == {"busy", "new"}
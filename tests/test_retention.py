@@ -0,0 +1,135 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+import retention
+from retention import (
+    CLUB_NAME,
+    purge_broadcast_deliveries,
+    purge_messages,
+    purge_raw_responses,
+    run_retention,
+)
+from storage import SQLiteStorage
+
+
+@pytest.fixture
+def storage():
+    return SQLiteStorage(":memory:")
+
+
+def response(count):
+    return {
+        "UsersInClubList": [
+            {
+                "ClubName": "Wellfitness Wrocław Ferio Gaj",
+                "UsersCountCurrentlyInClub": count,
+            }
+        ]
+    }
+
+
+def test_purge_raw_responses_backfills_missing_stats_first(storage):
+    start = datetime.now(timezone.utc) - timedelta(days=10)
+    for i in range(5):
+        at = start + timedelta(minutes=10 * i)
+        storage.insert_raw_response({"timestamp": at, "response": response(20 + i)})
+        if i % 2 == 0:  # the stats insert of odd samples failed
+            storage.insert_stats({"timestamp": at, CLUB_NAME: 20 + i})
+    storage.insert_raw_response(
+        {"timestamp": datetime.now(timezone.utc), "response": response(99)}
+    )
+
+    assert purge_raw_responses(storage, days=7) == 5
+
+    counts = [row[CLUB_NAME] for row in storage.get_stats_between(start)]
+    assert counts == [20, 21, 22, 23, 24]
+    remaining = storage._query("SELECT timestamp FROM raw_responses")
+    assert len(remaining) == 1
+
+
+def test_raw_responses_are_kept_when_the_rollup_fails(storage, monkeypatch):
+    old = datetime.now(timezone.utc) - timedelta(days=10)
+    storage.insert_raw_response({"timestamp": old, "response": response(20)})
+
+    def fail(rows):
+        raise RuntimeError("insert failed")
+
+    monkeypatch.setattr(storage, "insert_stats", fail)
+
+    assert run_retention(storage, ["raw_responses"]) == {"raw_responses": -1}
+    assert len(storage._query("SELECT id FROM raw_responses")) == 1
+
+
+def test_purge_raw_responses_without_rollup_only_deletes(storage):
+    old = datetime.now(timezone.utc) - timedelta(days=10)
+    storage.insert_raw_response({"timestamp": old, "response": response(20)})
+
+    assert purge_raw_responses(storage, days=7, rollup=False) == 1
+    assert storage.get_stats_between(old) == []
+
+
+def test_purge_deletes_in_bounded_batches(storage, monkeypatch):
+    old = datetime.now(timezone.utc) - timedelta(days=10)
+    storage._insert(
+        "messages",
+        [
+            {"user_id": 1, "role": "user", "content": str(i), "created_at": old}
+            for i in range(7)
+        ],
+    )
+    deletes = []
+    delete_rows = storage.delete_rows
+    monkeypatch.setattr(
+        storage,
+        "delete_rows",
+        lambda table, ids: deletes.append(len(ids)) or delete_rows(table, ids),
+    )
+
+    assert (
+        retention.purge_expired(
+            storage, "messages", "created_at", datetime.now(timezone.utc), batch_size=3
+        )
+        == 7
+    )
+    assert deletes == [3, 3, 1]
+    assert purge_messages(storage) == 0
+
+
+def test_run_retention_reports_failed_tables(storage, monkeypatch):
+    def fail(storage):
+        raise RuntimeError("database is down")
+
+    monkeypatch.setitem(retention.RETENTION_TASKS, "messages", fail)
+
+    assert run_retention(storage, ["messages", "job_runs"]) == {
+        "messages": -1,
+        "job_runs": 0,
+    }
+
+
+def deliver(storage, run_id, user_id, delivered_at):
+    storage._insert(
+        "broadcast_deliveries",
+        {"run_id": run_id, "user_id": user_id, "delivered_at": delivered_at},
+    )
+
+
+def test_purge_broadcast_deliveries_keeps_recent_runs(storage):
+    now = datetime.now(timezone.utc)
+    for user_id in range(3):
+        deliver(storage, "daily_tip:old", user_id, now - timedelta(days=20))
+    deliver(storage, "daily_tip:new", 1, now - timedelta(days=1))
+
+    assert purge_broadcast_deliveries(storage, days=14) == 3
+    assert storage.get_delivered_users("daily_tip:old") == set()
+    assert storage.get_delivered_users("daily_tip:new") == {1}
+
+
+def test_run_retention_includes_broadcast_deliveries(storage):
+    storage.mark_delivered("daily_tip:today", 1)
+
+    report = run_retention(storage, ["broadcast_deliveries"])
+
+    assert report == {"broadcast_deliveries": 0}
+    assert storage.get_delivered_users("daily_tip:today") == {1}
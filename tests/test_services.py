@@ -0,0 +1,63 @@
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import services
+from services import LazyService, log_startup_times, mark_startup, timed_import
+
+
+class Service:
+    def __init__(self):
+        self.name = "stats"
+
+    def ping(self):
+        return "pong"
+
+
+def test_service_is_created_on_first_use():
+    created = []
+    service = LazyService("stats", lambda: created.append(1) or Service())
+
+    assert not service.initialized
+    assert created == []
+
+    assert service.ping() == "pong"
+    assert service.name == "stats"
+    assert service.initialized
+    assert created == [1]
+    assert "service stats" in services.lazy_times
+
+
+def test_concurrent_first_use_creates_one_instance():
+    created = []
+
+    def factory():
+        created.append(1)
+        time.sleep(0.05)
+        return Service()
+
+    service = LazyService("slow", factory)
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        instances = list(pool.map(lambda _: service.get(), range(8)))
+
+    assert created == [1]
+    assert all(instance is instances[0] for instance in instances)
+
+
+def test_startup_phases_are_logged_in_order(monkeypatch, caplog):
+    monkeypatch.setattr(services, "startup_times", {})
+    monkeypatch.setattr(services, "lazy_times", {})
+
+    mark_startup("config")
+    timed_import("json")
+    mark_startup("handlers")
+    LazyService("db", Service).get()
+
+    with caplog.at_level(logging.INFO, logger="services"):
+        log_startup_times()
+
+    assert list(services.startup_times) == ["config", "handlers"]
+    text = caplog.text
+    assert text.index("config:") < text.index("handlers:")
+    assert "Initialized on first use" in text
+    assert "service db:" in text
@@ -0,0 +1,149 @@
+import io
+import socket
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+import status_snapshot
+from status_snapshot import (
+    SnapshotPublisher,
+    build_snapshot,
+    decode_snapshot,
+    encode_snapshot,
+)
+
+
+class FakeStorage:
+    def __init__(self, rows):
+        self.rows = rows
+
+    def get_stats_between(self, start):
+        return self.rows
+
+
+class FakeStats:
+    """GymStats stand-in whose 3 day plot fails to render."""
+
+    club_name = "Gym"
+
+    def __init__(self, rows):
+        self.storage = FakeStorage(rows)
+
+    def create_time_series_plot(self, hours, interval):
+        if hours == 72:
+            raise ValueError("no data")
+        return io.BytesIO(f"{hours}h".encode())
+
+
+def snapshot(timestamp, plot=b""):
+    return {
+        "timestamp": timestamp,
+        "published_at": time.time(),
+        "current": 42,
+        "max_1d": 50,
+        "max_7d": 60,
+        "max_14d": 70,
+        "trend": 3,
+        "plots": {1: plot},
+    }
+
+
+def read_frame(conn):
+    def read(size):
+        data = b""
+        while len(data) < size:
+            chunk = conn.recv(size - len(data))
+            assert chunk, "publisher closed the connection"
+            data += chunk
+        return data
+
+    (length,) = status_snapshot._HEADER.unpack(read(status_snapshot._HEADER.size))
+    return decode_snapshot(read(length))
+
+
+def test_snapshot_frames_round_trip():
+    data = encode_snapshot(snapshot("2025-01-25 12:00:00", b"\x89PNG"))
+
+    decoded = decode_snapshot(data[status_snapshot._HEADER.size :])
+    assert decoded["plots"] == {1: b"\x89PNG"}
+    assert decoded["current"] == 42
+
+
+def test_build_snapshot_precomputes_the_status():
+    now = datetime.now(timezone.utc).replace(tzinfo=None, microsecond=0)
+    counts = {
+        timedelta(days=10): 80,
+        timedelta(days=3): 60,
+        timedelta(hours=12): 50,
+        timedelta(minutes=90): 30,
+        timedelta(minutes=45): 35,
+        timedelta(0): 42,
+    }
+    rows = [
+        {"timestamp": (now - age).isoformat() + "+00:00", "Gym": count}
+        for age, count in counts.items()
+    ]
+    rows.append({"timestamp": now.isoformat(), "Gym": None})
+
+    snapshot = build_snapshot(FakeStats(rows[::-1]))
+
+    assert snapshot["timestamp"] == rows[-2]["timestamp"]
+    assert (snapshot["current"], snapshot["trend"]) == (42, 12)
+    assert (snapshot["max_1d"], snapshot["max_7d"], snapshot["max_14d"]) == (
+        50,
+        60,
+        80,
+    )
+    assert snapshot["plots"] == {1: b"24h", 2: b"48h", 4: b"96h"}
+
+
+def test_build_snapshot_without_data():
+    assert build_snapshot(FakeStats([{"timestamp": "2025-01-25", "Gym": None}])) is None
+
+
+def test_new_subscribers_get_the_latest_snapshot(tmp_path):
+    publisher = SnapshotPublisher(str(tmp_path / "status.sock"))
+    publisher.start()
+    publisher.publish(snapshot("first"))
+
+    conn = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    conn.connect(publisher.path)
+    conn.settimeout(5)
+    assert read_frame(conn)["timestamp"] == "first"
+
+    while not publisher._clients:
+        time.sleep(0.01)
+    publisher.publish(snapshot("second"))
+    assert read_frame(conn)["timestamp"] == "second"
+    conn.close()
+
+
+def test_stuck_subscribers_are_dropped_without_delaying_the_others(monkeypatch):
+    monkeypatch.setattr(status_snapshot, "SEND_TIMEOUT", 0.3)
+    publisher = SnapshotPublisher()
+    peers = []
+    for _ in range(5):
+        ours, theirs = socket.socketpair()
+        ours.settimeout(status_snapshot.SEND_TIMEOUT)
+        publisher._clients.append(ours)
+        peers.append(theirs)
+
+    # Three subscribers never read, the other two do
+    received = []
+    readers = [
+        threading.Thread(target=lambda peer=peer: received.append(read_frame(peer)))
+        for peer in peers[3:]
+    ]
+    for reader in readers:
+        reader.start()
+
+    start = time.monotonic()
+    publisher.publish(snapshot("big", b"x" * 4_000_000))
+    elapsed = time.monotonic() - start
+    for reader in readers:
+        reader.join(5)
+
+    assert [s["timestamp"] for s in received] == ["big", "big"]
+    assert len(publisher._clients) == 2
+    # Sent in parallel: one timeout, not one per stuck subscriber
+    assert elapsed < 2 * status_snapshot.SEND_TIMEOUT
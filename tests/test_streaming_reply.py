@@ -0,0 +1,98 @@
+import asyncio
+
+from telegram.constants import MessageLimit
+from telegram.error import RetryAfter
+
+from llm_service import ResponseSuperseded
+from streaming_reply import StreamingReply
+
+
+class FakeReply:
+    def __init__(self, chat, text):
+        self.chat = chat
+        self.text = text
+        self.edits = []
+        self.deleted = False
+
+    async def edit_text(self, text):
+        errors = self.chat.edit_errors
+        if errors:
+            raise errors.pop(0)
+        self.edits.append(text)
+        self.text = text
+
+    async def delete(self):
+        self.deleted = True
+
+
+class FakeMessage:
+    """The user's message; replies to it are recorded."""
+
+    def __init__(self):
+        self.replies = []
+        self.edit_errors = []
+
+    async def reply_text(self, text):
+        reply = FakeReply(self, text)
+        self.replies.append(reply)
+        return reply
+
+
+async def chunks(*texts, error=None):
+    for text in texts:
+        await asyncio.sleep(0)
+        yield text
+    if error:
+        raise error
+
+
+def render(message, stream, interval):
+    return asyncio.run(StreamingReply(message, interval=interval).render(stream))
+
+
+def test_chunks_are_coalesced_into_few_edits():
+    message = FakeMessage()
+
+    text = render(message, chunks("Yo ", "bro, ", "leg ", "day!"), interval=0.05)
+
+    (reply,) = message.replies
+    assert text == "Yo bro, leg day!"
+    # The first edit is immediate, the rest waits for the final one
+    assert reply.edits == ["Yo ", "Yo bro, leg day!"]
+
+
+def test_every_chunk_is_shown_without_an_interval():
+    message = FakeMessage()
+
+    render(message, chunks("Yo ", "bro"), interval=0)
+
+    assert message.replies[0].edits == ["Yo ", "Yo bro"]
+
+
+def test_final_edit_waits_out_flood_control():
+    message = FakeMessage()
+    message.edit_errors = [RetryAfter(0), RetryAfter(0)]
+
+    text = render(message, chunks("Yo bro"), interval=0)
+
+    (reply,) = message.replies
+    assert text == reply.text == "Yo bro"
+
+
+def test_superseded_stream_deletes_the_placeholder():
+    message = FakeMessage()
+
+    text = render(message, chunks("Yo", error=ResponseSuperseded()), interval=0)
+
+    (reply,) = message.replies
+    assert text is None
+    assert reply.deleted
+
+
+def test_long_replies_overflow_into_new_messages():
+    message = FakeMessage()
+    limit = MessageLimit.MAX_TEXT_LENGTH
+
+    render(message, chunks("a" * limit, "b" * 10), interval=0.05)
+
+    assert [reply.text for reply in message.replies] == ["a" * limit, "b" * 10]
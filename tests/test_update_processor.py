@@ -0,0 +1,105 @@
+import asyncio
+from datetime import datetime, timezone
+
+from telegram import Chat, Message, Update, User
+
+from update_processor import PerUserUpdateProcessor
+
+
+def update_from(user_id, update_id=0):
+    user = User(user_id, f"user {user_id}", is_bot=False)
+    message = Message(
+        update_id,
+        datetime.now(timezone.utc),
+        Chat(user_id, Chat.PRIVATE),
+        from_user=user,
+        text="hey",
+    )
+    return Update(update_id, message=message)
+
+
+class Handlers:
+    """Records when each update starts and finishes."""
+
+    def __init__(self):
+        self.events = []
+        self.running = 0
+        self.max_running = 0
+
+    async def handle(self, name, delay=0.01, fail=False):
+        self.running += 1
+        self.max_running = max(self.max_running, self.running)
+        self.events.append(("start", name))
+        try:
+            await asyncio.sleep(delay)
+            if fail:
+                raise RuntimeError(f"{name} failed")
+        finally:
+            self.running -= 1
+            self.events.append(("end", name))
+
+
+def test_updates_from_a_user_run_one_at_a_time_in_order():
+    processor = PerUserUpdateProcessor(max_concurrent_updates=8)
+    handlers = Handlers()
+
+    async def main():
+        await asyncio.gather(
+            *(
+                processor.process_update(update_from(1, i), handlers.handle(f"a{i}"))
+                for i in range(3)
+            )
+        )
+
+    asyncio.run(main())
+
+    assert handlers.events == [
+        ("start", "a0"),
+        ("end", "a0"),
+        ("start", "a1"),
+        ("end", "a1"),
+        ("start", "a2"),
+        ("end", "a2"),
+    ]
+    assert processor._pending == {}
+
+
+def test_a_busy_user_holds_only_one_slot():
+    processor = PerUserUpdateProcessor(max_concurrent_updates=2)
+    handlers = Handlers()
+
+    async def main():
+        updates = [
+            processor.process_update(update_from(1, i), handlers.handle(f"a{i}"))
+            for i in range(5)
+        ]
+        updates.append(
+            processor.process_update(update_from(2, 9), handlers.handle("b"))
+        )
+        await asyncio.gather(*updates)
+
+    asyncio.run(main())
+
+    # User 2's update didn't wait for all of user 1's
+    assert handlers.events.index(("start", "b")) < handlers.events.index(
+        ("start", "a1")
+    )
+    assert handlers.max_running == 2
+
+
+def test_a_failing_update_does_not_stop_the_users_queue():
+    processor = PerUserUpdateProcessor(max_concurrent_updates=4)
+    handlers = Handlers()
+
+    async def main():
+        await asyncio.gather(
+            processor.process_update(
+                update_from(1, 0), handlers.handle("a0", fail=True)
+            ),
+            processor.process_update(update_from(1, 1), handlers.handle("a1")),
+        )
+
+    asyncio.run(main())
+
+    assert ("end", "a1") in handlers.events
+    assert processor._pending == {}
@@ -0,0 +1,108 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+import user_registry
+from storage import SQLiteStorage
+from user_registry import UserRegistry
+
+
+@pytest.fixture
+def storage():
+    return SQLiteStorage(":memory:")
+
+
+@pytest.fixture
+def replicas(storage, monkeypatch):
+    # Every touch writes last_active, as a long-running replica eventually does
+    monkeypatch.setattr(user_registry, "LAST_ACTIVE_RESOLUTION", 0)
+    a, b = UserRegistry(storage), UserRegistry(storage)
+    a.touch(1, "Ala")
+    b.get(1)  # both replicas loaded the user
+    return a, b
+
+
+def test_touch_keeps_a_ban_set_on_another_replica(storage, replicas):
+    a, b = replicas
+    a.set_ban(1, "Ala", datetime.now(timezone.utc) + timedelta(days=7))
+    b.touch(1, "Ala")
+
+    assert storage.get_user(1)["banned_until"] is not None
+    assert UserRegistry(storage).is_banned(1)
+
+
+def test_touch_keeps_an_opt_out_set_on_another_replica(storage, replicas):
+    a, b = replicas
+    a.set_opt_in(1, "Ala", daily_motivation=False, daily_tips=False)
+    b.touch(1, "Ala K.")
+
+    row = storage.get_user(1)
+    assert (row["user_name"], row["daily_motivation"], row["daily_tips"]) == (
+        "Ala K.",
+        0,
+        0,
+    )
+    assert UserRegistry(storage).recipients("daily_tips") == []
+
+
+def test_first_contact_on_another_replica_keeps_the_stored_user(storage, replicas):
+    a, b = replicas
+    a.touch(2, "Bob")
+    a.set_ban(2, "Bob", datetime.now(timezone.utc) + timedelta(days=7))
+    b.touch(2, "Bob")
+
+    assert b.is_banned(2)
+    assert UserRegistry(storage).is_banned(2)
+
+
+def test_recipients_include_users_registered_on_another_replica(replicas):
+    a, b = replicas
+    b.touch(2, "Bob")
+    a.set_opt_in(1, "Ala", daily_tips=False)
+
+    assert a.recipients("daily_tips") == [(2, "Bob")]
+    assert b.recipients("daily_tips") == [(2, "Bob")]
+    assert sorted(b.recipients("daily_motivation")) == [(1, "Ala"), (2, "Bob")]
+
+
+def test_bans_from_another_replica_show_up_after_a_refresh(replicas):
+    a, b = replicas
+    a.set_ban(1, "Ala", datetime.now(timezone.utc) + timedelta(days=7))
+    record = b.get(1)
+    assert not b.is_banned(1)
+
+    b.refresh()
+    assert b.is_banned(1)
+    assert b.get(1) is record  # updated in place
+
+
+def test_ban_checks_never_read_storage(storage, replicas, monkeypatch):
+    a, b = replicas
+    monkeypatch.setattr(storage, "get_users", None)
+    monkeypatch.setattr(storage, "get_user", None)
+
+    assert not b.is_banned(1)
+    assert not b.is_banned(3)
+
+
+def test_refresh_reads_only_users_updated_since_the_last_read(
+    storage, replicas, monkeypatch
+):
+    a, b = replicas
+    monkeypatch.setattr(user_registry, "USERS_REFRESH_OVERLAP", 0)
+    a.touch(2, "Bob")
+    b.refresh()
+
+    reads = []
+    get_users = storage.get_users
+    monkeypatch.setattr(
+        storage,
+        "get_users",
+        lambda **kwargs: reads.append(get_users(**kwargs)) or reads[-1],
+    )
+    a.set_opt_in(2, "Bob", daily_tips=False)
+    b.refresh()
+    b.refresh()
+
+    assert [[row["user_id"] for row in rows] for rows in reads] == [[2], []]
+    assert b.recipients("daily_tips") == [(1, "Ala")]